@@ -19,5 +19,12 @@ SQL_SERVER_CONFIG = {
     "server": r"your_server_name_or_ip",
     "database": "your_source_database",
     "username": "your_sql_server_user",
-    "password": r"your_sql_server_password"
+    "password": r"your_sql_server_password",
+    # Optional: harvest several databases on this server instead of just "database".
+    # Use a list of names, or "*" to discover every online user database.
+    # "databases": ["SalesDB", "FinanceDB"],
+    # Optional: how many databases to harvest concurrently
+    "max_workers": 4,
+    # Optional: rows per round trip when streaming procedure definitions
+    "fetch_batch_size": 500
 }
\ No newline at end of file
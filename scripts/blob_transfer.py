@@ -0,0 +1,157 @@
+import os
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from azure.core.exceptions import ResourceNotFoundError
+from azure.storage.blob import ContentSettings
+from scripts.log import log_info, log_error
+
+# Parallel blob requests; small files are dominated by per-request latency, not bandwidth
+TRANSFER_MAX_WORKERS = 16
+# Bytes read/written per chunk when streaming files to and from Azure
+TRANSFER_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def file_md5(path, chunk_size=TRANSFER_CHUNK_SIZE):
+    """Returns the MD5 digest (raw bytes, as Azure stores content_md5) of a local file, or None if it is missing."""
+    digest = hashlib.md5()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+    except FileNotFoundError:
+        return None
+    return digest.digest()
+
+
+class TransferStats:
+    def __init__(self):
+        """Counts of one batch of transfers, and its throughput."""
+        self.transferred = 0
+        self.skipped = 0
+        self.missing = 0
+        self.failed = []
+        self.bytes = 0
+        self.seconds = 0.0
+
+    @property
+    def mb_per_second(self):
+        return (self.bytes / 1_048_576) / self.seconds if self.seconds else 0.0
+
+    def summary(self):
+        return (f"{self.transferred} transferred, {self.skipped} unchanged, {self.missing} missing, "
+                f"{len(self.failed)} failed · {self.bytes / 1_048_576:.1f} MB in {self.seconds:.1f}s "
+                f"({self.mb_per_second:.1f} MB/s, {self.transferred / self.seconds if self.seconds else 0:.0f} files/s)")
+
+
+class BlobTransferEngine:
+    def __init__(self, container_client, max_workers=TRANSFER_MAX_WORKERS, chunk_size=TRANSFER_CHUNK_SIZE):
+        """
+        Moves many files between the local disk and one Azure container:
+        - up to `max_workers` requests in flight at once;
+        - blobs are streamed to disk chunk by chunk, never held whole in memory;
+        - files whose local MD5 equals the blob's content_md5 are skipped.
+
+        :param container_client: azure.storage.blob ContainerClient.
+        """
+        self.container_client = container_client
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+
+    def remote_md5s(self, prefix):
+        """Returns {blob name: content_md5} for every blob under `prefix`, from one listing."""
+        return {
+            blob.name: (bytes(blob.content_settings.content_md5) if blob.content_settings.content_md5 else None)
+            for blob in self.container_client.list_blobs(name_starts_with=prefix)
+        }
+
+    def download(self, blob_name, local_path, remote_md5=None):
+        """
+        Streams one blob to `local_path` (via a temp file, replaced atomically).
+
+        Returns:
+            int | bool | None: bytes written, False if skipped as unchanged, None if the blob does not exist.
+        """
+        if remote_md5 is not None and file_md5(local_path, self.chunk_size) == remote_md5:
+            return False
+        try:
+            downloader = self.container_client.get_blob_client(blob_name).download_blob()
+        except ResourceNotFoundError:
+            return None
+        tmp_path = f"{local_path}.part"
+        written = 0
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in downloader.chunks():
+                    f.write(chunk)
+                    written += len(chunk)
+            os.replace(tmp_path, local_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return written
+
+    def upload(self, local_path, blob_name, remote_md5=None):
+        """
+        Uploads one file unless the blob already has the same content_md5.
+
+        Returns:
+            int | bool: bytes sent, False if skipped as unchanged.
+        """
+        local_md5 = file_md5(local_path, self.chunk_size)
+        if remote_md5 is not None and local_md5 == remote_md5:
+            return False
+        with open(local_path, "rb") as data:
+            self.container_client.get_blob_client(blob_name).upload_blob(
+                data, overwrite=True, max_concurrency=1,
+                content_settings=ContentSettings(content_md5=bytearray(local_md5))
+            )
+        return os.path.getsize(local_path)
+
+    def _run(self, fn, jobs, label):
+        """Runs fn(*job) for every job concurrently and tallies the results."""
+        stats = TransferStats()
+        results = {}
+        started = time.monotonic()
+
+        def run_one(job):
+            try:
+                return job, fn(*job), None
+            except Exception as e:
+                return job, None, e
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for job, result, error in executor.map(run_one, jobs):
+                if error is not None:
+                    stats.failed.append((job, error))
+                    log_error(f"{label} failed for {job[0]}: {error}")
+                elif result is None:
+                    stats.missing += 1
+                elif result is False:
+                    stats.skipped += 1
+                else:
+                    stats.transferred += 1
+                    stats.bytes += result
+                results[job] = result
+        stats.seconds = time.monotonic() - started
+        log_info(f"{label}: {stats.summary()}")
+        return stats, results
+
+    def download_many(self, jobs):
+        """
+        Downloads (blob_name, local_path[, remote_md5]) jobs concurrently.
+
+        Returns:
+            tuple: (TransferStats, {job: bytes | False | None}) – None marks a missing blob.
+        """
+        return self._run(self.download, [tuple(job) for job in jobs], "Azure download")
+
+    def upload_many(self, jobs):
+        """
+        Uploads (local_path, blob_name[, remote_md5]) jobs concurrently.
+
+        Returns:
+            tuple: (TransferStats, {job: bytes | False}).
+        """
+        return self._run(self.upload, [tuple(job) for job in jobs], "Azure upload")
@@ -0,0 +1,246 @@
+import os
+import json
+import shutil
+import hashlib
+import tarfile
+import zipfile
+import requests
+
+# Persistent SnowConvert CLI installs (point it at a mounted volume, e.g. /home on App Service, to survive restarts)
+CLI_INSTALL_DIR = os.environ.get("SNOWCONVERT_INSTALL_DIR", "./.snowconvert_cli")
+# Remembers the installed binary, so warm starts skip the network
+CLI_STATE_FILE = "installed.json"
+# Optional expected SHA-256 of the downloaded archive
+CLI_EXPECTED_SHA256 = os.environ.get("SNOWCONVERT_CLI_SHA256", "").strip().lower()
+# Download attempts (each resumes where the previous one stopped)
+DOWNLOAD_ATTEMPTS = 3
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+_ARTIFACTS = "https://sctoolsartifacts.z5.web.core.windows.net"
+# (os, arch) -> archive URL
+CLI_PACKAGES = {
+    ("linux", "x64"): f"{_ARTIFACTS}/linux/prod/cli/SnowConvert-CLI-linux.tar",
+    ("linux", "arm64"): f"{_ARTIFACTS}/linux/prod/cli/SnowConvert-CLI-arm64-linux.tar",
+    ("darwin", "x64"): f"{_ARTIFACTS}/darwin_x64/prod/cli/SnowConvert-CLI-mac.tar",
+    ("darwin", "arm64"): f"{_ARTIFACTS}/darwin_arm64/prod/cli/SnowConvert-CLI-arm64-mac.tar",
+    ("windows", "x64"): f"{_ARTIFACTS}/windows/prod/cli/SnowConvert-CLI-windows.zip",
+    ("windows", "arm64"): f"{_ARTIFACTS}/windows/prod/cli/SnowConvert-CLI-arm64-windows.zip",
+}
+
+
+def normalize_arch(machine):
+    machine = machine.lower()
+    if machine in ("x86_64", "amd64"):
+        return "x64"
+    if machine in ("arm64", "aarch64"):
+        return "arm64"
+    return None
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _inside(root, name):
+    """True if archive member `name` extracts to a path inside `root`."""
+    root = os.path.realpath(root)
+    target = os.path.realpath(os.path.join(root, name))
+    return os.path.commonpath([root, target]) == root
+
+
+def extract_archive(archive, dest):
+    """
+    Extracts a .zip or tar archive into `dest`, refusing members that would
+    land outside it (absolute paths, "..", links pointing out).
+
+    Raises:
+        Exception: if the archive holds such a member; nothing is extracted then.
+    """
+    if archive.endswith(".zip"):
+        with zipfile.ZipFile(archive, "r") as z:
+            unsafe = [name for name in z.namelist() if not _inside(dest, name)]
+            if unsafe:
+                raise Exception(f"Refusing to extract {os.path.basename(archive)}: {unsafe[0]} points outside the target directory.")
+            z.extractall(dest)
+        return
+    with tarfile.open(archive, "r:*") as tar:
+        if hasattr(tarfile, "data_filter"):
+            tar.extractall(path=dest, filter="data")
+            return
+        # Python without extraction filters: check member paths and link targets ourselves
+        for member in tar.getmembers():
+            link_ok = not (member.issym() or member.islnk()) or _inside(
+                dest, os.path.join(os.path.dirname(member.name), member.linkname) if member.issym() else member.linkname)
+            if not _inside(dest, member.name) or not link_ok or member.isdev():
+                raise Exception(f"Refusing to extract {os.path.basename(archive)}: {member.name} is unsafe.")
+        tar.extractall(path=dest)
+
+
+class CliInstallCache:
+    def __init__(self, root=CLI_INSTALL_DIR, log=print):
+        """
+        Versioned install cache of the SnowConvert CLI:
+        - archives are streamed to disk and resumed (HTTP Range) after an
+          interrupted download, then checked against the server's length and,
+          if SNOWCONVERT_CLI_SHA256 is set, that checksum;
+        - each archive is extracted into its own `<os>-<arch>-<sha256>` directory;
+        - the resulting binary path and checksum are remembered in
+          installed.json, so a restarted app finds snowct without any request;
+          its size and mtime are recorded too, so a warm start only re-hashes
+          the binary when they changed.
+
+        :param root: Directory holding downloads, installs and installed.json.
+        :param log: Function taking a message (e.g. the runner's _log).
+        """
+        self.root = os.path.abspath(root)
+        self.log = log
+        os.makedirs(os.path.join(self.root, "downloads"), exist_ok=True)
+
+    @property
+    def _state_path(self):
+        return os.path.join(self.root, CLI_STATE_FILE)
+
+    def _load_state(self):
+        try:
+            with open(self._state_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_state(self, state):
+        tmp_path = f"{self._state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_path, self._state_path)
+
+    def installed_binary(self, os_name, arch):
+        """
+        Returns the remembered snowct binary for this platform if it is still on
+        disk and unchanged, else None. The binary is only re-hashed (and
+        compared to its SHA-256 from install time) when its size or mtime
+        differ from the recorded ones.
+        """
+        state = self._load_state()
+        entry = state.get(f"{os_name}-{arch}")
+        if not entry or not os.path.isfile(entry.get("binary", "")):
+            return None
+        stat = os.stat(entry["binary"])
+        if stat.st_size == entry.get("binary_size") and stat.st_mtime_ns == entry.get("binary_mtime_ns"):
+            return entry["binary"]
+        if sha256_file(entry["binary"]) != entry.get("binary_sha256"):
+            self.log(f"Cached SnowConvert CLI at {entry['binary']} does not match its recorded checksum; reinstalling.", "WARN")
+            return None
+        # Same bytes, new metadata (e.g. touched or copied): remember it so the next start skips the hash
+        entry.update(binary_size=stat.st_size, binary_mtime_ns=stat.st_mtime_ns)
+        self._save_state(state)
+        return entry["binary"]
+
+    def _download(self, url, dest):
+        """
+        Streams `url` to `dest`, resuming a partial `<dest>.part` left by an
+        earlier attempt when the server still serves the same file (same ETag).
+        """
+        part_path, meta_path = f"{dest}.part", f"{dest}.part.json"
+        last_error = None
+        for attempt in range(1, DOWNLOAD_ATTEMPTS + 1):
+            try:
+                meta = {}
+                if os.path.exists(part_path) and os.path.exists(meta_path):
+                    with open(meta_path, "r", encoding="utf-8") as f:
+                        meta = json.load(f)
+                offset = os.path.getsize(part_path) if meta else 0
+                headers = {}
+                if offset and meta.get("etag"):
+                    headers = {"Range": f"bytes={offset}-", "If-Range": meta["etag"]}
+
+                with requests.get(url, stream=True, timeout=120, headers=headers) as r:
+                    r.raise_for_status()
+                    resumed = r.status_code == 206
+                    if resumed:
+                        total = int(r.headers["Content-Range"].rsplit("/", 1)[1])
+                        self.log(f"Resuming download at {offset / 1_048_576:.1f} MB of {total / 1_048_576:.1f} MB...")
+                    else:
+                        offset = 0
+                        total = int(r.headers.get("Content-Length") or 0)
+                        with open(meta_path, "w", encoding="utf-8") as f:
+                            json.dump({"url": url, "etag": r.headers.get("ETag"), "total": total}, f)
+                    with open(part_path, "ab" if resumed else "wb") as f:
+                        for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                            f.write(chunk)
+
+                size = os.path.getsize(part_path)
+                if total and size != total:
+                    raise IOError(f"incomplete download ({size} of {total} bytes)")
+                os.replace(part_path, dest)
+                os.remove(meta_path)
+                return
+            except Exception as e:
+                last_error = e
+                self.log(f"Download attempt {attempt}/{DOWNLOAD_ATTEMPTS} failed: {e}", "WARN")
+        raise Exception(f"Could not download {url}: {last_error}")
+
+    def install(self, os_name, arch):
+        """
+        Downloads, verifies and extracts the CLI for this platform (unless the
+        same archive is already installed) and remembers its binary.
+
+        Returns:
+            str: absolute path of the snowct binary.
+        """
+        url = CLI_PACKAGES.get((os_name, arch))
+        if not url:
+            raise Exception(f"No SnowConvert CLI package for {os_name} ({arch}).")
+        archive = os.path.join(self.root, "downloads", os.path.basename(url))
+
+        self.log(f"Downloading SnowConvert for {os_name} ({arch})...")
+        self._download(url, archive)
+        checksum = sha256_file(archive)
+        if CLI_EXPECTED_SHA256 and checksum != CLI_EXPECTED_SHA256:
+            os.remove(archive)
+            raise Exception(f"Checksum mismatch for {os.path.basename(url)}: expected {CLI_EXPECTED_SHA256}, got {checksum}.")
+        self.log(f"Download complete (sha256 {checksum[:12]}…). Extracting...")
+
+        install_dir = os.path.join(self.root, f"{os_name}-{arch}-{checksum[:16]}")
+        if not os.path.isdir(install_dir):
+            # Extract next to the final directory and rename, so a crash never leaves a half install behind
+            staging_dir = f"{install_dir}.tmp"
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            try:
+                extract_archive(archive, staging_dir)
+            except Exception:
+                shutil.rmtree(staging_dir, ignore_errors=True)
+                os.remove(archive)
+                raise
+            os.replace(staging_dir, install_dir)
+        os.remove(archive)
+
+        binary = self._find_binary(install_dir, os_name)
+        if os_name != "windows":
+            os.chmod(binary, 0o755)
+        binary_stat = os.stat(binary)
+        state = self._load_state()
+        previous = state.get(f"{os_name}-{arch}", {}).get("install_dir")
+        state[f"{os_name}-{arch}"] = {
+            "url": url, "archive_sha256": checksum, "install_dir": install_dir,
+            "binary": binary, "binary_sha256": sha256_file(binary),
+            "binary_size": binary_stat.st_size, "binary_mtime_ns": binary_stat.st_mtime_ns,
+        }
+        self._save_state(state)
+        if previous and previous != install_dir:
+            shutil.rmtree(previous, ignore_errors=True)
+        return binary
+
+    @staticmethod
+    def _find_binary(install_dir, os_name):
+        name = "snowct.exe" if os_name == "windows" else "snowct"
+        expected = os.path.join(install_dir, "orchestrator", name)
+        if os.path.isfile(expected):
+            return expected
+        for dirpath, _, filenames in os.walk(install_dir):
+            if name in filenames:
+                return os.path.join(dirpath, name)
+        raise Exception(f"'{name}' was not found in the extracted SnowConvert package ({install_dir}).")
@@ -0,0 +1,285 @@
+import os
+import abc
+import shutil
+import hashlib
+import tempfile
+import subprocess
+from scripts.log import log_info
+
+# Local, content-addressed store of converted files
+CONVERSION_CACHE_DIR = "./.conversion_cache"
+# Size cap of the local cache in MB (least recently used entries are evicted); unset = unbounded
+CONVERSION_CACHE_MAX_MB = os.environ.get("CONVERSION_CACHE_MAX_MB")
+# Shared (second-tier) cache: "azure", "none" or a directory path; defaults to azure when a connection string is set
+CONVERSION_SHARED_CACHE = os.environ.get("CONVERSION_SHARED_CACHE")
+# Size cap in MB of a directory used as the shared cache
+CONVERSION_SHARED_CACHE_MAX_MB = os.environ.get("CONVERSION_SHARED_CACHE_MAX_MB")
+
+
+def snowct_version():
+    """
+    Returns a string identifying the installed snowct, so a new SnowConvert
+    release never reuses outputs of the old one: its reported version, or (if
+    it cannot report one) the binary's path, size and modification time.
+    """
+    try:
+        result = subprocess.run(["snowct", "--version"], capture_output=True, text=True, timeout=60)
+        version = (result.stdout or "").strip()
+        if result.returncode == 0 and version:
+            return version
+    except Exception:
+        pass
+    binary = shutil.which("snowct")
+    if not binary:
+        return "unknown"
+    stat = os.stat(binary)
+    return f"{os.path.realpath(binary)}:{stat.st_size}:{int(stat.st_mtime)}"
+
+
+def conversion_key(input_path, version):
+    """Cache key of one input file: SHA-256 over the snowct version and the file's bytes."""
+    digest = hashlib.sha256(version.encode("utf-8") + b"\0")
+    with open(input_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class CacheBackend(abc.ABC):
+    """
+    Interface of a conversion-cache store: converted files addressed by key
+    (see conversion_key). run_conversion works against any backend, so the
+    local directory, a network share and Azure give the same hit/miss behavior.
+    """
+
+    @abc.abstractmethod
+    def list(self):
+        """Yields every key in the cache."""
+
+    @abc.abstractmethod
+    def exists(self, key):
+        """Returns whether `key` is in the cache."""
+
+    @abc.abstractmethod
+    def stat(self, key):
+        """Returns {"size": bytes, "modified": epoch seconds} for `key`, or None on a miss."""
+
+    @abc.abstractmethod
+    def get(self, key, dest_path):
+        """Restores the cached output for `key` to `dest_path`; returns False on a miss."""
+
+    @abc.abstractmethod
+    def put(self, key, src_path):
+        """Stores a converted file under `key`."""
+
+    def get_many(self, items):
+        """Restores {key: dest_path}; returns the set of keys that were hits."""
+        return {key for key, dest_path in items.items() if self.get(key, dest_path)}
+
+    def put_many(self, items):
+        """Stores {key: src_path}; returns the number of files stored."""
+        for key, src_path in items.items():
+            self.put(key, src_path)
+        return len(items)
+
+
+def _mb_to_bytes(value):
+    return int(float(value) * 1024 * 1024) if value else None
+
+
+class ConversionCache(CacheBackend):
+    def __init__(self, root=CONVERSION_CACHE_DIR, max_bytes=_mb_to_bytes(CONVERSION_CACHE_MAX_MB)):
+        """
+        Per-file conversion cache in a local directory: the converted output of
+        an input file is stored under the hash of that input and the snowct
+        version, so an unchanged procedure is never sent through snowct twice.
+
+        :param root: Directory holding the cached outputs (sharded by key prefix).
+        :param max_bytes: Optional size cap; when exceeded, the least recently
+                          used entries (by mtime, refreshed on every hit) are evicted.
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        # Running total of the cached bytes, measured once on the first capped put and kept up to date after
+        self._size = None
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], f"{key}.sql")
+
+    def list(self):
+        for shard in os.scandir(self.root):
+            if shard.is_dir():
+                for entry in os.scandir(shard.path):
+                    if entry.is_file() and entry.name.endswith(".sql"):
+                        yield entry.name[:-4]
+
+    def exists(self, key):
+        return os.path.isfile(self._path(key))
+
+    def stat(self, key):
+        try:
+            st = os.stat(self._path(key))
+        except FileNotFoundError:
+            return None
+        return {"size": st.st_size, "modified": st.st_mtime}
+
+    def get(self, key, dest_path):
+        """Restores the cached output for `key` to `dest_path`; returns False on a miss."""
+        path = self._path(key)
+        try:
+            shutil.copyfile(path, dest_path)
+        except FileNotFoundError:
+            return False
+        if self.max_bytes:
+            # Mark as recently used for LRU eviction
+            os.utime(path)
+        return True
+
+    def _store(self, key, src_path):
+        # Written atomically, so readers never see half a file
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # A unique temp file per put: concurrent puts of the same key (other sessions, other hosts
+        # on a shared directory) must never write or rename each other's file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f"{key}.", suffix=".tmp")
+        os.close(fd)
+        try:
+            shutil.copyfile(src_path, tmp_path)
+            new_size = os.path.getsize(tmp_path)
+            old = self.stat(key)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        if self._size is not None:
+            self._size += new_size - (old["size"] if old else 0)
+
+    def put(self, key, src_path):
+        """Stores a converted file under `key`."""
+        self._store(key, src_path)
+        self._evict_if_full()
+
+    def put_many(self, items):
+        """Stores {key: src_path}, evicting once for the whole batch; returns the number of files stored."""
+        for key, src_path in items.items():
+            self._store(key, src_path)
+        self._evict_if_full()
+        return len(items)
+
+    def _evict_if_full(self):
+        # Only a put that takes the cache over its cap pays for a full scan
+        if not self.max_bytes:
+            return 0
+        if self._size is None:
+            self._size = sum(st["size"] for st in map(self.stat, self.list()) if st)
+        return self.evict() if self._size > self.max_bytes else 0
+
+    def evict(self):
+        """Deletes least recently used entries until the cache fits in `max_bytes`; returns how many were deleted."""
+        if not self.max_bytes:
+            return 0
+        entries = []
+        for key in self.list():
+            path = self._path(key)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted += 1
+        # The scan also picks up entries added by other processes sharing the directory
+        self._size = total
+        if evicted:
+            log_info(f"Conversion cache {self.root}: evicted {evicted} least recently used file(s) to stay under "
+                     f"{self.max_bytes / 1_048_576:.0f} MB.")
+        return evicted
+
+
+class AzureConversionCache(CacheBackend):
+    def __init__(self, container_client, prefix, engine=None):
+        """
+        The same per-file cache in Azure Blob Storage, in one namespace shared by
+        every user: a procedure converted by anyone is reused by everyone whose
+        input (and snowct version) is byte-identical. Batches go through a
+        BlobTransferEngine (concurrent, streamed).
+
+        :param container_client: azure.storage.blob ContainerClient of the cache container.
+        :param prefix: Blob name prefix of the shared cache (ends with "/").
+        :param engine: BlobTransferEngine to use (one is created if None).
+        """
+        # Imported here so the local backends work without the Azure SDK installed
+        from scripts.blob_transfer import BlobTransferEngine
+
+        self.container_client = container_client
+        self.prefix = prefix
+        self.engine = engine or BlobTransferEngine(container_client)
+
+    def _blob_name(self, key):
+        return f"{self.prefix}{key[:2]}/{key}.sql"
+
+    def list(self):
+        for blob in self.container_client.list_blobs(name_starts_with=self.prefix):
+            if blob.name.endswith(".sql"):
+                yield os.path.basename(blob.name)[:-4]
+
+    def exists(self, key):
+        return self.container_client.get_blob_client(self._blob_name(key)).exists()
+
+    def stat(self, key):
+        blob_client = self.container_client.get_blob_client(self._blob_name(key))
+        if not blob_client.exists():
+            return None
+        props = blob_client.get_blob_properties()
+        return {"size": props.size, "modified": props.last_modified.timestamp()}
+
+    def get(self, key, dest_path):
+        """Downloads the cached output for `key` to `dest_path`; returns False on a miss."""
+        return self.engine.download(self._blob_name(key), dest_path) is not None
+
+    def put(self, key, src_path):
+        """Uploads a converted file under `key`."""
+        self.engine.upload(src_path, self._blob_name(key))
+
+    def get_many(self, items):
+        """Downloads {key: dest_path} concurrently; returns the set of keys that were hits."""
+        jobs = {(self._blob_name(key), dest_path): key for key, dest_path in items.items()}
+        stats, results = self.engine.download_many(jobs)
+        if stats.failed:
+            raise RuntimeError(f"{len(stats.failed)} download(s) from the shared cache failed: {stats.failed[0][1]}")
+        return {jobs[job] for job, result in results.items() if result is not None}
+
+    def put_many(self, items):
+        """Uploads {key: src_path} concurrently; returns the number of files uploaded."""
+        stats, _ = self.engine.upload_many([(src_path, self._blob_name(key)) for key, src_path in items.items()])
+        return stats.transferred + stats.skipped
+
+
+def shared_cache_backend(blob_service_client=None, container_name=None, prefix=None, setting=CONVERSION_SHARED_CACHE):
+    """
+    Returns the shared (second-tier) cache backend selected by
+    CONVERSION_SHARED_CACHE, or None for none:
+    - "none": no shared cache;
+    - a directory path (e.g. a network share): a ConversionCache there,
+      capped by CONVERSION_SHARED_CACHE_MAX_MB;
+    - "azure", or unset: Azure, if a blob service client is available.
+    """
+    setting = (setting or "").strip()
+    if setting.lower() == "none":
+        return None
+    if setting and setting.lower() != "azure":
+        return ConversionCache(setting, max_bytes=_mb_to_bytes(CONVERSION_SHARED_CACHE_MAX_MB))
+    if blob_service_client is None:
+        return None
+    return AzureConversionCache(blob_service_client.get_container_client(container_name), prefix)
@@ -9,11 +9,13 @@ import platform
 import tempfile
 import datetime
 import re
-import requests
-import tarfile
-import zipfile
 import time
+import heapq
+import queue
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from scripts.conversion_cache import ConversionCache, conversion_key, snowct_version
+from scripts.cli_install import CliInstallCache, normalize_arch
 
 # --- Helper to load .env file ---
 # def load_env_vars():
@@ -34,11 +36,168 @@ from dotenv import load_dotenv
 
 # load_env_vars()
 load_dotenv()  # Load .env variables into os.environ
+
+# Concurrent snowct processes in sharded mode (override with SNOWCONVERT_SHARDS)
+DEFAULT_SHARDS = int(os.environ.get("SNOWCONVERT_SHARDS", min(4, os.cpu_count() or 1)))
+# Smaller inputs are not worth splitting; the shard count is reduced to keep at least this many files per shard
+MIN_FILES_PER_SHARD = 50
+# Summary lines of the snowct assessment that are merged across shards
+SUMMARY_PATTERNS = {
+    "files": r"- Files:\s+(\d+)",
+    "not_generated": r"- Files Not Generated:\s+(\d+)",
+    "loc": r"- Total lines of code:\s+(\d+)",
+    "auto_pct": r"- Automatically converted:\s+([\d\.]+)%",
+}
+# Every run appends a section starting with this marker to the assessment log
+RUN_MARKER = "#### SnowConvert run"
+# File names mentioned in a line of snowct output (how per-file progress is detected)
+FILE_MENTION_PATTERN = re.compile(r"[^\s\\/'\"]+\.sql\b", re.IGNORECASE)
+
+
+def _count_lines(path):
+    with open(path, "rb") as f:
+        return sum(1 for _ in f)
+
+
+def plan_shards(files, shard_count):
+    """
+    Splits `files` into `shard_count` shards with balanced total line counts
+    (largest file first, always onto the lightest shard). Returns a list of
+    non-empty file lists.
+    """
+    shards = [[] for _ in range(shard_count)]
+    heap = [(0, i) for i in range(shard_count)]
+    for lines, path in sorted(((_count_lines(f), f) for f in files), reverse=True):
+        load, i = heapq.heappop(heap)
+        shards[i].append(path)
+        heapq.heappush(heap, (load + lines, i))
+    return [shard for shard in shards if shard]
+
+
+def _merge_tree(src_root, dst_root, shard_no, written):
+    """
+    Copies a shard's output tree into the combined output. Converted files never
+    collide (each input is in exactly one shard); CSV reports another shard of
+    this run already wrote are appended without their header, other clashing
+    files get a shard suffix. `written` collects the paths written by this run.
+    """
+    for dirpath, _, filenames in os.walk(src_root):
+        rel_dir = os.path.relpath(dirpath, src_root)
+        os.makedirs(os.path.join(dst_root, rel_dir), exist_ok=True)
+        for name in filenames:
+            src = os.path.join(dirpath, name)
+            dst = os.path.join(dst_root, rel_dir, name)
+            if dst not in written:
+                shutil.copy2(src, dst)
+                written.add(dst)
+            elif name.lower().endswith(".csv"):
+                with open(src, "r", encoding="utf-8", errors="replace") as fin, \
+                        open(dst, "a", encoding="utf-8") as fout:
+                    next(fin, None)
+                    shutil.copyfileobj(fin, fout)
+            else:
+                stem, ext = os.path.splitext(name)
+                shutil.copy2(src, os.path.join(dst_root, rel_dir, f"{stem}.shard{shard_no + 1}{ext}"))
+
+
+def merge_assessments(outputs, wall_seconds):
+    """
+    Builds the combined summary of the shards' snowct outputs, in snowct's own
+    format so the analytics dashboard can parse it (the shards' full outputs
+    were already streamed into the log).
+    """
+    totals = {"files": 0, "not_generated": 0, "loc": 0}
+    converted_loc = 0.0
+    for text in outputs:
+        found = {k: re.search(p, text, re.M) for k, p in SUMMARY_PATTERNS.items()}
+        values = {k: (float(m.group(1)) if m else 0.0) for k, m in found.items()}
+        for k in totals:
+            totals[k] += int(values[k])
+        converted_loc += values["loc"] * values["auto_pct"] / 100
+    auto_pct = (100 * converted_loc / totals["loc"]) if totals["loc"] else 0.0
+    hours, rest = divmod(wall_seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    summary = (
+        f"Combined summary of {len(outputs)} shard(s)\n"
+        f"- Files: {totals['files']}\n"
+        f"- Files Not Generated: {totals['not_generated']}\n"
+        f"- Total lines of code: {totals['loc']}\n"
+        f"- Automatically converted: {auto_pct:.2f}%\n"
+        f"- Conversion time: {int(hours):02d}:{int(minutes):02d}:{seconds:06.3f}\n"
+        f"- Conversion speed: {int(totals['loc'] / wall_seconds) if wall_seconds else 0} lines of code per second\n"
+    )
+    return summary
+
+
+def _stream_process(command, on_line):
+    """Runs `command`, calling on_line(line) for every line of its stdout and stderr as it is printed; returns the exit code."""
+    with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                          text=True, bufsize=1, errors="replace") as proc:
+        for line in proc.stdout:
+            on_line(line.rstrip("\n"))
+    return proc.returncode
+
+
+class ConversionProgress:
+    def __init__(self, files, callback=None):
+        """
+        Per-file progress of a snowct run, derived from its output: a file
+        counts as done the first time a line mentions its name. `callback` is
+        called with this object whenever another file is done.
+
+        :param files: Input files sent to snowct.
+        :param callback: Optional function taking the ConversionProgress.
+        """
+        self.pending = {os.path.basename(f).lower() for f in files}
+        self.total = len(self.pending)
+        self.done = 0
+        self.lines = 0
+        self.last_file = None
+        self.callback = callback
+        self.started = time.monotonic()
+
+    def feed(self, line):
+        """Accounts for one line of snowct output."""
+        self.lines += 1
+        for name in FILE_MENTION_PATTERN.findall(line):
+            name = os.path.basename(name).lower()
+            if name in self.pending:
+                self.pending.discard(name)
+                self.done += 1
+                self.last_file = name
+                if self.callback:
+                    self.callback(self)
+
+    @property
+    def fraction(self):
+        return self.done / self.total if self.total else 1.0
+
+    @property
+    def eta_seconds(self):
+        """Seconds left at the rate so far, or None before the first file is done."""
+        if not self.done:
+            return None
+        elapsed = time.monotonic() - self.started
+        return elapsed / self.done * (self.total - self.done)
+
+    def describe(self):
+        text = f"{self.done}/{self.total} file(s) converted"
+        eta = self.eta_seconds
+        if eta is not None and self.done < self.total:
+            minutes, seconds = divmod(int(eta), 60)
+            text += f" · ETA {minutes}m {seconds:02d}s"
+        if self.last_file:
+            text += f" · last: {self.last_file}"
+        return text
+
+
 class SnowConvertRunner:
-    def __init__(self, ui_logger=None):
+    def __init__(self, ui_logger=None, progress_callback=None):
         """
         Initializes the runner.
         :param ui_logger: A callback function (e.g., st.write) to send logs to the UI.
+        :param progress_callback: Optional function called with a ConversionProgress
+                                  each time snowct finishes another file.
         """
         self.input_path = "./extracted_procedures"
         self.output_path = "./converted_procedures"
@@ -50,6 +209,7 @@ class SnowConvertRunner:
                 f.write("SnowConvert CLI Assessment Log\n")
                 f.write("=" * 40 + "\n\n")
         self.ui_logger = ui_logger
+        self.progress_callback = progress_callback
 
         # self._setup_snowconvert_home()  
 
@@ -182,119 +342,46 @@ class SnowConvertRunner:
 
 
     def setup_cli(self):
-        """Checks if 'snowct' is on PATH and attempts to install it if not."""
+        """
+        Makes 'snowct' available: from PATH, else from the remembered install in
+        the CLI install cache (no network), else by installing it there.
+        """
         self._log("Verifying SnowConvert CLI (snowct) installation...")
         if shutil.which("snowct"):
             self._log("Found existing SnowConvert CLI on PATH.")
             return True
 
         current_os = platform.system().lower()
-        self._log(f"'snowct' not found. Detected OS: {current_os}. Attempting automatic install…")
+        if current_os == "win32": current_os = "windows"
+        arch = normalize_arch(platform.machine())
+        if current_os not in ("darwin", "linux", "windows") or arch is None:
+            self._log(f"Automatic install is not supported on {current_os} ({platform.machine()}).", "ERROR")
+            self._log("Please install SnowConvert CLI manually and re-run.", "ERROR")
+            return False
 
         try:
-            if current_os == "darwin": self._install_cli_macos()
-            elif current_os == "linux":
-                self._install_cli_linux()
-            elif current_os in ("windows", "win32"): self._install_cli_windows()
+            install_cache = CliInstallCache(log=self._log)
+            binary = install_cache.installed_binary(current_os, arch)
+            if binary:
+                self._log(f"Using the cached SnowConvert CLI at {binary} (no download needed).")
             else:
-                self._log(f"Automatic install only supports macOS and Windows. Detected OS: {current_os}", "ERROR")
-                self._log("Please install SnowConvert CLI manually and re-run.", "ERROR")
-                return False
+                self._log(f"'snowct' not found. Detected OS: {current_os} ({arch}). Attempting automatic install…")
+                binary = install_cache.install(current_os, arch)
         except Exception as e:
             self._log(f"CLI installation failed: {e}", "ERROR")
             return False
 
+        orchestrator_path = os.path.dirname(binary)
+        os.environ["PATH"] = orchestrator_path + os.pathsep + os.environ.get("PATH", "")
+        self._log(f"Added '{orchestrator_path}' to PATH.")
+
         if not shutil.which("snowct"):
             self._log("'snowct' is still not on PATH after installation. Verify installation.", "ERROR")
             return False
-        
+
         self._log("✅ SnowConvert CLI is ready.")
         return True
 
-    # --- NEW METHOD: _install_cli_linux ---
-    def _install_cli_linux(self):
-        """Downloads and installs the SnowConvert CLI for Linux (x64 or ARM64)."""
-        machine = platform.machine().lower()
-        if machine in ("x86_64", "amd64"):
-            arch, url = "x64", "https://sctoolsartifacts.z5.web.core.windows.net/linux/prod/cli/SnowConvert-CLI-linux.tar"
-        elif machine in ("arm64", "aarch64"):
-            arch, url = "arm64", "https://sctoolsartifacts.z5.web.core.windows.net/linux/prod/cli/SnowConvert-CLI-arm64-linux.tar"
-        else:
-            raise Exception(f"Unsupported Linux architecture: {machine}")
-        
-        extract_to = os.path.abspath("./SnowConvert-CLI-linux")
-        orchestrator_path = os.path.join(extract_to, "orchestrator")
-        
-        self._log(f"Downloading SnowConvert for Linux ({arch})...")
-        with tempfile.TemporaryDirectory() as tmpdir:
-            tar_path = os.path.join(tmpdir, "snowct.tar.gz")
-            with requests.get(url, stream=True, timeout=120) as r:
-                r.raise_for_status()
-                with open(tar_path, "wb") as f:
-                    shutil.copyfileobj(r.raw, f)
-            
-            self._log("Download complete. Extracting...")
-            with tarfile.open(tar_path, "r:gz") as tar:
-                tar.extractall(path=extract_to)
-
-        os.environ["PATH"] = orchestrator_path + os.pathsep + os.environ.get("PATH", "")
-        self._log(f"Added '{orchestrator_path}' to PATH.")
-        # Make sure the binary is executable
-        snowct_binary = os.path.join(orchestrator_path, "snowct")
-        if os.path.exists(snowct_binary):
-            os.chmod(snowct_binary, 0o777) # Set executable permission
-            self._log(f"Set executable permission on {snowct_binary}")
-
-
-    def _install_cli_macos(self):
-        # (This method's internal logic is the same, but uses self._log)
-        machine = platform.machine().lower()
-        if machine in ("x86_64", "amd64"): arch, url = "x64", "https://sctoolsartifacts.z5.web.core.windows.net/darwin_x64/prod/cli/SnowConvert-CLI-mac.tar"
-        elif machine in ("arm64", "aarch64"): arch, url = "arm64", "https://sctoolsartifacts.z5.web.core.windows.net/darwin_arm64/prod/cli/SnowConvert-CLI-arm64-mac.tar"
-        else: raise Exception(f"Unsupported macOS architecture: {machine}")
-        
-        extract_to = os.path.abspath("./SnowConvert-CLI-macos")
-        orchestrator_path = os.path.join(extract_to, "orchestrator")
-        
-        self._log(f"Downloading SnowConvert for macOS ({arch})...")
-        # Download and extraction logic here (unchanged, just replace self._log/error with self._log)
-        with tempfile.TemporaryDirectory() as tmpdir:
-            tar_path = os.path.join(tmpdir, "snowct.tar.gz")
-            # ... download request with progress ...
-            with requests.get(url, stream=True, timeout=120) as r:
-                r.raise_for_status()
-                with open(tar_path, "wb") as f: f.write(r.content)
-            
-            self._log("Download complete. Extracting...")
-            with tarfile.open(tar_path, "r:gz") as tar: tar.extractall(path=extract_to)
-
-        os.environ["PATH"] = orchestrator_path + os.pathsep + os.environ.get("PATH", "")
-        self._log(f"Added '{orchestrator_path}' to PATH.")
-
-    def _install_cli_windows(self):
-        # (This method's internal logic is the same, but uses self._log)
-        machine = platform.machine().lower()
-        if machine in ("amd64", "x86_64"): arch, url = "x64", "https://sctoolsartifacts.z5.web.core.windows.net/windows/prod/cli/SnowConvert-CLI-windows.zip"
-        elif machine in ("arm64", "aarch64"): arch, url = "arm64", "https://sctoolsartifacts.z5.web.core.windows.net/windows/prod/cli/SnowConvert-CLI-arm64-windows.zip"
-        else: raise Exception(f"Unsupported Windows architecture: {machine}")
-
-        extract_to = os.path.abspath("./SnowConvert-CLI-windows")
-        orchestrator_path = os.path.join(extract_to, "orchestrator")
-        
-        self._log(f"Downloading SnowConvert for Windows ({arch})...")
-        # Download and extraction logic here (unchanged, just replace self._log/error with self._log)
-        with tempfile.TemporaryDirectory() as tmpdir:
-            zip_path = os.path.join(tmpdir, "snowct.zip")
-            with requests.get(url, stream=True, timeout=120) as r:
-                r.raise_for_status()
-                with open(zip_path, "wb") as f: f.write(r.content)
-            
-            self._log("Download complete. Extracting...")
-            with zipfile.ZipFile(zip_path, "r") as z: z.extractall(extract_to)
-
-        os.environ["PATH"] = orchestrator_path + os.pathsep + os.environ.get("PATH", "")
-        self._log(f"Added '{orchestrator_path}' to PATH.")
-
     def setup_license(self):
         """Checks for an active license and installs one from env if needed."""
         self._log("Verifying SnowConvert license...")
@@ -508,7 +595,7 @@ class SnowConvertRunner:
             sys.exit(1)
     
         if not has_active_license(post_install_output):
-            self._write_log("After install-ac, 'snowct show-ac' returned:\n\n" + post_install_output)
+            self._append_log("After install-ac, 'snowct show-ac' returned:\n\n" + post_install_output)
             self._error("❌ Access code did not become ACTIVE.")
             # self._log("📄 Check the logs for full 'show-ac' output.")
             # self._log("🚧 Possible issues:\n"
@@ -561,22 +648,220 @@ class SnowConvertRunner:
 
 
 
-    def run_conversion(self):
-        """Runs the main snowct conversion command."""
-        command = ["snowct", "sql-server", "--input", self.input_path, "--output", self.output_path]
-        self._log(f"Executing conversion: {' '.join(command)}")
-        try:
-            result = subprocess.run(command, check=True, capture_output=True, text=True)
-            self._write_log(result.stdout)
-            self._log("✅ Conversion completed successfully.")
+    def run_conversion(self, shards=DEFAULT_SHARDS, use_cache=True, cache=None, remote_cache=None, before_snowct=None):
+        """
+        Converts the extracted procedures. With `use_cache`, every input file is
+        looked up in the conversion cache (keyed by its content and the snowct
+        version) first: hits are restored into the output directory and only the
+        misses go through snowct, after which their outputs are cached.
+        `self.cache_stats` reports the hit/miss counts.
+
+        :param cache: Local CacheBackend (a ConversionCache in
+                      ./.conversion_cache if None).
+        :param remote_cache: Optional shared CacheBackend (e.g.
+                             AzureConversionCache) consulted after the local
+                             one; new outputs are uploaded to it.
+        :param before_snowct: Optional callable run only if something has to be
+                              converted (e.g. the license check); returning
+                              False aborts the run.
+        """
+        self.failed_files = []
+        files = sorted(
+            os.path.join(self.input_path, f) for f in os.listdir(self.input_path) if f.endswith(".sql")
+        ) if os.path.isdir(self.input_path) else []
+        self.cache_stats = {"hits": 0, "remote_hits": 0, "misses": len(files), "uploaded": 0}
+        self._append_log(f"\n{RUN_MARKER} {datetime.datetime.now():%Y-%m-%d %H:%M:%S} ({len(files)} file(s)) ####\n")
+        if not use_cache:
+            if before_snowct and not before_snowct():
+                return False
+            return self._convert_files(self.input_path, files, shards)
+
+        cache = cache or ConversionCache()
+        version = snowct_version()
+        converted_dir = os.path.join(self.output_path, "Output", "SnowConvert")
+        os.makedirs(converted_dir, exist_ok=True)
+        self._prune_outputs(converted_dir, files)
+
+        keys = {f: conversion_key(f, version) for f in files}
+        outputs = {f: os.path.join(converted_dir, os.path.basename(f)) for f in files}
+        local_misses = [f for f in files if not cache.get(keys[f], outputs[f])]
+        remote_hits = 0
+        if remote_cache is not None and local_misses:
+            try:
+                # One concurrent batch instead of a round trip per file
+                hit_keys = remote_cache.get_many({keys[f]: outputs[f] for f in local_misses})
+            except Exception as e:
+                # An unreachable shared cache must not block conversion; carry on locally
+                self._log(f"Shared conversion cache unavailable, converting locally: {e}", "WARN")
+                remote_cache, hit_keys = None, set()
+            cache.put_many({keys[f]: outputs[f] for f in local_misses if keys[f] in hit_keys})
+            remote_hits = sum(1 for f in local_misses if keys[f] in hit_keys)
+            local_misses = [f for f in local_misses if keys[f] not in hit_keys]
+        misses = []
+        for f in local_misses:
+            # Never let an output from an older run stand in for (or be cached as) this input
+            if os.path.exists(outputs[f]):
+                os.remove(outputs[f])
+            misses.append(f)
+        self.cache_stats = {"hits": len(files) - len(misses), "remote_hits": remote_hits, "misses": len(misses), "uploaded": 0}
+        self._log(f"Conversion cache: {self.cache_stats['hits']} hit(s) ({remote_hits} from the shared cache), "
+                  f"{len(misses)} file(s) to convert.")
+        if self.cache_stats["hits"]:
+            self._append_log(f"{self.cache_stats['hits']} file(s) were restored from the conversion cache; "
+                             f"the assessment below covers the {len(misses)} converted file(s).\n")
+        if not misses:
+            self._append_log(f"All {len(files)} file(s) were restored from the conversion cache (snowct {version}); nothing was converted.\n")
+            self._log("✅ Conversion completed successfully (all files from cache).")
             return True
-        except subprocess.CalledProcessError as e:
-            self._write_log(e.stderr)
-            self._log(f"Conversion failed. Check logs at {self.log_file}", "ERROR")
+
+        if before_snowct and not before_snowct():
             return False
 
-    def _write_log(self, content):
-        with open(self.log_file, "w") as f: f.write(content)
+        with tempfile.TemporaryDirectory(prefix="snowct_misses_") as miss_dir:
+            if len(misses) == len(files):
+                ok = self._convert_files(self.input_path, misses, shards)
+            else:
+                for f in misses:
+                    shutil.copy2(f, miss_dir)
+                ok = self._convert_files(miss_dir, [os.path.join(miss_dir, os.path.basename(f)) for f in misses], shards)
+
+        failed = {os.path.basename(f) for f in self.failed_files}
+        self.failed_files = [f for f in misses if os.path.basename(f) in failed]
+        if ok:
+            converted = {
+                keys[f]: outputs[f] for f in misses
+                if os.path.basename(f) not in failed and os.path.exists(outputs[f])
+            }
+            cache.put_many(converted)
+            if remote_cache is not None and converted:
+                try:
+                    self.cache_stats["uploaded"] = remote_cache.put_many(converted)
+                except Exception as e:
+                    self._log(f"Could not upload the new outputs to the shared cache: {e}", "WARN")
+        return ok
+
+    def _prune_outputs(self, converted_dir, files):
+        """Removes converted files whose input is no longer extracted (e.g. the procedure was unflagged)."""
+        current = {os.path.basename(f) for f in files}
+        for entry in os.scandir(converted_dir):
+            if entry.is_file() and entry.name.endswith(".sql") and entry.name not in current:
+                os.remove(entry.path)
+
+    def _convert_files(self, input_dir, files, shards):
+        """
+        Runs snowct over `input_dir`. Large inputs are split into `shards`
+        line-balanced shards converted concurrently (see
+        run_sharded_conversion); small ones run as a single snowct call.
+        """
+        shards = min(shards, len(files) // MIN_FILES_PER_SHARD)
+        if shards > 1:
+            return self.run_sharded_conversion(files, shards)
+
+        command = ["snowct", "sql-server", "--input", input_dir, "--output", self.output_path]
+        self._log(f"Executing conversion: {' '.join(command)}")
+        progress = ConversionProgress(files, self.progress_callback)
+        with open(self.log_file, "a", encoding="utf-8") as log:
+            def on_line(line):
+                log.write(line + "\n")
+                log.flush()
+                self._log(line, "snowct")
+                progress.feed(line)
+            returncode = _stream_process(command, on_line)
+        if returncode != 0:
+            self._log(f"Conversion failed (exit code {returncode}). Check logs at {self.log_file}", "ERROR")
+            return False
+        self._log("✅ Conversion completed successfully.")
+        return True
+
+    def _convert_shard(self, shard_no, files, workdir, on_line):
+        """
+        Converts one shard in its own snowct process, passing every output line
+        to on_line(shard_no, line) and keeping a copy in the shard's log.
+
+        Returns:
+            tuple: (returncode, output dir, shard log path).
+        """
+        shard_input = os.path.join(workdir, f"shard_{shard_no}", "input")
+        shard_output = os.path.join(workdir, f"shard_{shard_no}", "output")
+        shard_log = os.path.join(workdir, f"shard_{shard_no}", "snowct.log")
+        os.makedirs(shard_input)
+        for path in files:
+            shutil.copy2(path, shard_input)
+        command = ["snowct", "sql-server", "--input", shard_input, "--output", shard_output]
+        with open(shard_log, "w", encoding="utf-8") as log:
+            def tee(line):
+                log.write(line + "\n")
+                on_line(shard_no, line)
+            returncode = _stream_process(command, tee)
+        return returncode, shard_output, shard_log
+
+    def run_sharded_conversion(self, files, shard_count):
+        """
+        Splits `files` into `shard_count` shards balanced by line count, runs one
+        snowct process per shard concurrently, then merges the shards' output
+        trees and assessments into the usual locations. A failing shard only
+        loses its own files: they are listed in `self.failed_files`, and the run
+        counts as successful as long as at least one shard converted.
+        """
+        shards = plan_shards(files, shard_count)
+        self._log(f"Executing sharded conversion: {len(files)} files in {len(shards)} shards "
+                  f"({', '.join(str(len(s)) for s in shards)} files).")
+        started = time.monotonic()
+        progress = ConversionProgress(files, self.progress_callback)
+        # Shard threads only queue their lines; logging and progress happen here, on the caller's thread
+        lines = queue.Queue()
+        with tempfile.TemporaryDirectory(prefix="snowct_shards_") as workdir:
+            with ThreadPoolExecutor(max_workers=len(shards)) as executor, \
+                    open(self.log_file, "a", encoding="utf-8") as log:
+                futures = [
+                    executor.submit(self._convert_shard, shard_no, shard_files, workdir,
+                                    lambda no, line: lines.put((no, line)))
+                    for shard_no, shard_files in enumerate(shards)
+                ]
+
+                def handle(shard_no, line):
+                    log.write(f"[shard {shard_no + 1}] {line}\n")
+                    self._log(f"[shard {shard_no + 1}] {line}", "snowct")
+                    progress.feed(line)
+
+                while True:
+                    try:
+                        handle(*lines.get(timeout=0.2))
+                    except queue.Empty:
+                        log.flush()
+                        if all(f.done() for f in futures):
+                            while not lines.empty():
+                                handle(*lines.get_nowait())
+                            break
+                results = [f.result() for f in futures]
+            wall_seconds = time.monotonic() - started
+
+            outputs, merged, written = [], 0, set()
+            for shard_no, (files_in_shard, (returncode, shard_output, shard_log)) in enumerate(zip(shards, results)):
+                with open(shard_log, "r", encoding="utf-8") as f:
+                    outputs.append(f.read())
+                if returncode != 0:
+                    self.failed_files.extend(files_in_shard)
+                    self._log(f"Shard {shard_no + 1} failed (exit code {returncode}); "
+                              f"its {len(files_in_shard)} file(s) were not converted.", "ERROR")
+                    continue
+                _merge_tree(shard_output, self.output_path, shard_no, written)
+                merged += 1
+                self._log(f"Shard {shard_no + 1}/{len(shards)} converted {len(files_in_shard)} file(s).")
+
+        self._append_log(merge_assessments(outputs, wall_seconds))
+        if not merged:
+            self._log(f"Conversion failed in every shard. Check logs at {self.log_file}", "ERROR")
+            return False
+        if self.failed_files:
+            self._log(f"⚠️ Conversion completed with {len(self.failed_files)} file(s) in failed shards. "
+                      f"Check logs at {self.log_file}", "WARN")
+        else:
+            self._log("✅ Conversion completed successfully.")
+        return True
+
+    def _append_log(self, content):
+        with open(self.log_file, "a", encoding="utf-8") as f: f.write(content)
 
 if __name__ == "__main__":
     runner = SnowConvertRunner()
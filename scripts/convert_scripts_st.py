@@ -1,14 +1,20 @@
 # --- START OF FILE convert_scripts_st.py ---
 
 import streamlit as st
-from scripts.convert_scripts import SnowConvertRunner # Import the refactored backend class
+from scripts.convert_scripts import SnowConvertRunner, RUN_MARKER # Import the refactored backend class
+from scripts.conversion_cache import shared_cache_backend
+from scripts.blob_transfer import BlobTransferEngine
 import re
 import os
+import time
+from collections import deque
 from dotenv import load_dotenv
 import uuid
 from datetime import datetime, timedelta, timezone
 from azure.storage.blob import BlobServiceClient, generate_blob_sas, BlobSasPermissions
 from scripts.git_publisher import GitPublisher
+from scripts.manifest import Manifest, CONVERTED
+from scripts.log import log_info, log_error
 
 load_dotenv()
 
@@ -17,6 +23,12 @@ AZURE_STORAGE_CONNECTION_STRING = os.environ.get("AZURE_STORAGE_CONNECTION_STRIN
 ACCOUNT_URL = os.environ.get("ACCOUNT_URL") 
 AZURE_STORAGE_CONTAINER_NAME = "data" 
 AZURE_STORAGE_DIRECTORY_PREFIX = "streamlit_test"
+# Shared by all users: converted files keyed by input hash + snowct version
+AZURE_CONVERSION_CACHE_PREFIX = f"{AZURE_STORAGE_DIRECTORY_PREFIX}/conversion_cache/"
+# Lines of live conversion output kept on screen
+LOG_TAIL_LINES = 200
+# Streamed snowct lines re-render the log at most this often (other messages render immediately)
+LOG_REFRESH_SECONDS = 0.25
 # Load environment variables from .env file
 
 class ConvertPage:
@@ -44,11 +56,15 @@ class ConvertPage:
     
 
     def _get_blob_service_client(self):
-        """Initializes and returns the Azure Blob Service Client."""
+        """Initializes and returns the Azure Blob Service Client, or None when Azure is not configured."""
         connection_string = os.environ.get("AZURE_STORAGE_CONNECTION_STRING")
         if not connection_string:
             return None
-        return BlobServiceClient.from_connection_string(connection_string)
+        try:
+            return BlobServiceClient.from_connection_string(connection_string)
+        except Exception as e:
+            log_error(f"Invalid AZURE_STORAGE_CONNECTION_STRING, continuing without Azure: {e}")
+            return None
 
 
 
@@ -74,8 +90,8 @@ class ConvertPage:
                 This tool converts SQL Server stored procedures to Snowflake using the SnowConvert
                 Click the button below to start the process. The tool will:
                 1.  Verify the SnowConvert command-line tool (`snowct`) is installed (and install it if missing).
-                2.  Verify you have an active license (and install one from your `.env` file if needed).
-                3.  Run the conversion on all files in the `extracted_procedures` directory.
+                2.  Reuse the converted output of every procedure whose definition was already converted (locally or by anyone, via the shared cache: Azure by default, or a directory set in `CONVERSION_SHARED_CACHE`).
+                3.  Verify you have an active license (and install one from your `.env` file if needed) and convert only the remaining files.
                 """
             )
             if st.button("▶️ **Run Conversion Process**", type="primary", use_container_width=True):
@@ -134,83 +150,99 @@ class ConvertPage:
 
 
 
-    def _check_azure_for_files(self):
-        """Checks if files already exist in the user's Azure blob path."""
-        container_client = self.blob_service_client.get_container_client(self.container_name)
-        blobs = container_client.list_blobs(name_starts_with=self.blob_prefix)
-        return any(blobs)
-    
-
-
-    def _download_from_azure(self):
-        """Downloads all files from the user's Azure path to the local output directory."""
-        output_dir = "./converted_procedures/Output/SnowConvert"
-        os.makedirs(output_dir, exist_ok=True)
-        container_client = self.blob_service_client.get_container_client(self.container_name)
-        blobs_to_download = container_client.list_blobs(name_starts_with=self.blob_prefix)
-        
-        count = 0
-        for blob in blobs_to_download:
-            blob_client = container_client.get_blob_client(blob)
-            local_file_name = os.path.basename(blob.name)
-            download_file_path = os.path.join(output_dir, local_file_name)
-            with open(download_file_path, "wb") as download_file:
-                download_file.write(blob_client.download_blob().readall())
-            count += 1
-        return count
-
     def _upload_to_azure(self):
-        """Uploads files from the local output directory to the user's Azure path."""
+        """
+        Uploads files from the local output directory to the user's Azure path,
+        concurrently; files whose blob already has the same MD5 are skipped.
+
+        Returns:
+            TransferStats: counts and throughput of the upload.
+        """
         local_dir = "./converted_procedures/Output/SnowConvert"
-        container_client = self.blob_service_client.get_container_client(self.container_name)
+        engine = BlobTransferEngine(self.blob_service_client.get_container_client(self.container_name))
+        remote = engine.remote_md5s(self.blob_prefix)
 
-        count = 0
+        jobs = []
         for filename in os.listdir(local_dir):
             local_file_path = os.path.join(local_dir, filename)
             if os.path.isfile(local_file_path):
                 blob_name = f"{self.blob_prefix}{filename}"
-                blob_client = container_client.get_blob_client(blob_name)
-                with open(local_file_path, "rb") as data:
-                    blob_client.upload_blob(data, overwrite=True)
-                count += 1
-        return count
+                jobs.append((local_file_path, blob_name, remote.get(blob_name)))
+        stats, _ = engine.upload_many(jobs)
+        return stats
+
+
+
+    def _record_converted(self):
+        """Records in the pipeline manifest which procedures now have a converted file."""
+        converted = Manifest().sync_stage_dir(CONVERTED, "./converted_procedures/Output/SnowConvert")
+        log_info(f"Manifest: {converted} procedure(s) have a converted file.")
 
 
 
     def run_conversion_workflow(self):
         """Orchestrates the conversion process with Azure caching."""
+        progress_slot = st.empty()
         log_container = st.container(border=True)
-        def ui_logger(message): log_container.text(message)
+        log_view = log_container.empty()
+        log_tail = deque(maxlen=LOG_TAIL_LINES)
+        last_render = [0.0]
+
+        def ui_logger(message):
+            log_tail.append(message)
+            now = time.monotonic()
+            if not message.startswith("[snowct]") or now - last_render[0] >= LOG_REFRESH_SECONDS:
+                log_view.code("\n".join(log_tail), language="text")
+                last_render[0] = now
+
+        def on_progress(progress):
+            progress_slot.progress(progress.fraction, text=f"⏳ {progress.describe()}")
 
         with st.status("Starting conversion workflow...", expanded=True) as status:
             try:
-                status.update(label="Step 1/3: Checking Azure cache...")
-                if self._check_azure_for_files():
-                    status.update(label="Cache hit! Downloading existing files from Azure...")
-                    count = self._download_from_azure()
-                    status.update(label=f"✅ Download complete! {count} files retrieved from cache.", state="complete")
-                    st.session_state.step_completion['convert_procs'] = True
-                    st.toast("Retrieved converted files from Azure cache.", icon="☁️")
-                else:
-                    status.update(label="Cache miss. Proceeding with local conversion...")
-                    runner = SnowConvertRunner(ui_logger=ui_logger)
-                    
-                    status.update(label="Step 1/3: Setting up SnowConvert CLI...")
-                    if not runner.setup_cli(): raise Exception("Failed to set up SnowConvert CLI.")
+                runner = SnowConvertRunner(ui_logger=ui_logger, progress_callback=on_progress)
+
+                # The cache key includes the snowct version, so the CLI is needed even for cache hits
+                status.update(label="Step 1/3: Setting up SnowConvert CLI...")
+                if not runner.setup_cli(): raise Exception("Failed to set up SnowConvert CLI.")
 
+                def verify_license():
+                    # Only needed when some files actually have to be converted
                     status.update(label="Step 2/3: Verifying license...")
                     if not runner.setup_license(): raise Exception("Failed to set up SnowConvert license.")
-
-                    status.update(label="Step 3/3: Converting procedures...")
-                    if not runner.run_conversion(): raise Exception("The conversion command failed.")
-                    
-                    st.session_state.show_analytics = True
-                    
-                    status.update(label="Uploading results to Azure cache...")
-                    upload_count = self._upload_to_azure()
-                    status.update(label=f"✅ Workflow Complete! {upload_count} files converted and uploaded.", state="complete")
-                    st.session_state.step_completion['convert_procs'] = True
-                    st.toast("Conversion successful and results uploaded to Azure.", icon="🚀")
+                    status.update(label="Step 3/3: Converting changed procedures...")
+                    return True
+
+                status.update(label="Checking the conversion caches...")
+                remote_cache = shared_cache_backend(
+                    self.blob_service_client, self.container_name, AZURE_CONVERSION_CACHE_PREFIX
+                )
+                if not runner.run_conversion(remote_cache=remote_cache, before_snowct=verify_license):
+                    raise Exception("The conversion command failed.")
+                self._record_converted()
+                stats = runner.cache_stats
+                st.caption(f"♻️ {stats['hits']} file(s) reused from the conversion cache "
+                           f"({stats['remote_hits']} from the shared cache), {stats['misses']} converted, "
+                           f"{stats['uploaded']} uploaded to the shared cache.")
+                if runner.failed_files:
+                    failed_names = ", ".join(os.path.basename(f) for f in runner.failed_files[:20])
+                    st.warning(f"⚠️ {len(runner.failed_files)} file(s) were in a failed conversion shard and were not converted: "
+                               f"{failed_names}{' …' if len(runner.failed_files) > 20 else ''}")
+
+                st.session_state.show_analytics = True
+
+                destination = "Azure is not configured; files are kept locally."
+                if self.blob_service_client:
+                    status.update(label="Uploading results to your Azure folder...")
+                    upload = self._upload_to_azure()
+                    destination = f"{upload.transferred + upload.skipped} files in your Azure folder."
+                    st.caption(f"☁️ Azure folder: {upload.summary()}")
+                    if upload.failed:
+                        st.warning(f"⚠️ {len(upload.failed)} file(s) could not be uploaded to your Azure folder.")
+                status.update(label=f"✅ Workflow Complete! {stats['misses']} converted, {stats['hits']} from cache. "
+                                    f"{destination}", state="complete")
+                st.session_state.step_completion['convert_procs'] = True
+                st.toast("Conversion successful.", icon="🚀")
 
             except Exception as e:
                 status.update(label=f"❌ Error: {e}", state="error")
@@ -222,6 +254,10 @@ class ConvertPage:
 
     def _display_blob_files(self):
         """Renders a list of files in Azure with download links."""
+        if not self.blob_service_client:
+            st.info("Azure Blob Storage is not configured (AZURE_STORAGE_CONNECTION_STRING is unset). "
+                    "Converted files are in `./converted_procedures/Output/SnowConvert`.")
+            return
         try:
             container_client = self.blob_service_client.get_container_client(self.container_name)
             blob_list = container_client.list_blobs(name_starts_with=self.blob_prefix)
@@ -284,6 +320,9 @@ class ConvertPage:
 
         with open(assessment_file_path, "r", encoding='utf-8') as f:
             content = f.read()
+        # The log accumulates every run; the dashboard covers the latest one
+        if RUN_MARKER in content:
+            content = RUN_MARKER + content.rsplit(RUN_MARKER, 1)[1]
 
         def parse_metrics(text):
             patterns = {
@@ -291,7 +330,8 @@ class ConvertPage:
                 "Total LOC": r"- Total lines of code:\s+(\d+)", "Auto-Conv %": r"- Automatically converted:\s+([\d\.]+%)",
                 "Time": r"- Conversion time:\s+([\d:\.]+)", "Speed (LOC/s)": r"- Conversion speed:\s+(\d+)\s+lines",
             }
-            data = {name: (match.group(1) if (match := re.search(p, text, re.M)) else "N/A") for name, p in patterns.items()}
+            # Last match: in a sharded run the combined summary follows the shards' own summaries
+            data = {name: (matches[-1] if (matches := re.findall(p, text, re.M)) else "N/A") for name, p in patterns.items()}
             return data
 
         data = parse_metrics(content)
@@ -304,5 +344,5 @@ class ConvertPage:
         c5.metric("Automatic Conversion", data["Auto-Conv %"])
         c6.metric("Speed (LOC/sec)", data["Speed (LOC/s)"])
 
-        with st.expander("View Full Assessment Report"):
+        with st.expander("View Assessment Report (latest run)"):
             st.code(content, language='text')
\ No newline at end of file
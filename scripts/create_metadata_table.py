@@ -1,16 +1,39 @@
 #!/usr/bin/env python3
 # from config import SNOWFLAKE_CONFIG, SQL_SERVER_CONFIG
 import streamlit as st
-from scripts.log import log_info
+from scripts.log import log_info, log_error
+from scripts.hashing import definition_hash
+from scripts.tsql_parser import parse_scripts
+from scripts.metadata_viewer import MetadataViewer
+from scripts.staging_store import StagingStore
+from scripts.dependency_graph import DEPENDENCY_TABLE, ensure_dependency_table
+from scripts.metadata_schema import DEFINITIONS_TABLE, ensure_metadata_tables, prune_definitions
 import pyodbc
-import snowflake.connector
-from datetime import datetime
+from snowflake.connector.pandas_tools import write_pandas
+from scripts.sf_session import acquire_session, release_session
+from scripts.snapshot_cache import invalidate_snapshots
 import pandas as pd
 import os
-import re
+import io
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 
 
 METADATA_TABLE = "procedures_metadata"
+# Session-scoped temp table used by the bulk load path in load_into_snowflake
+STAGE_TABLE = "PROCEDURES_METADATA_STAGE"
+STAGE_COLUMNS = ["SOURCE", "DBNAME", "SCHEMA_NAME", "PROCEDURE_NAME", "PROCEDURE_DEFINITION", "PARAMETERS", "DEFINITION_HASH"]
+# One modify_date high-water mark per SQL Server database, used by the incremental sync
+SYNC_STATE_TABLE = "sqlserver_sync_state"
+# Default number of rows per fetchmany() when streaming definitions from SQL Server
+FETCH_BATCH_SIZE = 500
+# Default number of SQL Server databases harvested concurrently
+HARVEST_MAX_WORKERS = 4
+# Rows per write_pandas upload when streaming the stage into Snowflake
+LOAD_BATCH_SIZE = 5000
+# Rows per page in the "View Staged Procedures" preview
+STAGE_PREVIEW_ROWS = 200
 # if "show_metadata_table" not in st.session_state:
 #     st.session_state.show_metadata_table = False
 
@@ -28,80 +51,87 @@ class CreateMetadataTable:
 
 
         if "show_metadata_table" not in st.session_state: st.session_state.show_metadata_table = False
-        if 'staged_procedures' not in st.session_state:
-            st.session_state.staged_procedures = []
-        # A set to quickly check for duplicates before adding to the stage
-        if 'staged_keys' not in st.session_state:
-            st.session_state.staged_keys = set()
+        # Staged procedures live in a per-session SQLite file; only its path and
+        # the row count are kept in session state
+        if 'staging_path' not in st.session_state:
+            st.session_state.staging_path = StagingStore.for_session(st.session_state.get("user_id")).path
+        if not os.path.exists(st.session_state.staging_path):
+            # Cleared, or purged as stale; the store recreates it empty
+            st.session_state.staged_count = 0
+        self.stage = StagingStore(st.session_state.staging_path)
+        if 'staged_count' not in st.session_state:
+            st.session_state.staged_count = self.stage.count()
+        # Watermarks/drop lists from an incremental SQL Server fetch, committed on load
+        if 'pending_sync' not in st.session_state:
+            st.session_state.pending_sync = []
+        # Per-database timing/error rows from the last SQL Server harvest
+        if 'harvest_report' not in st.session_state:
+            st.session_state.harvest_report = None
 
         pass
 
 
 
-    def fetch_sqlserver_procedures(self):
-        """Connects to SQL Server and returns a list of dicts with procedure metadata."""
-        # cfg = SQL_SERVER_CONFIG
+    def _sqlserver_conn_str(self, database=None):
+        """Builds the pyodbc connection string, optionally for a different database on the same server."""
         sql_server_config = self.sql_server_config
-    
-        conn_str = f"DRIVER={sql_server_config['driver']};SERVER={sql_server_config['server']};DATABASE={sql_server_config['database']};UID={sql_server_config['username']};PWD={sql_server_config['password']}"
-        rows = []
-                # Initialize cnxn and cursor to None to handle connection errors
+        database = database or sql_server_config['database']
+        return f"DRIVER={sql_server_config['driver']};SERVER={sql_server_config['server']};DATABASE={database};UID={sql_server_config['username']};PWD={sql_server_config['password']}"
+
+    def list_sqlserver_databases(self):
+        """
+        Returns the SQL Server databases to harvest.
+
+        SQL_SERVER_CONFIG may contain:
+          - "databases": a list of database names, or "*" to discover every
+            online user database from sys.databases.
+          - "database": the single database used when "databases" is absent.
+        """
+        databases = self.sql_server_config.get("databases")
+        if not databases:
+            return [self.sql_server_config['database']]
+        if databases != "*":
+            return list(databases)
+
         cnxn = None
-        cursor = None
         try:
-            cnxn = pyodbc.connect(conn_str)
+            cnxn = pyodbc.connect(self._sqlserver_conn_str())
             cursor = cnxn.cursor()
-        
-            # 1) Routines
-            # Get all stored procedures
-            
-            cursor.execute("""
-                SELECT 
-                  SPECIFIC_CATALOG AS dbname,
-                  SPECIFIC_SCHEMA  AS schema_name,
-                  SPECIFIC_NAME    AS procedure_name,
-                  ROUTINE_DEFINITION AS procedure_definition
-                FROM INFORMATION_SCHEMA.ROUTINES
-                WHERE ROUTINE_TYPE = 'PROCEDURE'
-            """)
-            procs = cursor.fetchall()
-        
-            # 2) Parameters 
-            # Get all parameters for the stored procedures 
+            # database_id 1-4 are master, tempdb, model and msdb
             cursor.execute("""
-                SELECT
-                  SPECIFIC_NAME      AS procedure_name,
-                  PARAMETER_MODE     AS mode,
-                  PARAMETER_NAME     AS name,
-                  DATA_TYPE          AS data_type,
-                  CHARACTER_MAXIMUM_LENGTH AS char_length
-                FROM INFORMATION_SCHEMA.PARAMETERS
-                ORDER BY SPECIFIC_NAME, ORDINAL_POSITION
+                SELECT name FROM sys.databases
+                WHERE database_id > 4 AND state_desc = 'ONLINE' AND HAS_DBACCESS(name) = 1
+                ORDER BY name
             """)
-            params = cursor.fetchall()
-        
-            # Group params by proc name
-            # Create a dictionary where the key is the procedure name and the value is a list of parameter descriptions
-            params_by_proc = {}
-            for p in params:
-                desc = f"{p.mode} {p.name} {p.data_type}"
-                if p.char_length is not None:
-                    desc += f"({p.char_length})"
-                params_by_proc.setdefault(p.procedure_name, []).append(desc)
-        
-            # Build result
-            # Create a list of dictionaries, each representing a procedure with its metadata and parameters
-            # rows = []
-            for r in procs:
-                pname = r.procedure_name
-                rows.append({
-                    "SOURCE":               "SQLServer",
-                    "DBNAME":               r.dbname,
-                    "SCHEMA_NAME":          r.schema_name,
-                    "PROCEDURE_NAME":       pname,
-                    "PROCEDURE_DEFINITION": r.procedure_definition,
-                    "PARAMETERS":           ", ".join(params_by_proc.get(pname, [])),
-                })
+            return [r.name for r in cursor.fetchall()]
+        except pyodbc.Error as ex:
+            st.error(f"Database error while discovering databases: {ex.args[0]}")
+            st.error(ex)
+            st.stop()
+        finally:
+            if cnxn:
+                cnxn.close()
+
+    def fetch_sqlserver_procedures(self, since=None, database=None):
+        """
+        Connects to SQL Server and returns a list of dicts with procedure metadata.
+
+        Args:
+            since (datetime, optional): If given, only procedures created or altered
+                after this `modify_date` watermark are returned (incremental sync).
+            database (str, optional): Database to read; defaults to SQL_SERVER_CONFIG["database"].
+        """
+        return list(self.iter_sqlserver_procedures(since=since, database=database))
+
+    def iter_sqlserver_procedures(self, since=None, batch_size=None, database=None):
+        """
+        Streams procedure metadata from SQL Server, yielding one dict at a time.
+        Database errors are reported in the UI and stop the script run.
+
+        See _iter_sqlserver_procedures for the details.
+        """
+        try:
+            yield from self._iter_sqlserver_procedures(since=since, batch_size=batch_size, database=database)
         except pyodbc.Error as ex:
             # Catch potential database errors and report them
             sqlstate = ex.args[0]
@@ -109,24 +139,385 @@ class CreateMetadataTable:
             st.error(ex)
             st.stop() # Stop execution if we can't connect
 
+    def _iter_sqlserver_procedures(self, since=None, batch_size=None, database=None):
+        """
+        Streams procedure metadata from SQL Server, yielding one dict at a time.
+
+        Definitions are read from `sys.sql_modules.definition` (NVARCHAR(MAX)),
+        unlike INFORMATION_SCHEMA.ROUTINES.ROUTINE_DEFINITION which is cut off at
+        4000 characters. Rows are pulled with `fetchmany` so only one batch of
+        definitions is held in memory at a time.
+
+        This variant raises pyodbc.Error instead of touching the UI, so it is safe
+        to call from worker threads.
+
+        Args:
+            since (datetime, optional): Only yield procedures altered after this watermark.
+            batch_size (int, optional): Rows per `fetchmany` round trip. Defaults to
+                SQL_SERVER_CONFIG["fetch_batch_size"] or FETCH_BATCH_SIZE.
+            database (str, optional): Database to read; defaults to SQL_SERVER_CONFIG["database"].
+        """
+        batch_size = batch_size or self.sql_server_config.get("fetch_batch_size", FETCH_BATCH_SIZE)
+    
+                # Initialize cnxn and cursor to None to handle connection errors
+        cnxn = None
+        cursor = None
+        try:
+            cnxn = pyodbc.connect(self._sqlserver_conn_str(database))
+            cursor = cnxn.cursor()
+
+            # modify_date doubles as the incremental sync watermark
+            since_filter = "AND p.modify_date > ?" if since else ""
+            since_args = (since,) if since else ()
+        
+            # 1) Parameters
+            # These are small, so load them up front and group them by (schema, proc)
+            # Create a dictionary where the key is the procedure and the value is a list of parameter descriptions
+            cursor.execute(f"""
+                SELECT
+                  PRM.SPECIFIC_SCHEMA    AS schema_name,
+                  PRM.SPECIFIC_NAME      AS procedure_name,
+                  PRM.PARAMETER_MODE     AS mode,
+                  PRM.PARAMETER_NAME     AS name,
+                  PRM.DATA_TYPE          AS data_type,
+                  PRM.CHARACTER_MAXIMUM_LENGTH AS char_length
+                FROM INFORMATION_SCHEMA.PARAMETERS PRM
+                JOIN sys.procedures p
+                  ON p.object_id = OBJECT_ID(QUOTENAME(PRM.SPECIFIC_SCHEMA) + '.' + QUOTENAME(PRM.SPECIFIC_NAME))
+                WHERE 1 = 1
+                {since_filter}
+                ORDER BY PRM.SPECIFIC_SCHEMA, PRM.SPECIFIC_NAME, PRM.ORDINAL_POSITION
+            """, *since_args)
+            params_by_proc = {}
+            for prm in cursor.fetchall():
+                desc = f"{prm.mode} {prm.name} {prm.data_type}"
+                if prm.char_length is not None:
+                    desc += f"({prm.char_length})"
+                params_by_proc.setdefault((prm.schema_name, prm.procedure_name), []).append(desc)
+
+            # 2) Routines
+            # Stream the full, untruncated definitions in batches
+            cursor.arraysize = batch_size
+            cursor.execute(f"""
+                SELECT
+                  DB_NAME()    AS dbname,
+                  s.name       AS schema_name,
+                  p.name       AS procedure_name,
+                  m.definition AS procedure_definition
+                FROM sys.procedures p
+                JOIN sys.schemas s     ON s.schema_id = p.schema_id
+                JOIN sys.sql_modules m ON m.object_id = p.object_id
+                WHERE 1 = 1
+                {since_filter}
+                ORDER BY s.name, p.name
+            """, *since_args)
+
+            while True:
+                batch = cursor.fetchmany(batch_size)
+                if not batch:
+                    break
+                for r in batch:
+                    # definition is NULL for procedures created WITH ENCRYPTION
+                    if r.procedure_definition is None:
+                        log_error(f"No definition available for {r.dbname}.{r.schema_name}.{r.procedure_name} (encrypted?).")
+                    yield {
+                        "SOURCE":               "SQLServer",
+                        "DBNAME":               r.dbname,
+                        "SCHEMA_NAME":          r.schema_name,
+                        "PROCEDURE_NAME":       r.procedure_name,
+                        "PROCEDURE_DEFINITION": r.procedure_definition or "",
+                        "PARAMETERS":           ", ".join(params_by_proc.get((r.schema_name, r.procedure_name), [])),
+                    }
         finally:
             if cursor:
                 cursor.close()
             if cnxn:
                 cnxn.close()
-        return rows
     
+    def _fetch_sqlserver_catalog_state(self, database=None):
+        """
+        Cheap catalog probe used by the incremental sync: returns the set of
+        (schema, procedure) keys that currently exist and the highest
+        `sys.procedures.modify_date`, without reading any definitions.
+        Raises pyodbc.Error on failure.
+        """
+        cnxn = None
+        cursor = None
+        try:
+            cnxn = pyodbc.connect(self._sqlserver_conn_str(database))
+            cursor = cnxn.cursor()
+            cursor.execute("""
+                SELECT s.name AS schema_name, p.name AS procedure_name, p.modify_date
+                FROM sys.procedures p
+                JOIN sys.schemas s ON s.schema_id = p.schema_id
+            """)
+            current_keys = set()
+            high_watermark = None
+            for r in cursor.fetchall():
+                current_keys.add((r.schema_name, r.procedure_name))
+                if high_watermark is None or r.modify_date > high_watermark:
+                    high_watermark = r.modify_date
+            return current_keys, high_watermark
+        finally:
+            if cursor:
+                cursor.close()
+            if cnxn:
+                cnxn.close()
+
+    def _fetch_sqlserver_dependencies(self, database=None):
+        """
+        Reads what every procedure references (other procedures, tables, views,
+        functions) from `sys.sql_expression_dependencies`. Unqualified references
+        resolve to the referenced object's schema, or the caller's schema when the
+        object cannot be resolved. Raises pyodbc.Error on failure.
+
+        Returns:
+            list[dict]: one dependency edge per row, keyed like DEPENDENCY_TABLE.
+        """
+        cnxn = None
+        cursor = None
+        try:
+            cnxn = pyodbc.connect(self._sqlserver_conn_str(database))
+            cursor = cnxn.cursor()
+            cursor.execute("""
+                SELECT DISTINCT
+                  DB_NAME()                                            AS dbname,
+                  s.name                                               AS schema_name,
+                  p.name                                               AS procedure_name,
+                  COALESCE(d.referenced_database_name, DB_NAME())      AS referenced_dbname,
+                  COALESCE(d.referenced_schema_name, OBJECT_SCHEMA_NAME(d.referenced_id), s.name) AS referenced_schema_name,
+                  d.referenced_entity_name                             AS referenced_name,
+                  COALESCE(o.type_desc, 'UNRESOLVED')                  AS referenced_type
+                FROM sys.sql_expression_dependencies d
+                JOIN sys.procedures p ON p.object_id = d.referencing_id
+                JOIN sys.schemas s    ON s.schema_id = p.schema_id
+                LEFT JOIN sys.objects o ON o.object_id = d.referenced_id
+                WHERE d.referenced_server_name IS NULL
+                  AND d.referenced_class_desc = 'OBJECT_OR_COLUMN'
+            """)
+            return [{
+                "DBNAME":                 r.dbname,
+                "SCHEMA_NAME":            r.schema_name,
+                "PROCEDURE_NAME":         r.procedure_name,
+                "REFERENCED_DBNAME":      r.referenced_dbname,
+                "REFERENCED_SCHEMA_NAME": r.referenced_schema_name,
+                "REFERENCED_NAME":        r.referenced_name,
+                "REFERENCED_TYPE":        r.referenced_type,
+            } for r in cursor.fetchall()]
+        finally:
+            if cursor:
+                cursor.close()
+            if cnxn:
+                cnxn.close()
+
+    def save_dependencies(self, dependencies_by_db):
+        """
+        Replaces the stored dependency edges of every harvested database in
+        procedure_dependencies, in one transaction.
+
+        Args:
+            dependencies_by_db (dict): {database: [edge dicts]}.
+        """
+        if not dependencies_by_db:
+            return
+        columns = ["DBNAME", "SCHEMA_NAME", "PROCEDURE_NAME", "REFERENCED_DBNAME",
+                   "REFERENCED_SCHEMA_NAME", "REFERENCED_NAME", "REFERENCED_TYPE"]
+        ctx = acquire_session(self.snowflake_config)
+        cs = ctx.cursor()
+        try:
+            ensure_dependency_table(cs)
+            cs.execute("BEGIN")
+            for database, edges in dependencies_by_db.items():
+                cs.execute(f"DELETE FROM {DEPENDENCY_TABLE} WHERE DBNAME = %s", (database,))
+                if edges:
+                    cs.executemany(
+                        f"INSERT INTO {DEPENDENCY_TABLE} ({', '.join(columns)}, LOAD_TIMESTAMP) "
+                        f"VALUES ({', '.join(['%s'] * len(columns))}, CURRENT_TIMESTAMP())",
+                        [tuple(e[c] for c in columns) for e in edges]
+                    )
+            ctx.commit()
+            log_info(f"🔗 Stored {sum(len(e) for e in dependencies_by_db.values())} dependency edge(s) "
+                     f"for {len(dependencies_by_db)} database(s).")
+        except Exception:
+            ctx.rollback()
+            raise
+        finally:
+            cs.close()
+            release_session(ctx)
+
+    def _ensure_sync_state_table(self, cs):
+        """Creates the table that stores one modify_date watermark per SQL Server database."""
+        cs.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SYNC_STATE_TABLE} (
+          SERVER_NAME         STRING,
+          DBNAME              STRING,
+          HIGH_WATERMARK      TIMESTAMP_NTZ(9),
+          LAST_SYNC_TIMESTAMP TIMESTAMP_NTZ(9)
+        )
+        """)
+
+    def _get_sync_states(self, databases):
+        """
+        Returns {database: (watermark, known_keys)} for the given SQL Server
+        databases: the stored modify_date high-water mark (None on first sync) and
+        the (schema, procedure) keys already loaded from it, used to detect drops.
+        Reads everything in two queries on a single Snowflake connection.
+        """
+        states = {db: (None, set()) for db in databases}
+        ctx = acquire_session(self.snowflake_config)
+        cs = ctx.cursor()
+        try:
+            self._ensure_sync_state_table(cs)
+            self._ensure_metadata_table(cs)
+            cs.execute(
+                f"SELECT DBNAME, HIGH_WATERMARK FROM {SYNC_STATE_TABLE} WHERE SERVER_NAME = %s",
+                (self.sql_server_config['server'],)
+            )
+            watermarks = {db: wm for db, wm in cs.fetchall()}
+
+            cs.execute(f"SELECT DBNAME, SCHEMA_NAME, PROCEDURE_NAME FROM {METADATA_TABLE} WHERE SOURCE = 'SQLServer'")
+            for db, sch, proc in cs.fetchall():
+                if db in states:
+                    states[db][1].add((sch, proc))
+
+            return {db: (watermarks.get(db), keys) for db, (_, keys) in states.items()}
+        finally:
+            cs.close()
+            release_session(ctx)
+
+    def _save_sync_state(self, cs, pending_sync):
+        """
+        Applies a pending incremental sync: removes procedures that were dropped
+        on SQL Server and advances the database's watermark. Only called once the
+        changed procedures themselves have been merged successfully.
+        """
+        database = pending_sync["database"]
+        dropped = pending_sync.get("dropped", [])
+        if dropped:
+            cs.executemany(
+                f"DELETE FROM {METADATA_TABLE} WHERE SOURCE = 'SQLServer' AND DBNAME = %s AND SCHEMA_NAME = %s AND PROCEDURE_NAME = %s",
+                [(database, sch, proc) for sch, proc in dropped]
+            )
+            prune_definitions(cs)
+            log_info(f"   → Procedures removed from {database} (dropped on SQL Server): {len(dropped)}")
+
+        if pending_sync.get("watermark") is not None:
+            self._ensure_sync_state_table(cs)
+            cs.execute(f"""
+                MERGE INTO {SYNC_STATE_TABLE} AS T
+                USING (SELECT %s AS SERVER_NAME, %s AS DBNAME, %s::TIMESTAMP_NTZ AS HIGH_WATERMARK) AS S
+                ON T.SERVER_NAME = S.SERVER_NAME AND T.DBNAME = S.DBNAME
+                WHEN MATCHED THEN UPDATE SET
+                    T.HIGH_WATERMARK = S.HIGH_WATERMARK,
+                    T.LAST_SYNC_TIMESTAMP = CURRENT_TIMESTAMP()
+                WHEN NOT MATCHED THEN INSERT (SERVER_NAME, DBNAME, HIGH_WATERMARK, LAST_SYNC_TIMESTAMP)
+                    VALUES (S.SERVER_NAME, S.DBNAME, S.HIGH_WATERMARK, CURRENT_TIMESTAMP())
+            """, (pending_sync["server"], database, pending_sync["watermark"]))
+            log_info(f"   → Sync watermark for {database} advanced to {pending_sync['watermark']}")
+
+    def _harvest_database(self, database, incremental, sync_state):
+        """
+        Worker for harvest_sqlserver_databases: fetches one database on its own
+        pyodbc connection and streams it into the staging store in fetchmany-sized
+        batches (each add() uses its own SQLite connection). Never touches the
+        Streamlit UI.
+
+        Returns:
+            dict: fetched/staged counts, pending_sync (None on a full fetch), timing and error details.
+        """
+        started = time.perf_counter()
+        result = {"database": database, "fetched": 0, "staged": 0, "pending_sync": None, "dropped": 0, "dependencies": None, "error": None}
+        try:
+            if incremental:
+                watermark, known_keys = sync_state
+                current_keys, high_watermark = self._fetch_sqlserver_catalog_state(database)
+                self._stream_to_stage(self._iter_sqlserver_procedures(since=watermark, database=database), result)
+                dropped = sorted(known_keys - current_keys)
+                result["dropped"] = len(dropped)
+                result["pending_sync"] = {
+                    "server": self.sql_server_config['server'],
+                    "database": database,
+                    "watermark": high_watermark,
+                    "dropped": dropped,
+                }
+                log_info(f"🔁 Incremental sync of {database} since {watermark or 'the beginning'}: "
+                         f"{result['fetched']} changed, {len(dropped)} dropped.")
+            else:
+                self._stream_to_stage(self._iter_sqlserver_procedures(database=database), result)
+                log_info(f"🔍 Fetched {result['fetched']} procedures from {database}.")
+            # The dependency graph is small, so it is always re-read in full
+            result["dependencies"] = self._fetch_sqlserver_dependencies(database)
+        except Exception as e:
+            result["error"] = str(e)
+            log_error(f"Failed to harvest procedures from {database}: {e}")
+        result["seconds"] = round(time.perf_counter() - started, 2)
+        return result
+
+    def _stream_to_stage(self, procs, result):
+        """Adds procs (an iterable) to the staging store one fetch batch at a time, counting into `result`."""
+        batch_size = self.sql_server_config.get("fetch_batch_size", FETCH_BATCH_SIZE)
+        batch = []
+        for proc in procs:
+            batch.append(proc)
+            if len(batch) >= batch_size:
+                result["staged"] += self.stage.add(batch)
+                result["fetched"] += len(batch)
+                batch = []
+        if batch:
+            result["staged"] += self.stage.add(batch)
+            result["fetched"] += len(batch)
+
+    def harvest_sqlserver_databases(self, databases, incremental=True):
+        """
+        Harvests procedures from several SQL Server databases concurrently, using a
+        bounded pool of pyodbc connections (SQL_SERVER_CONFIG["max_workers"],
+        default HARVEST_MAX_WORKERS).
+
+        Procedures are streamed straight into the staging store by the workers,
+        so definitions are never all held in memory.
+
+        Returns:
+            tuple: (fetched, staged, pending_syncs, dependencies, report) where
+                   fetched/staged count the procedures read and newly staged,
+                   pending_syncs holds the incremental
+                   watermarks to commit after loading, dependencies maps every
+                   successfully harvested database to its dependency edges, and
+                   report has one timing/error row per database.
+        """
+        sync_states = self._get_sync_states(databases) if incremental else {}
+        max_workers = max(1, min(self.sql_server_config.get("max_workers", HARVEST_MAX_WORKERS), len(databases)))
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(
+                lambda db: self._harvest_database(db, incremental, sync_states.get(db, (None, set()))),
+                databases
+            ))
+
+        fetched, staged, pending_syncs, dependencies, report = 0, 0, [], {}, []
+        for r in results:
+            fetched += r["fetched"]
+            staged += r["staged"]
+            if r["pending_sync"]:
+                pending_syncs.append(r["pending_sync"])
+            if r["dependencies"] is not None:
+                dependencies[r["database"]] = r["dependencies"]
+            report.append({
+                "Database": r["database"],
+                "Procedures": r["fetched"],
+                "Dropped": r["dropped"],
+                "Dependencies": len(r["dependencies"] or []),
+                "Seconds": r["seconds"],
+                "Status": f"❌ {r['error']}" if r["error"] else "✅ OK",
+            })
+        return fetched, staged, pending_syncs, dependencies, report
+
     def _add_procs_to_stage(self, procs_to_add):
-        """Adds a list of procedures to the staging area, avoiding duplicates."""
-        newly_added_count = 0
-        for proc in procs_to_add:
-            # Create a unique key for each procedure
-            proc_key = (proc['SOURCE'], proc['DBNAME'], proc['SCHEMA_NAME'], proc['PROCEDURE_NAME'])
-            if proc_key not in st.session_state.staged_keys:
-                st.session_state.staged_keys.add(proc_key)
-                st.session_state.staged_procedures.append(proc)
-                newly_added_count += 1
-        
+        """Adds procedures to the on-disk staging area, skipping (SOURCE, DBNAME, SCHEMA_NAME, PROCEDURE_NAME) duplicates."""
+        self._report_staged(self.stage.add(procs_to_add))
+
+    def _report_staged(self, newly_added_count):
+        st.session_state.staged_count += newly_added_count
+
         if newly_added_count > 0:
             st.toast(f"Added {newly_added_count} new procedures to the staging area.", icon="✅")
         else:
@@ -134,227 +525,304 @@ class CreateMetadataTable:
 
 
 
+    def _read_uploaded_scripts(self, uploaded_files):
+        """
+        Flattens the uploaded files into (name, bytes) pairs, expanding any `.zip`
+        archive into the `.sql` scripts it contains.
+        """
+        scripts = []
+        for uploaded_file in uploaded_files:
+            if not uploaded_file.name.lower().endswith(".zip"):
+                scripts.append((uploaded_file.name, uploaded_file.getvalue()))
+                continue
+            try:
+                with zipfile.ZipFile(io.BytesIO(uploaded_file.getvalue())) as archive:
+                    for member in archive.infolist():
+                        if member.is_dir() or not member.filename.lower().endswith(".sql"):
+                            continue
+                        scripts.append((os.path.basename(member.filename), archive.read(member)))
+            except zipfile.BadZipFile as e:
+                st.warning(f"Could not open archive {uploaded_file.name}: {e}")
+        return scripts
+
     def parse_procedures_from_files(self, uploaded_files, dbname, schema_name):
-        """Parses uploaded SQL files to extract procedure metadata."""
-        rows = []
+        """Parses uploaded SQL files (or .zip archives of them) to extract procedure metadata."""
         if not uploaded_files:
-            return rows
-        
-        # Regex to find the parameter block between parentheses after the procedure name.
-        # It looks for CREATE/ALTER PROCEDURE, then the name, then captures the content
-        # inside the parentheses, but only if it's followed by AS or BEGIN.
-        param_pattern = re.compile(
-            r"(?:CREATE|ALTER)\s+(?:PROCEDURE|PROC)\s+.*?"  # Match CREATE/ALTER PROC header
-            r"(?:\((.*?)\))?"                              # OPTIONALLY match and capture params inside ()
-            r"\s*(?:AS|BEGIN)",                            # Must be followed by AS or BEGIN
-            re.IGNORECASE | re.DOTALL
-        )
+            return []
 
-        for uploaded_file in uploaded_files:
-            try:
-                procedure_name = os.path.splitext(uploaded_file.name)[0]
-                procedure_definition = uploaded_file.getvalue().decode("utf-8")
-
-                parameters_str = ""
-                match = param_pattern.search(procedure_definition)
-
-                # if match:
-                if match and match.group(1) is not None:
-                    # Group 1 contains the content inside the parentheses.
-                    raw_params = match.group(1).strip()
-                    if raw_params:
-                        # Normalize whitespace: replace any sequence of whitespace chars
-                        # (including newlines, tabs) with a single space, then strip again.
-                        parameters_str = re.sub(r'\s+', ' ', raw_params).strip()
-                
-                rows.append({
-                    "SOURCE": "File Upload",
-                    "DBNAME": dbname,
-                    "SCHEMA_NAME": schema_name,
-                    "PROCEDURE_NAME": procedure_name,
-                    "PROCEDURE_DEFINITION": procedure_definition,
-                    "PARAMETERS": parameters_str, 
-                })
-            except Exception as e:
-                st.warning(f"Could not process file {uploaded_file.name}: {e}")
-        
+        scripts = self._read_uploaded_scripts(uploaded_files)
+        # The header scanner is linear-time; large uploads are spread over a process pool
+        rows, errors = parse_scripts(scripts, dbname, schema_name)
+        for error in errors:
+            st.warning(error)
         return rows
 
     #     """Connects to SQL Server and returns a list of dicts with procedure metadata."""
-    def load_into_snowflake(self,proc_list):
-        """Creates the target table if needed and bulk‐loads procedure metadata."""
+    def _ensure_metadata_table(self, cs):
+        """Creates the narrow procedures_metadata catalog and the procedure_definitions table (migrating old deployments)."""
+        ensure_metadata_tables(cs, self.snowflake_config)
+
+    def _bulk_merge(self, ctx, cs, proc_batches):
+        """
+        Streams proc_batches (an iterable of lists of procedures) into a temporary
+        table with one write_pandas upload (PUT/COPY under the hood) per batch, and
+        runs ONE set-based MERGE into the metadata table.
+
+        Returns:
+            tuple: (inserted_count, updated_count) as reported by the MERGE.
+        """
+        sf_cfg = self.snowflake_config
+
+        # The temp table only lives for this session, so nothing needs cleaning up.
+        cs.execute(f"""
+        CREATE OR REPLACE TEMPORARY TABLE {STAGE_TABLE} (
+          SOURCE                STRING,
+          DBNAME                STRING,
+          SCHEMA_NAME           STRING,
+          PROCEDURE_NAME        STRING,
+          PROCEDURE_DEFINITION  STRING,
+          PARAMETERS            STRING,
+          DEFINITION_HASH       STRING,
+          LOAD_ORDER            NUMBER
+        )
+        """)
+
+        load_order = 0
+        for batch in proc_batches:
+            df = pd.DataFrame(batch, columns=STAGE_COLUMNS)
+            df["LOAD_ORDER"] = range(load_order, load_order + len(df))
+            load_order += len(df)
+            success, _, nrows, _ = write_pandas(ctx, df, STAGE_TABLE, quote_identifiers=False)
+            if not success or nrows != len(df):
+                raise RuntimeError(f"Staging upload incomplete: {nrows} of {len(df)} rows written.")
+
+        # The staged batch may contain the same procedure twice (e.g. from SQL Server
+        # and from a file upload); MERGE requires one source row per target row, so
+        # keep only the most recently staged copy of each key.
+        latest_sql = f"""
+            SELECT SOURCE, DBNAME, SCHEMA_NAME, PROCEDURE_NAME, PROCEDURE_DEFINITION, PARAMETERS, DEFINITION_HASH
+            FROM {STAGE_TABLE}
+            QUALIFY ROW_NUMBER() OVER (
+                PARTITION BY DBNAME, SCHEMA_NAME, PROCEDURE_NAME ORDER BY LOAD_ORDER DESC
+            ) = 1
+        """
+
+        # 1) Definitions: only versions that are not stored yet are written
+        cs.execute(f"""
+            MERGE INTO {DEFINITIONS_TABLE} AS D
+            USING ({latest_sql}) AS S
+            ON D.DBNAME = S.DBNAME AND D.SCHEMA_NAME = S.SCHEMA_NAME
+               AND D.PROCEDURE_NAME = S.PROCEDURE_NAME AND D.DEFINITION_HASH = S.DEFINITION_HASH
+            WHEN NOT MATCHED THEN
+                INSERT (DBNAME, SCHEMA_NAME, PROCEDURE_NAME, DEFINITION_HASH, PROCEDURE_DEFINITION, LOAD_TIMESTAMP)
+                VALUES (S.DBNAME, S.SCHEMA_NAME, S.PROCEDURE_NAME, S.DEFINITION_HASH, S.PROCEDURE_DEFINITION, CURRENT_TIMESTAMP())
+        """)
+
+        # 2) Narrow catalog rows, which point at their definition through DEFINITION_HASH
+        merge_sql = f"""
+            MERGE INTO {METADATA_TABLE} AS T
+            USING ({latest_sql}) AS S
+            ON T.DBNAME = S.DBNAME AND T.SCHEMA_NAME = S.SCHEMA_NAME AND T.PROCEDURE_NAME = S.PROCEDURE_NAME
+            WHEN MATCHED AND (
+                T.DEFINITION_HASH IS DISTINCT FROM S.DEFINITION_HASH
+                OR T.PARAMETERS IS DISTINCT FROM S.PARAMETERS
+            ) THEN
+                UPDATE SET
+                    T.DEFINITION_HASH = S.DEFINITION_HASH,
+                    T.PARAMETERS = S.PARAMETERS,
+                    T.LOAD_TIMESTAMP = CURRENT_TIMESTAMP()
+            WHEN NOT MATCHED THEN
+                INSERT (
+                    SOURCE, DBNAME, SCHEMA_NAME, PROCEDURE_NAME,
+                    PARAMETERS, CONVERSION_FLAG, LOAD_TIMESTAMP, SNOWFLAKE_DBNAME,
+                    SNOWFLAKE_SCHEMA_NAME, IS_DEPLOYED, ERRORS, DEFINITION_HASH
+                )
+                VALUES (
+                    S.SOURCE, S.DBNAME, S.SCHEMA_NAME, S.PROCEDURE_NAME,
+                    S.PARAMETERS, FALSE, CURRENT_TIMESTAMP(), %s,
+                    %s, FALSE, '', S.DEFINITION_HASH
+                )
+            """
+        cs.execute(merge_sql, (sf_cfg['database'], sf_cfg['schema']))
+
+        # A MERGE returns a single row: (number of rows inserted, number of rows updated)
+        result_row = cs.fetchone()
+        inserted_count, updated_count = (result_row[0], result_row[1]) if result_row else (0, 0)
+
+        # 3) Drop definition versions that the catalog no longer points at
+        prune_definitions(cs)
+        ctx.commit()
+        return inserted_count, updated_count
+
+    def _row_by_row_merge(self, ctx, cs, proc_list):
+        """
+        Fallback path: one parameterized MERGE per procedure in proc_list (any
+        iterable). Slow (one round trip per row) but has no dependency on
+        write_pandas/PUT permissions.
+
+        Returns:
+            tuple: (inserted_count, updated_count)
+        """
         sf_cfg = self.snowflake_config
         inserted_count = 0
         updated_count = 0
-        ctx = snowflake.connector.connect(
-            user=sf_cfg['user'],
-            password=sf_cfg['password'],
-            account=sf_cfg['account'],
-            warehouse=sf_cfg['warehouse'],
-            database=sf_cfg['database'],
-            schema=sf_cfg['schema'],
-            role=sf_cfg['role']
-        )
+
+        definition_sql = f"""
+            MERGE INTO {DEFINITIONS_TABLE} AS D
+            USING (
+                SELECT
+                    %s AS DBNAME,
+                    %s AS SCHEMA_NAME,
+                    %s AS PROCEDURE_NAME,
+                    %s AS DEFINITION_HASH,
+                    %s AS PROCEDURE_DEFINITION
+            ) AS S
+            ON D.DBNAME = S.DBNAME AND D.SCHEMA_NAME = S.SCHEMA_NAME
+               AND D.PROCEDURE_NAME = S.PROCEDURE_NAME AND D.DEFINITION_HASH = S.DEFINITION_HASH
+            WHEN NOT MATCHED THEN
+                INSERT (DBNAME, SCHEMA_NAME, PROCEDURE_NAME, DEFINITION_HASH, PROCEDURE_DEFINITION, LOAD_TIMESTAMP)
+                VALUES (S.DBNAME, S.SCHEMA_NAME, S.PROCEDURE_NAME, S.DEFINITION_HASH, S.PROCEDURE_DEFINITION, CURRENT_TIMESTAMP())
+            """
+
+        merge_sql = f"""
+            MERGE INTO {METADATA_TABLE} AS T
+            USING (
+                SELECT
+                    %s AS SOURCE,
+                    %s AS DBNAME,
+                    %s AS SCHEMA_NAME,
+                    %s AS PROCEDURE_NAME,
+                    %s AS PARAMETERS,
+                    %s AS DEFINITION_HASH
+            ) AS S
+            ON T.DBNAME = S.DBNAME AND T.SCHEMA_NAME = S.SCHEMA_NAME AND T.PROCEDURE_NAME = S.PROCEDURE_NAME
+            WHEN MATCHED AND (
+                T.DEFINITION_HASH IS DISTINCT FROM S.DEFINITION_HASH
+                OR T.PARAMETERS IS DISTINCT FROM S.PARAMETERS
+            ) THEN
+                UPDATE SET
+                    T.DEFINITION_HASH = S.DEFINITION_HASH,
+                    T.PARAMETERS = S.PARAMETERS,
+                    T.LOAD_TIMESTAMP = CURRENT_TIMESTAMP()
+            WHEN NOT MATCHED THEN
+                INSERT (
+                    SOURCE, DBNAME, SCHEMA_NAME, PROCEDURE_NAME,
+                    PARAMETERS, CONVERSION_FLAG, LOAD_TIMESTAMP, SNOWFLAKE_DBNAME,
+                    SNOWFLAKE_SCHEMA_NAME, IS_DEPLOYED, ERRORS, DEFINITION_HASH
+                )
+                VALUES (
+                    S.SOURCE, S.DBNAME, S.SCHEMA_NAME, S.PROCEDURE_NAME,
+                    S.PARAMETERS, %s, CURRENT_TIMESTAMP(), %s,
+                    %s, FALSE, '', S.DEFINITION_HASH
+                )
+            """
+
+        for p in proc_list:
+            cs.execute(definition_sql, (
+                p["DBNAME"], p["SCHEMA_NAME"], p["PROCEDURE_NAME"],
+                p["DEFINITION_HASH"], p["PROCEDURE_DEFINITION"]
+            ))
+            params_tuple = (
+                # For USING clause (6 items)
+                p["SOURCE"],
+                p["DBNAME"],
+                p["SCHEMA_NAME"],
+                p["PROCEDURE_NAME"],
+                p["PARAMETERS"],
+                p["DEFINITION_HASH"],
+                # For WHEN NOT MATCHED -> INSERT clause (3 items)
+                False,                      # CONVERSION_FLAG
+                sf_cfg['database'],         # SNOWFLAKE_DBNAME
+                sf_cfg['schema']            # SNOWFLAKE_SCHEMA_NAME
+            )
+            cs.execute(merge_sql, params_tuple)
+
+            # The MERGE itself returns the (inserted, updated) row, no RESULT_SCAN needed
+            result_row = cs.fetchone()
+            if result_row:
+                rows_inserted, rows_updated = result_row[0], result_row[1]
+                inserted_count += rows_inserted
+                updated_count += rows_updated
+
+        prune_definitions(cs)
+        ctx.commit()
+        return inserted_count, updated_count
+
+    def _iter_load_batches(self, procs):
+        """
+        Yields the procedures to load in LOAD_BATCH_SIZE lists, each with its
+        DEFINITION_HASH. `procs` is either a StagingStore (streamed from disk)
+        or a plain list; either way it can be iterated more than once.
+        """
+        if isinstance(procs, StagingStore):
+            batches = procs.iter_batches(LOAD_BATCH_SIZE)
+        else:
+            batches = (procs[i:i + LOAD_BATCH_SIZE] for i in range(0, len(procs), LOAD_BATCH_SIZE))
+        for batch in batches:
+            # Fingerprint every definition at ingest so unchanged rows are skipped by the MERGE
+            yield [{**p, "DEFINITION_HASH": definition_hash(p["PROCEDURE_DEFINITION"])} for p in batch]
+
+    def load_into_snowflake(self, procs):
+        """
+        Creates the target table if needed and bulk‐loads procedure metadata.
+
+        Args:
+            procs: A StagingStore (the on-disk staging area, cleared after a
+                   successful load) or a list of procedure dicts.
+        """
+        ctx = acquire_session(self.snowflake_config)
         cs = ctx.cursor()
         try:
-            # create table
-            # Check if the table already exists
-            cs.execute(f"""
-            CREATE TABLE IF NOT EXISTS {METADATA_TABLE} (
-              SOURCE                STRING,
-              DBNAME                STRING,
-              SCHEMA_NAME           STRING,
-              PROCEDURE_NAME        STRING,
-              PROCEDURE_DEFINITION  STRING,
-              CONVERSION_FLAG       BOOLEAN,
-              LOAD_TIMESTAMP        TIMESTAMP_NTZ(9),
-              SNOWFLAKE_DBNAME      STRING,
-              SNOWFLAKE_SCHEMA_NAME STRING,
-              PARAMETERS            STRING,
-              IS_DEPLOYED           BOOLEAN,
-              ERRORS                STRING
-            )
-            """)
-        
-                # --- MODIFIED LOGIC: Use MERGE instead of INSERT ---
-            merge_sql = f"""
-                MERGE INTO {METADATA_TABLE} AS T
-                USING (
-                    SELECT
-                        %s AS SOURCE,
-                        %s AS DBNAME,
-                        %s AS SCHEMA_NAME,
-                        %s AS PROCEDURE_NAME,
-                        %s AS PROCEDURE_DEFINITION,
-                        %s AS PARAMETERS
-                ) AS S
-                ON T.SCHEMA_NAME = S.SCHEMA_NAME AND T.PROCEDURE_NAME = S.PROCEDURE_NAME
-                WHEN MATCHED THEN
-                    UPDATE SET
-                        T.PROCEDURE_DEFINITION = S.PROCEDURE_DEFINITION,
-                        T.PARAMETERS = S.PARAMETERS,
-                        T.LOAD_TIMESTAMP = CURRENT_TIMESTAMP()
-                WHEN NOT MATCHED THEN
-                    INSERT (
-                        SOURCE, DBNAME, SCHEMA_NAME, PROCEDURE_NAME, PROCEDURE_DEFINITION,
-                        PARAMETERS, CONVERSION_FLAG, LOAD_TIMESTAMP, SNOWFLAKE_DBNAME,
-                        SNOWFLAKE_SCHEMA_NAME, IS_DEPLOYED, ERRORS
-                    )
-                    VALUES (
-                        S.SOURCE, S.DBNAME, S.SCHEMA_NAME, S.PROCEDURE_NAME, S.PROCEDURE_DEFINITION,
-                        S.PARAMETERS, %s, CURRENT_TIMESTAMP(), %s,
-                        %s, '', FALSE, ''
-                    )
-                """
-    
-    
-    
-    
-            # insert_sql = f"""
-            # INSERT INTO {METADATA_TABLE} (
-            #   SOURCE, DBNAME, SCHEMA_NAME, PROCEDURE_NAME, PROCEDURE_DEFINITION,
-            #   CONVERSION_FLAG, LOAD_TIMESTAMP,
-            #   SNOWFLAKE_DBNAME, SNOWFLAKE_SCHEMA_NAME, SNOWFLAKE_DDL,
-            #   PARAMETERS, IS_DEPLOYED, ERRORS
-            # ) VALUES (
-            #   %s, %s, %s, %s, %s,
-            #   %s, CURRENT_TIMESTAMP(),
-            #   %s, %s, %s,
-            #   %s, %s, %s
-            # )
-            # """
-            # inserted_count = 0
-            # updated_count = 0
-    
-        
-            for p in proc_list:
-            #     cs.execute(merge_sql, (
-            #         p["SOURCE"],
-            #         p["DBNAME"],
-            #         p["SCHEMA_NAME"],
-            #         p["PROCEDURE_NAME"],
-            #         p["PROCEDURE_DEFINITION"],
-            #         False,                      # CONVERSION_FLAG
-            #         sf_cfg['database'],         # SNOWFLAKE_DBNAME
-            #         sf_cfg['schema'],           # SNOWFLAKE_SCHEMA_NAME
-            #         "",                         # SNOWFLAKE_DDL placeholder
-            #         p["PARAMETERS"],
-            #         False,                       # IS_DEPLOYED
-            #         ""                          # ERRORS
-            #     ))
-
-                params_tuple = (
-                    # For USING clause (6 items)
-                    p["SOURCE"],
-                    p["DBNAME"],
-                    p["SCHEMA_NAME"],
-                    p["PROCEDURE_NAME"],
-                    p["PROCEDURE_DEFINITION"],
-                    p["PARAMETERS"],
-                    # For WHEN NOT MATCHED -> INSERT clause (3 items)
-                    False,                      # CONVERSION_FLAG
-                    sf_cfg['database'],         # SNOWFLAKE_DBNAME
-                    sf_cfg['schema']            # SNOWFLAKE_SCHEMA_NAME
+            self._ensure_metadata_table(cs)
+
+            if isinstance(procs, StagingStore):
+                distinct_count = procs.count_targets()
+            else:
+                distinct_count = len({(p["DBNAME"], p["SCHEMA_NAME"], p["PROCEDURE_NAME"]) for p in procs})
+
+            # --- Fast path: batched uploads + one MERGE for the whole stage ---
+            try:
+                inserted_count, updated_count = self._bulk_merge(ctx, cs, self._iter_load_batches(procs))
+            except Exception as e:
+                ctx.rollback()
+                log_error(f"Bulk metadata load failed, falling back to row-by-row MERGE: {e}")
+                st.warning("⚠️ Bulk load failed, falling back to row-by-row loading. This may take a while.")
+                inserted_count, updated_count = self._row_by_row_merge(
+                    ctx, cs, (p for batch in self._iter_load_batches(procs) for p in batch)
                 )
-                cs.execute(merge_sql, params_tuple)
-    
 
-                result_scan_query = 'SELECT "number of rows inserted", "number of rows updated" FROM TABLE(RESULT_SCAN(LAST_QUERY_ID()))'
-                cs.execute(result_scan_query)
-                
-                # Fetch the single row of results
-                result_row = cs.fetchone()
-                if result_row:
-                    rows_inserted, rows_updated = result_row
-                    inserted_count += rows_inserted
-                    updated_count += rows_updated
-        
+            # Only advance the SQL Server watermark once its changes are safely merged
+            if st.session_state.get("pending_sync"):
+                for pending_sync in st.session_state.pending_sync:
+                    self._save_sync_state(cs, pending_sync)
+                ctx.commit()
+                st.session_state.pending_sync = []
 
-            ctx.commit()
             log_info(f"   → New procedures inserted: {inserted_count}")
             log_info(f"   → Existing procedures updated: {updated_count}")
-            st.success(f"Load complete! Inserted: {inserted_count}, Updated: {updated_count}")
+            unchanged_count = max(distinct_count - inserted_count - updated_count, 0)
+            log_info(f"   → Unchanged procedures skipped: {unchanged_count}")
+            st.success(f"Load complete! Inserted: {inserted_count}, Updated: {updated_count}, Unchanged: {unchanged_count}")
+            invalidate_snapshots(METADATA_TABLE, DEFINITIONS_TABLE)
 
                             # Clear the stage on successful load
-            st.session_state.staged_procedures = []
-            st.session_state.staged_keys = set()
+            if isinstance(procs, StagingStore):
+                procs.clear()
+                st.session_state.staged_count = 0
             st.session_state.show_metadata_table = True # Show the table after loading
         finally:
             cs.close()
-            ctx.close()
+            release_session(ctx)
     
 
 
     def show_metadata_table(self):
-        """Displays the metadata table from Snowflake."""
-        ctx = snowflake.connector.connect(**self.snowflake_config)
-
+        """Displays the metadata table from Snowflake, one server-side page at a time."""
         try:
-            df = pd.read_sql(f"SELECT * FROM {METADATA_TABLE} ORDER BY DBNAME, SCHEMA_NAME, PROCEDURE_NAME", ctx)
-
-            st.dataframe(
-                df,
-                use_container_width=True,
-                column_config={
-                    "CONVERSION_FLAG": st.column_config.TextColumn(
-                        "Conversion Flag",
-                        help="Set to `True` to mark this procedure for migration."
-                    ),
-                    "IS_DEPLOYED": st.column_config.TextColumn(
-                        "Is Deployed?",
-                        help="Indicates if the converted procedure has been deployed in Snowflake."
-                    )
-                    # Add any other boolean columns here if needed
-                },
-                hide_index=True # Hides the pandas index for a cleaner look
-            )
-
-            # st.dataframe(df, use_container_width=True)
+            # Cached pages need no session at all; misses borrow one from the pool
+            MetadataViewer(None, key_prefix="create_metadata", config=self.snowflake_config).render()
         except Exception as e:
             st.error(f"❌ Failed to fetch data: {e}")
-        finally:
-            # cs.close()
-            ctx.close()
     
 
 
@@ -390,24 +858,66 @@ class CreateMetadataTable:
         if self.sql_server_config:
             with st.container(border=True):
                 st.markdown("##### Source: SQL Server")
+                incremental = st.toggle(
+                    "Incremental sync",
+                    value=True,
+                    key="incremental_sync",
+                    help="Only fetch procedures created or altered since the last successful load, and remove procedures dropped on SQL Server."
+                )
                 if st.button("Fetch Procedures from SQL Server", use_container_width=True):
                     with st.spinner("Connecting to SQL Server..."):
-                        procs_from_db = self.fetch_sqlserver_procedures()
-                        self._add_procs_to_stage(procs_from_db)
+                        databases = self.list_sqlserver_databases()
+                        fetched, staged, pending_syncs, dependencies, report = self.harvest_sqlserver_databases(databases, incremental=incremental)
+                        st.session_state.harvest_report = report
+                        failed = [r["Database"] for r in report if r["Status"] != "✅ OK"]
+                        if failed:
+                            st.warning(f"⚠️ Could not harvest {len(failed)} database(s): {', '.join(failed)}. See the harvest report below.")
+                        try:
+                            self.save_dependencies(dependencies)
+                        except Exception as e:
+                            log_error(f"Failed to store procedure dependencies: {e}")
+                            st.warning(f"⚠️ Could not store the procedure dependency graph: {e}")
+
+                        if fetched:
+                            # Keep earlier pending watermarks for databases not in this harvest
+                            harvested = {p["database"] for p in pending_syncs}
+                            st.session_state.pending_sync = [
+                                p for p in st.session_state.pending_sync if p["database"] not in harvested
+                            ] + pending_syncs
+                            self._report_staged(staged)
+                        elif pending_syncs:
+                            # Nothing to stage, so apply drops and watermarks right away
+                            ctx = acquire_session(self.snowflake_config)
+                            try:
+                                with ctx.cursor() as cs:
+                                    for pending_sync in pending_syncs:
+                                        self._save_sync_state(cs, pending_sync)
+                                ctx.commit()
+                            finally:
+                                release_session(ctx)
+                            invalidate_snapshots(METADATA_TABLE)
+                            dropped = sum(len(p["dropped"]) for p in pending_syncs)
+                            st.toast(f"SQL Server catalog unchanged since last sync ({dropped} dropped procedure(s) removed).", icon="ℹ️")
+                        else:
+                            st.toast("No procedures were found on SQL Server.", icon="ℹ️")
+
+                if st.session_state.harvest_report:
+                    with st.expander(f"Last harvest: {len(st.session_state.harvest_report)} database(s)"):
+                        st.dataframe(pd.DataFrame(st.session_state.harvest_report), use_container_width=True, hide_index=True)
 
         # --- Source 2: File Upload ---
         with st.container(border=True):
             st.markdown("##### Source: File Upload")
             with st.form("file_upload_form"):
-                st.markdown("Upload one or more `.sql` files. The filename (without extension) will be used as the procedure name.")
+                st.markdown("Upload one or more `.sql` files, or `.zip` archives of them. Scripts are split on `GO` separators and every `CREATE PROCEDURE` block is staged under its own schema and name; a file without a procedure header is staged whole under its filename.")
                 col1, col2 = st.columns(2)
                 default_dbname = col1.text_input("Source Database Name", help="Logical DB name for these file-based procs.")
-                default_schema = col2.text_input("Source Schema Name", "dbo", help="Logical schema name for these file-based procs.")
+                default_schema = col2.text_input("Source Schema Name", "dbo", help="Schema used for file-based procs whose header does not name one.")
                 
-                uploaded_files = st.file_uploader("Upload Scripts", type=['sql'], accept_multiple_files=True, label_visibility="collapsed")
+                uploaded_files = st.file_uploader("Upload Scripts", type=['sql', 'zip'], accept_multiple_files=True, label_visibility="collapsed")
                 
                 if st.form_submit_button("Add Uploaded Files to Stage", use_container_width=True):
-                    if not uploaded_files: st.warning("Please upload at least one `.sql` file.")
+                    if not uploaded_files: st.warning("Please upload at least one `.sql` or `.zip` file.")
                     elif not default_dbname or not default_schema: st.warning("Please provide a source Database and Schema name.")
                     else:
                         procs_from_files = self.parse_procedures_from_files(uploaded_files, default_dbname, default_schema)
@@ -417,22 +927,27 @@ class CreateMetadataTable:
 
         # --- Staging Area and Load Action ---
         st.subheader("2. Load Staged Procedures")
-        if not st.session_state.staged_procedures:
+        if not st.session_state.staged_count:
             st.info("The staging area is empty. Add procedures from a source above.")
         else:
-            num_staged = len(st.session_state.staged_procedures)
+            num_staged = st.session_state.staged_count
             st.success(f"**{num_staged}** procedure(s) are in the staging area, ready to be loaded.")
 
             with st.expander("View Staged Procedures"):
-                st.dataframe(pd.DataFrame(st.session_state.staged_procedures), use_container_width=True, hide_index=True)
+                # Only one page of keys/parameters is read back from disk; definitions stay there
+                page_count = max(1, -(-num_staged // STAGE_PREVIEW_ROWS))
+                page = st.number_input("Page", min_value=1, max_value=page_count, value=1, key="staged_preview_page") if page_count > 1 else 1
+                st.dataframe(self.stage.preview(STAGE_PREVIEW_ROWS, (page - 1) * STAGE_PREVIEW_ROWS), use_container_width=True, hide_index=True)
+                st.caption(f"Page {page} of {page_count}")
             
             load_col, clear_col = st.columns(2)
             if load_col.button(f"**Prepare {num_staged} Procedures for Conversion**", type="primary", use_container_width=True):
-                self.load_into_snowflake(st.session_state.staged_procedures)
+                self.load_into_snowflake(self.stage)
             
             if clear_col.button("Clear Staging Area", use_container_width=True):
-                st.session_state.staged_procedures = []
-                st.session_state.staged_keys = set()
+                self.stage.clear()
+                st.session_state.staged_count = 0
+                st.session_state.pending_sync = []
                 st.toast("Staging area cleared.", icon="🗑️")
                 st.rerun() # Rerun to update the display immediately
         
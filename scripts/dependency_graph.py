@@ -0,0 +1,105 @@
+from scripts.log import log_info
+
+METADATA_TABLE = "procedures_metadata"
+# One row per (procedure -> referenced object) edge harvested from sys.sql_expression_dependencies
+DEPENDENCY_TABLE = "procedure_dependencies"
+
+
+def ensure_dependency_table(cs):
+    """Creates the procedure_dependencies table if it does not exist yet."""
+    cs.execute(f"""
+    CREATE TABLE IF NOT EXISTS {DEPENDENCY_TABLE} (
+      DBNAME                  STRING,
+      SCHEMA_NAME             STRING,
+      PROCEDURE_NAME          STRING,
+      REFERENCED_DBNAME       STRING,
+      REFERENCED_SCHEMA_NAME  STRING,
+      REFERENCED_NAME         STRING,
+      REFERENCED_TYPE         STRING,
+      LOAD_TIMESTAMP          TIMESTAMP_NTZ(9)
+    )
+    """)
+
+
+def compute_waves(nodes, edges):
+    """
+    Groups procedures into topologically sorted "waves": every procedure's callees
+    are in an earlier wave, so the procedures inside one wave can be extracted,
+    converted or deployed in parallel once the previous waves are done.
+
+    Args:
+        nodes: Iterable of procedure keys.
+        edges: Iterable of (caller, callee) key pairs. Edges touching a key that
+               is not in `nodes` (tables, unknown objects) and self-references
+               are ignored.
+
+    Returns:
+        tuple: (waves, cyclic) where waves is a list of sorted key lists and cyclic
+               is the sorted list of keys caught in (or waiting on) a dependency
+               cycle. Those keys are placed together in one final wave.
+    """
+    nodes = set(nodes)
+    callees = {node: set() for node in nodes}
+    callers = {node: set() for node in nodes}
+    for caller, callee in edges:
+        if caller in nodes and callee in nodes and caller != callee:
+            callees[caller].add(callee)
+            callers[callee].add(caller)
+
+    remaining = {node: len(deps) for node, deps in callees.items()}
+    waves = []
+    ready = sorted(node for node, count in remaining.items() if count == 0)
+    while ready:
+        waves.append(ready)
+        next_ready = []
+        for node in ready:
+            del remaining[node]
+            for caller in callers[node]:
+                remaining[caller] -= 1
+                if remaining[caller] == 0:
+                    next_ready.append(caller)
+        ready = sorted(next_ready)
+
+    cyclic = sorted(remaining)
+    if cyclic:
+        waves.append(cyclic)
+    return waves, cyclic
+
+
+def fetch_procedure_waves(cs):
+    """
+    Computes the deployment waves for every procedure in the metadata table from
+    the harvested procedure-to-procedure dependencies.
+
+    Returns:
+        tuple: (waves, cyclic) as returned by compute_waves, keyed by
+               (DBNAME, SCHEMA_NAME, PROCEDURE_NAME) in upper case (SQL Server
+               names are case-insensitive).
+    """
+    ensure_dependency_table(cs)
+    cs.execute(f"SELECT DBNAME, SCHEMA_NAME, PROCEDURE_NAME FROM {METADATA_TABLE}")
+    nodes = {tuple(str(v).upper() for v in row) for row in cs.fetchall()}
+    cs.execute(f"""
+        SELECT DBNAME, SCHEMA_NAME, PROCEDURE_NAME, REFERENCED_DBNAME, REFERENCED_SCHEMA_NAME, REFERENCED_NAME
+        FROM {DEPENDENCY_TABLE}
+    """)
+    edges = [
+        (tuple(str(v).upper() for v in row[:3]), tuple(str(v).upper() for v in row[3:]))
+        for row in cs.fetchall()
+    ]
+    waves, cyclic = compute_waves(nodes, edges)
+    log_info(f"🌊 {len(nodes)} procedures grouped into {len(waves)} dependency wave(s); {len(cyclic)} in cycles.")
+    return waves, cyclic
+
+
+def wave_by_procedure_name(waves):
+    """
+    Returns {PROCEDURE_NAME (upper case): wave index} for stages that only know
+    procedures by name (e.g. files named after the procedure). When the same name
+    exists in several schemas, the earliest wave wins.
+    """
+    index = {}
+    for i, wave in enumerate(waves):
+        for _, _, proc_name in wave:
+            index.setdefault(proc_name, i)
+    return index
@@ -1,78 +1,134 @@
 import os
-from snowflake.connector import connect, DictCursor
+from concurrent.futures import ThreadPoolExecutor
+from scripts.sf_session import acquire_session, release_session
 # from config import SNOWFLAKE_CONFIG  # import your Snowflake config
 from scripts.log import log_info, log_error
+from scripts.hashing import definition_hash
+from scripts.metadata_schema import METADATA_TABLE, definitions_join, ensure_metadata_tables
+from scripts.manifest import Manifest, proc_key
 
 # Constants
-# OUTPUT_DIR = "./extracted_procedures"
+OUTPUT_DIR = "./extracted_procedures"
+# Rows per fetchmany() round trip while streaming flagged definitions
+EXTRACT_BATCH_SIZE = 500
+# Threads writing .sql files concurrently
+EXTRACT_MAX_WORKERS = 4
+
+
+def _file_hash(path):
+    """Returns the content hash of a file on disk, or None if it does not exist."""
+    try:
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            return definition_hash(f.read())
+    except (FileNotFoundError, UnicodeDecodeError):
+        return None
+
+
+def _write_if_changed(path, content):
+    """Writes `content` to `path` unless the file already holds exactly that; returns True if written."""
+    if _file_hash(path) == definition_hash(content):
+        return False
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write(content)
+    return True
+
 
 class ExtractProcedures:
-    def __init__(self, config: dict):
+    def __init__(self, config: dict, conn=None, output_dir=OUTPUT_DIR):
+        """
+        Extraction engine shared by the Step 2 UI and headless runs: streams the
+        flagged definitions from Snowflake and writes one .sql file per procedure.
+
+        :param config: Application config (SNOWFLAKE_CONFIG is used when no connection is given).
+        :param conn: Optional open Snowflake connection to reuse; it is left open.
+        :param output_dir: Directory the .sql files are written to.
+        """
         if not config or "SNOWFLAKE_CONFIG" not in config:
             log_error("Configuration is missing or invalid.")
             raise ValueError("Configuration is missing or invalid.")
-        
+
         # Store the needed config parts as instance variables
-        self.snowflake_config = config["SNOWFLAKE_CONFIG"]  
-        
-        # os.makedirs("./extracted_procedures", exist_ok=True)  # Ensure logs directory exists
-        output_dir = "./extracted_procedures"
+        self.snowflake_config = config["SNOWFLAKE_CONFIG"]
+        self.conn = conn
         self.output_dir = output_dir
-        
+
         # 1. Ensure the output directory exists
         os.makedirs(self.output_dir, exist_ok=True)
 
-        # 2. Connect to Snowflake using config
-        self.ctx = connect(
-            user=self.snowflake_config['user'],
-            password=self.snowflake_config['password'],
-            account=self.snowflake_config['account'],
-            warehouse=self.snowflake_config['warehouse'],
-            database=self.snowflake_config['database'],
-            schema=self.snowflake_config['schema'],
-            role=self.snowflake_config['role']
-        )
-        self.cs = self.ctx.cursor(DictCursor)
-
-    def extract_procedures(self):
-        try:
-            # 3. Query for procedures where CONVERSION_FLAG is TRUE
-            self.cs.execute("""
-                SELECT 
-                    PROCEDURE_NAME, 
-                    PROCEDURE_DEFINITION 
-                FROM PROCEDURES_METADATA 
-                WHERE CONVERSION_FLAG = TRUE
-            """)
-            rows = self.cs.fetchall()
-            # 4. Write each procedure to a .sql file        
-            for row in rows:
-                proc_name = row["PROCEDURE_NAME"]
-                definition = row["PROCEDURE_DEFINITION"]
-        
-                # Replace special characters in filename
-                safe_name = "".join(c if c.isalnum() or c in ("_", "-") else "_" for c in proc_name)
-                file_path = os.path.join(self.output_dir, f"{safe_name}.sql")
-        
-                with open(file_path, "w", encoding="utf-8") as f:
-                    f.write(definition.strip() + "\n")
-        
-                log_info(f"Wrote {proc_name} → {file_path}")
-                self.cs = self.ctx.cursor(DictCursor)
-    
-        # 5. Close the cursor and connection
-        finally:
-            self.cs.close()    
-            self.ctx.close() 
-        
-    
-
-
-
-
+    def _connect(self):
+        # 2. Borrow a pooled Snowflake session for this config
+        return acquire_session(self.snowflake_config)
 
+    def extract_procedures(self, batch_size=EXTRACT_BATCH_SIZE, max_workers=EXTRACT_MAX_WORKERS):
+        """
+        Streams every procedure with CONVERSION_FLAG = TRUE in fetchmany batches and
+        writes the files through a small thread pool. Files whose content is already
+        identical are left untouched (so their mtimes survive), and .sql files of
+        procedures that are no longer flagged are removed.
 
+        File names come from the pipeline manifest, which also records the
+        procedure, path and content hash of every file for the later stages.
 
+        Returns:
+            dict: counts of "written", "unchanged" and "removed" files, and "total" flagged procedures.
+        """
+        counts = {"written": 0, "unchanged": 0, "removed": 0, "total": 0}
+        expected, extracted_keys = set(), set()
+        manifest = Manifest()
+        ctx = self.conn or self._connect()
+        cs = ctx.cursor()
+        try:
+            ensure_metadata_tables(cs, self.snowflake_config)
+            # 3. Query for procedures where CONVERSION_FLAG is TRUE
+            cs.execute(f"""
+                SELECT
+                    T.DBNAME,
+                    T.SCHEMA_NAME,
+                    T.PROCEDURE_NAME,
+                    D.PROCEDURE_DEFINITION
+                FROM {METADATA_TABLE} T
+                {definitions_join()}
+                WHERE T.CONVERSION_FLAG = TRUE
+                ORDER BY T.DBNAME, T.SCHEMA_NAME, T.PROCEDURE_NAME
+            """)
 
+            # 4. Write each batch of procedures to .sql files
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                while True:
+                    rows = cs.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    # Stable, collision-free file names (same-named procedures in other schemas get qualified)
+                    file_names = manifest.assign_file_names([(db, sch, proc) for db, sch, proc, _ in rows])
+                    jobs, records = [], []
+                    for dbname, schema_name, proc_name, definition in rows:
+                        counts["total"] += 1
+                        key = proc_key(dbname, schema_name, proc_name)
+                        file_path = os.path.join(self.output_dir, f"{file_names[key]}.sql")
+                        content = (definition or "").strip() + "\n"
+                        expected.add(file_path)
+                        extracted_keys.add(key)
+                        jobs.append((file_path, content))
+                        records.append((key, file_path, definition_hash(content)))
+                    for (file_path, _), written in zip(jobs, executor.map(lambda job: _write_if_changed(*job), jobs)):
+                        counts["written" if written else "unchanged"] += 1
+                        if written:
+                            log_info(f"Wrote {file_path}")
+                    manifest.record_extractions(records)
 
+            # 5. Remove files of procedures that are no longer flagged
+            manifest.clear_extracted_except(extracted_keys)
+            for entry in os.scandir(self.output_dir):
+                if entry.is_file() and entry.name.endswith(".sql") and entry.path not in expected:
+                    os.remove(entry.path)
+                    counts["removed"] += 1
+                    log_info(f"Removed {entry.path} (no longer flagged)")
 
+            log_info(f"Extraction complete: {counts['written']} written, {counts['unchanged']} unchanged, "
+                     f"{counts['removed']} removed ({counts['total']} flagged).")
+            return counts
+        # 6. Close the cursor (and return the session, if we borrowed it)
+        finally:
+            cs.close()
+            if self.conn is None:
+                release_session(ctx)
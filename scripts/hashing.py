@@ -0,0 +1,10 @@
+import hashlib
+
+# Content fingerprints shared by every stage of the pipeline.
+# definition_hash() must stay byte-for-byte compatible with Snowflake's
+# SHA2(PROCEDURE_DEFINITION, 256) so hashes computed in Python and in SQL agree.
+
+
+def definition_hash(definition) -> str:
+    """Returns the SHA-256 hex digest of a procedure definition (None is treated as empty)."""
+    return hashlib.sha256((definition or "").encode("utf-8")).hexdigest()
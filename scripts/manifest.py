@@ -0,0 +1,213 @@
+import os
+import sqlite3
+import hashlib
+
+# Workspace-level record of which file belongs to which procedure, for every stage
+MANIFEST_PATH = "./pipeline_manifest.sqlite"
+# Artifact columns, one per pipeline stage that writes files
+EXTRACTED, CONVERTED, PROCESSED = "EXTRACTED_PATH", "CONVERTED_PATH", "PROCESSED_PATH"
+STAGES = (EXTRACTED, CONVERTED, PROCESSED)
+ENTRY_COLUMNS = ["PROC_KEY", "DBNAME", "SCHEMA_NAME", "PROCEDURE_NAME", "FILE_NAME", "CONTENT_HASH"] + list(STAGES)
+
+
+def safe_file_name(name):
+    """Replaces characters that are not safe in file names."""
+    return "".join(c if c.isalnum() or c in ("_", "-") else "_" for c in name)
+
+
+def proc_key(dbname, schema_name, proc_name):
+    """Case-insensitive key of a procedure (SQL Server names are case-insensitive)."""
+    return f"{dbname}.{schema_name}.{proc_name}".lower()
+
+
+def _norm(path):
+    """Artifact paths are stored absolute, so './x/y.sql' and 'x/y.sql' look up the same entry."""
+    return os.path.abspath(str(path))
+
+
+class Manifest:
+    def __init__(self, path=MANIFEST_PATH):
+        """
+        SQLite manifest mapping each fully qualified procedure to its file name
+        stem, content hash and the artifact path it has at every stage
+        (extracted, converted, processed). Extraction writes it; every later
+        stage looks files and procedures up here instead of parsing file names.
+
+        :param path: Path of the SQLite manifest file.
+        """
+        self.path = path
+        conn = self._connect()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS procedures (
+                    PROC_KEY        TEXT PRIMARY KEY,
+                    DBNAME          TEXT,
+                    SCHEMA_NAME     TEXT,
+                    PROCEDURE_NAME  TEXT,
+                    FILE_NAME       TEXT UNIQUE COLLATE NOCASE,
+                    CONTENT_HASH    TEXT,
+                    EXTRACTED_PATH  TEXT,
+                    CONVERTED_PATH  TEXT,
+                    PROCESSED_PATH  TEXT
+                )
+            """)
+            for stage in STAGES:
+                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{stage.lower()} ON procedures ({stage})")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_procedure_name ON procedures (PROCEDURE_NAME COLLATE NOCASE)")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _connect(self):
+        # A new connection per call, so the manifest can be used from any thread
+        return sqlite3.connect(self.path)
+
+    def _fetch(self, where, params):
+        conn = self._connect()
+        try:
+            rows = conn.execute(f"SELECT {', '.join(ENTRY_COLUMNS)} FROM procedures WHERE {where}", params).fetchall()
+        finally:
+            conn.close()
+        return [dict(zip(ENTRY_COLUMNS, row)) for row in rows]
+
+    def assign_file_names(self, procedures):
+        """
+        Returns {proc_key: file name stem} for (dbname, schema_name, proc_name)
+        tuples. A procedure keeps the stem it was given before; new procedures
+        get their safe name, qualified with schema (then database, then a short
+        hash) only when that name is already taken by another procedure.
+        """
+        conn = self._connect()
+        try:
+            with conn:
+                assigned = {}
+                for dbname, schema_name, proc_name in procedures:
+                    key = proc_key(dbname, schema_name, proc_name)
+                    row = conn.execute("SELECT FILE_NAME FROM procedures WHERE PROC_KEY = ?", (key,)).fetchone()
+                    if row:
+                        assigned[key] = row[0]
+                        continue
+                    candidates = [
+                        safe_file_name(proc_name),
+                        safe_file_name(f"{schema_name}_{proc_name}"),
+                        safe_file_name(f"{dbname}_{schema_name}_{proc_name}"),
+                    ]
+                    candidates.append(f"{candidates[-1]}_{hashlib.sha256(key.encode('utf-8')).hexdigest()[:8]}")
+                    for stem in candidates:
+                        if not conn.execute("SELECT 1 FROM procedures WHERE FILE_NAME = ?", (stem,)).fetchone():
+                            break
+                    conn.execute(
+                        "INSERT INTO procedures (PROC_KEY, DBNAME, SCHEMA_NAME, PROCEDURE_NAME, FILE_NAME) VALUES (?, ?, ?, ?, ?)",
+                        (key, dbname, schema_name, proc_name, stem)
+                    )
+                    assigned[key] = stem
+                return assigned
+        finally:
+            conn.close()
+
+    def record_extractions(self, rows):
+        """Stores (proc_key, extracted path, content hash) for a batch of extracted files."""
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    f"UPDATE procedures SET {EXTRACTED} = ?, CONTENT_HASH = ? WHERE PROC_KEY = ?",
+                    [(_norm(path), content_hash, key) for key, path, content_hash in rows]
+                )
+        finally:
+            conn.close()
+
+    def clear_extracted_except(self, keep_keys):
+        """Forgets the extracted file of every procedure not in `keep_keys` (e.g. no longer flagged)."""
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("CREATE TEMP TABLE keep (PROC_KEY TEXT PRIMARY KEY)")
+                conn.executemany("INSERT OR IGNORE INTO keep VALUES (?)", [(k,) for k in keep_keys])
+                conn.execute(f"""
+                    UPDATE procedures SET {EXTRACTED} = NULL, CONTENT_HASH = NULL
+                    WHERE {EXTRACTED} IS NOT NULL AND PROC_KEY NOT IN (SELECT PROC_KEY FROM keep)
+                """)
+        finally:
+            conn.close()
+
+    def set_artifacts(self, stage, rows):
+        """Stores (file name stem, artifact path) pairs for one stage; a None path clears it."""
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    f"UPDATE procedures SET {stage} = ? WHERE FILE_NAME = ?",
+                    [(_norm(path) if path else None, stem) for stem, path in rows]
+                )
+        finally:
+            conn.close()
+
+    def sync_stage_dir(self, stage, directory, prefix=""):
+        """
+        Records, for every extracted procedure, whether `directory` holds its
+        `<prefix><file name>.sql` artifact (one directory scan, one batch update).
+
+        Returns:
+            int: the number of procedures with an artifact in `directory`.
+        """
+        present = {}
+        if os.path.isdir(directory):
+            for entry in os.scandir(directory):
+                if entry.is_file() and entry.name.endswith(".sql") and entry.name.startswith(prefix):
+                    present[entry.name[len(prefix):-4]] = entry.path
+        rows = [(e["FILE_NAME"], present.get(e["FILE_NAME"])) for e in self.entries()]
+        self.set_artifacts(stage, rows)
+        return sum(1 for _, path in rows if path)
+
+    def by_path(self, stage, path):
+        """Returns the entry whose `stage` artifact is `path`, or None."""
+        rows = self._fetch(f"{stage} = ?", (_norm(path),))
+        return rows[0] if rows else None
+
+    def by_file_name(self, file_name):
+        """Returns the entry with this file name stem, or None."""
+        rows = self._fetch("FILE_NAME = ?", (file_name,))
+        return rows[0] if rows else None
+
+    def by_procedure_name(self, proc_name):
+        """Returns every entry (any database/schema) for a procedure name, case-insensitively."""
+        return self._fetch("PROCEDURE_NAME = ? COLLATE NOCASE", (proc_name,))
+
+    def entries(self):
+        """Returns every procedure that currently has an extracted file."""
+        return self._fetch(f"{EXTRACTED} IS NOT NULL ORDER BY PROC_KEY", ())
+
+    def index(self, stage=PROCESSED):
+        """
+        Loads, in one query, every procedure with an extracted or `stage` file
+        into a ManifestIndex, for loops that look up many files at once.
+        """
+        return ManifestIndex(self._fetch(f"{EXTRACTED} IS NOT NULL OR {stage} IS NOT NULL", ()), stage)
+
+
+class ManifestIndex:
+    def __init__(self, entries, stage=PROCESSED):
+        """
+        In-memory snapshot of manifest entries with the same lookups as
+        Manifest.by_path / by_procedure_name, answered from dicts instead of a
+        SQLite query per file.
+
+        :param entries: Entry dicts (as returned by Manifest).
+        :param stage: The artifact column `by_path` looks paths up in.
+        """
+        self.stage = stage
+        self._by_path = {}
+        self._by_name = {}
+        for entry in entries:
+            if entry[stage]:
+                self._by_path[entry[stage]] = entry
+            self._by_name.setdefault(str(entry["PROCEDURE_NAME"]).lower(), []).append(entry)
+
+    def by_path(self, path):
+        """Returns the entry whose `stage` artifact is `path`, or None."""
+        return self._by_path.get(_norm(path))
+
+    def by_procedure_name(self, proc_name):
+        """Returns every entry (any database/schema) for a procedure name, case-insensitively."""
+        return self._by_name.get(proc_name.lower(), [])
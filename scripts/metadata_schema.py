@@ -0,0 +1,143 @@
+import threading
+from scripts.log import log_info
+from scripts.sf_session import config_key
+from scripts.snapshot_cache import invalidate_snapshots
+
+# Narrow catalog: one small row per procedure (flags, status, parameters, hash)
+METADATA_TABLE = "procedures_metadata"
+# Procedure source text, keyed by procedure and DEFINITION_HASH
+DEFINITIONS_TABLE = "procedure_definitions"
+
+# Targets (config, or account/database/schema) already brought up to date by this process
+_current_schemas = set()
+_current_schemas_lock = threading.Lock()
+
+
+def _schema_key(cs, config):
+    if config is not None:
+        return config_key(config)
+    conn = cs.connection
+    return f"{conn.account}:{conn.database}:{conn.schema}".lower()
+
+
+def reset_schema_cache():
+    """Forgets which targets are current, so the next ensure_metadata_tables() checks again."""
+    with _current_schemas_lock:
+        _current_schemas.clear()
+
+
+def ensure_metadata_tables(cs, config=None):
+    """
+    Creates the catalog and definitions tables if they do not exist yet, and
+    migrates a catalog from before the split (see migrate_definition_storage).
+    The DDL and migration probe run once per target per process; later calls
+    for the same config (or connection database/schema) cost no round trip.
+    """
+    key = _schema_key(cs, config)
+    with _current_schemas_lock:
+        if key in _current_schemas:
+            return
+    cs.execute(f"""
+    CREATE TABLE IF NOT EXISTS {METADATA_TABLE} (
+      SOURCE                STRING,
+      DBNAME                STRING,
+      SCHEMA_NAME           STRING,
+      PROCEDURE_NAME        STRING,
+      CONVERSION_FLAG       BOOLEAN,
+      LOAD_TIMESTAMP        TIMESTAMP_NTZ(9),
+      SNOWFLAKE_DBNAME      STRING,
+      SNOWFLAKE_SCHEMA_NAME STRING,
+      PARAMETERS            STRING,
+      IS_DEPLOYED           BOOLEAN,
+      ERRORS                STRING,
+      DEFINITION_HASH       STRING
+    )
+    """)
+    cs.execute(f"""
+    CREATE TABLE IF NOT EXISTS {DEFINITIONS_TABLE} (
+      DBNAME                STRING,
+      SCHEMA_NAME           STRING,
+      PROCEDURE_NAME        STRING,
+      DEFINITION_HASH       STRING,
+      PROCEDURE_DEFINITION  STRING,
+      LOAD_TIMESTAMP        TIMESTAMP_NTZ(9)
+    )
+    """)
+    # Tables created before DEFINITION_HASH existed
+    cs.execute(f"ALTER TABLE {METADATA_TABLE} ADD COLUMN IF NOT EXISTS DEFINITION_HASH STRING")
+    migrate_definition_storage(cs)
+    with _current_schemas_lock:
+        _current_schemas.add(key)
+
+
+def migrate_definition_storage(cs):
+    """
+    One-off migration for deployments whose procedures_metadata still carries
+    PROCEDURE_DEFINITION: backfills missing hashes, copies every definition into
+    procedure_definitions and drops the wide column from the catalog.
+
+    Returns:
+        bool: True if a migration was performed.
+    """
+    cs.execute("""
+        SELECT COUNT(*) FROM INFORMATION_SCHEMA.COLUMNS
+        WHERE TABLE_SCHEMA = CURRENT_SCHEMA()
+          AND TABLE_NAME = %s
+          AND COLUMN_NAME = 'PROCEDURE_DEFINITION'
+    """, (METADATA_TABLE.upper(),))
+    if not cs.fetchone()[0]:
+        return False
+
+    log_info(f"🚚 Moving procedure definitions out of {METADATA_TABLE} into {DEFINITIONS_TABLE}…")
+    cs.execute("BEGIN")
+    try:
+        cs.execute(f"""
+            UPDATE {METADATA_TABLE}
+               SET DEFINITION_HASH = SHA2(COALESCE(PROCEDURE_DEFINITION, ''), 256)
+             WHERE DEFINITION_HASH IS NULL
+        """)
+        cs.execute(f"""
+            INSERT INTO {DEFINITIONS_TABLE} (DBNAME, SCHEMA_NAME, PROCEDURE_NAME, DEFINITION_HASH, PROCEDURE_DEFINITION, LOAD_TIMESTAMP)
+            SELECT T.DBNAME, T.SCHEMA_NAME, T.PROCEDURE_NAME, T.DEFINITION_HASH, T.PROCEDURE_DEFINITION, T.LOAD_TIMESTAMP
+            FROM {METADATA_TABLE} T
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {DEFINITIONS_TABLE} D
+                WHERE D.DBNAME = T.DBNAME AND D.SCHEMA_NAME = T.SCHEMA_NAME
+                  AND D.PROCEDURE_NAME = T.PROCEDURE_NAME AND D.DEFINITION_HASH = T.DEFINITION_HASH
+            )
+            QUALIFY ROW_NUMBER() OVER (
+                PARTITION BY T.DBNAME, T.SCHEMA_NAME, T.PROCEDURE_NAME, T.DEFINITION_HASH ORDER BY T.LOAD_TIMESTAMP DESC
+            ) = 1
+        """)
+        moved = cs.fetchone()[0]
+        cs.execute("COMMIT")
+    except Exception:
+        cs.execute("ROLLBACK")
+        raise
+    # DDL commits implicitly, so the column is only dropped once the copy is committed
+    cs.execute(f"ALTER TABLE {METADATA_TABLE} DROP COLUMN PROCEDURE_DEFINITION")
+    invalidate_snapshots(METADATA_TABLE, DEFINITIONS_TABLE)
+    log_info(f"   → {moved} definition(s) moved; {METADATA_TABLE} is now a narrow catalog.")
+    return True
+
+
+def prune_definitions(cs):
+    """Deletes stored definitions that no catalog row points at any more (old versions, dropped procedures)."""
+    cs.execute(f"""
+        DELETE FROM {DEFINITIONS_TABLE} D
+        WHERE NOT EXISTS (
+            SELECT 1 FROM {METADATA_TABLE} T
+            WHERE T.DBNAME = D.DBNAME AND T.SCHEMA_NAME = D.SCHEMA_NAME
+              AND T.PROCEDURE_NAME = D.PROCEDURE_NAME AND T.DEFINITION_HASH = D.DEFINITION_HASH
+        )
+    """)
+
+
+def definitions_join(catalog_alias="T", definitions_alias="D"):
+    """Returns the JOIN clause that attaches the current definition to catalog rows."""
+    t, d = catalog_alias, definitions_alias
+    return (
+        f"JOIN {DEFINITIONS_TABLE} {d} "
+        f"ON {d}.DBNAME = {t}.DBNAME AND {d}.SCHEMA_NAME = {t}.SCHEMA_NAME "
+        f"AND {d}.PROCEDURE_NAME = {t}.PROCEDURE_NAME AND {d}.DEFINITION_HASH = {t}.DEFINITION_HASH"
+    )
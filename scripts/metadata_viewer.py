@@ -0,0 +1,180 @@
+# --- START OF FILE metadata_viewer.py ---
+
+import streamlit as st
+import pandas as pd
+from contextlib import contextmanager
+from scripts.log import log_error
+from scripts.metadata_schema import definitions_join
+from scripts.sf_session import snowflake_session
+from scripts.snapshot_cache import cached_read
+
+METADATA_TABLE = "procedures_metadata"
+
+# Catalog columns; the definition lives in procedure_definitions and is only fetched for the selected row
+SUMMARY_COLUMNS = [
+    "SOURCE", "DBNAME", "SCHEMA_NAME", "PROCEDURE_NAME", "PARAMETERS",
+    "CONVERSION_FLAG", "IS_DEPLOYED", "LOAD_TIMESTAMP",
+    "SNOWFLAKE_DBNAME", "SNOWFLAKE_SCHEMA_NAME", "ERRORS",
+]
+PAGE_SIZES = [25, 50, 100, 250]
+BOOL_FILTERS = {"All": None, "True": True, "False": False}
+
+
+class MetadataViewer:
+    def __init__(self, conn, key_prefix: str, config=None):
+        """
+        Server-side paginated viewer for the procedures_metadata table.
+
+        :param conn: An open Snowflake connection, or None to borrow pooled
+                     sessions only when a query actually has to run.
+        :param key_prefix: Prefix for widget/session keys, so the viewer can be
+                           embedded on more than one page.
+        :param config: SNOWFLAKE_CONFIG; when given, pages are served from the
+                       snapshot cache instead of being re-queried on every rerun.
+        """
+        self.conn = conn
+        self.config = config
+        self.key_prefix = key_prefix
+        self.page_key = f"{key_prefix}_mv_page"
+        self.filters_key = f"{key_prefix}_mv_filters"
+        if self.page_key not in st.session_state:
+            st.session_state[self.page_key] = 0
+
+    def _build_where(self, filters):
+        """Turns the filter widgets into a parameterized WHERE clause."""
+        clauses, params = [], []
+        if filters["db"]:
+            clauses.append("DBNAME ILIKE %s"); params.append(f"%{filters['db']}%")
+        if filters["schema"]:
+            clauses.append("SCHEMA_NAME ILIKE %s"); params.append(f"%{filters['schema']}%")
+        if filters["name"]:
+            clauses.append("PROCEDURE_NAME ILIKE %s"); params.append(f"%{filters['name']}%")
+        if filters["flag"] is not None:
+            clauses.append("COALESCE(CONVERSION_FLAG, FALSE) = %s"); params.append(filters["flag"])
+        if filters["deployed"] is not None:
+            clauses.append("COALESCE(IS_DEPLOYED, FALSE) = %s"); params.append(filters["deployed"])
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
+
+    @contextmanager
+    def _cursor(self):
+        if self.conn is not None:
+            with self.conn.cursor() as cs:
+                yield cs
+        else:
+            with snowflake_session(self.config) as conn:
+                with conn.cursor() as cs:
+                    yield cs
+
+    def _fetch_page(self, where, params, page, page_size):
+        """Returns (total_rows, DataFrame) for one page of summary rows."""
+        def load(cs):
+            cs.execute(f"SELECT COUNT(*) FROM {METADATA_TABLE} {where}", params)
+            total = cs.fetchone()[0]
+            cs.execute(
+                f"""
+                SELECT {', '.join(SUMMARY_COLUMNS)}
+                FROM {METADATA_TABLE} {where}
+                ORDER BY DBNAME, SCHEMA_NAME, PROCEDURE_NAME
+                LIMIT %s OFFSET %s
+                """,
+                params + [page_size, page * page_size]
+            )
+            return total, tuple(cs.fetchall())
+
+        if self.config is not None:
+            query_key = ("page", where, tuple(params), page, page_size)
+            total, rows = cached_read(self.config, METADATA_TABLE, query_key, load, conn=self.conn)
+        else:
+            with self._cursor() as cs:
+                total, rows = load(cs)
+        return total, pd.DataFrame(list(rows), columns=SUMMARY_COLUMNS)
+
+    def _fetch_definition(self, db, schema, proc):
+        """Loads a single PROCEDURE_DEFINITION on demand."""
+        with self._cursor() as cs:
+            cs.execute(
+                f"SELECT D.PROCEDURE_DEFINITION FROM {METADATA_TABLE} T {definitions_join()} "
+                f"WHERE T.DBNAME = %s AND T.SCHEMA_NAME = %s AND T.PROCEDURE_NAME = %s",
+                (db, schema, proc)
+            )
+            row = cs.fetchone()
+        return row[0] if row else ""
+
+    def render(self):
+        """Draws the filters, one page of results and the definition of the selected row."""
+        # --- Server-side filters ---
+        c1, c2, c3, c4, c5 = st.columns([2, 2, 2, 1, 1])
+        filters = {
+            "db": c1.text_input("Database", key=f"{self.key_prefix}_mv_db").strip(),
+            "schema": c2.text_input("Schema", key=f"{self.key_prefix}_mv_schema").strip(),
+            "name": c3.text_input("Procedure name contains", key=f"{self.key_prefix}_mv_name").strip(),
+            "flag": BOOL_FILTERS[c4.selectbox("Flagged", list(BOOL_FILTERS), key=f"{self.key_prefix}_mv_flag")],
+            "deployed": BOOL_FILTERS[c5.selectbox("Deployed", list(BOOL_FILTERS), key=f"{self.key_prefix}_mv_deployed")],
+        }
+        page_size = st.session_state.get(f"{self.key_prefix}_mv_page_size", PAGE_SIZES[0])
+
+        # Any filter or page size change starts again from the first page
+        signature = {**filters, "page_size": page_size}
+        if st.session_state.get(self.filters_key) != signature:
+            st.session_state[self.filters_key] = signature
+            st.session_state[self.page_key] = 0
+
+        page = st.session_state[self.page_key]
+        where, params = self._build_where(filters)
+
+        try:
+            total, df = self._fetch_page(where, params, page, page_size)
+        except Exception as e:
+            log_error(f"Failed to fetch metadata page: {e}")
+            st.error(f"❌ Failed to fetch data: {e}")
+            return
+
+        page_count = max(1, -(-total // page_size))
+        if page >= page_count:
+            # Rows were removed since the last rerun; jump back to the last page
+            st.session_state[self.page_key] = page_count - 1
+            st.rerun()
+
+        event = st.dataframe(
+            df,
+            use_container_width=True,
+            column_config={
+                "CONVERSION_FLAG": st.column_config.TextColumn(
+                    "Conversion Flag",
+                    help="Set to `True` to mark this procedure for migration."
+                ),
+                "IS_DEPLOYED": st.column_config.TextColumn(
+                    "Is Deployed?",
+                    help="Indicates if the converted procedure has been deployed in Snowflake."
+                )
+            },
+            hide_index=True, # Hides the pandas index for a cleaner look
+            on_select="rerun",
+            selection_mode="single-row",
+            key=f"{self.key_prefix}_mv_table",
+        )
+
+        # --- Pagination controls ---
+        prev_col, info_col, size_col, next_col = st.columns([1, 2, 1, 1])
+        if prev_col.button("◀ Previous", use_container_width=True, disabled=page == 0, key=f"{self.key_prefix}_mv_prev"):
+            st.session_state[self.page_key] = page - 1
+            st.rerun()
+        info_col.caption(f"Page {page + 1} of {page_count} · {total} procedure(s) match")
+        size_col.selectbox("Rows per page", PAGE_SIZES, key=f"{self.key_prefix}_mv_page_size", label_visibility="collapsed")
+        if next_col.button("Next ▶", use_container_width=True, disabled=page + 1 >= page_count, key=f"{self.key_prefix}_mv_next"):
+            st.session_state[self.page_key] = page + 1
+            st.rerun()
+
+        # --- Lazy definition for the selected row ---
+        selected_rows = event.selection.rows if event else []
+        if selected_rows and selected_rows[0] < len(df):
+            row = df.iloc[selected_rows[0]]
+            with st.expander(f"📄 `{row['DBNAME']}.{row['SCHEMA_NAME']}.{row['PROCEDURE_NAME']}`", expanded=True):
+                try:
+                    definition = self._fetch_definition(row["DBNAME"], row["SCHEMA_NAME"], row["PROCEDURE_NAME"])
+                    st.code(definition, language="sql", line_numbers=True)
+                except Exception as e:
+                    st.error(f"❌ Failed to load the definition: {e}")
+        else:
+            st.caption("Select a row to view its procedure definition.")
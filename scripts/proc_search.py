@@ -0,0 +1,72 @@
+import re
+from bisect import bisect_left
+
+# Search modes offered by the procedure selector
+SUBSTRING, PREFIX, REGEX = "Substring", "Prefix", "Regex"
+SEARCH_MODES = [SUBSTRING, PREFIX, REGEX]
+# Length of the n-grams in the substring index
+NGRAM = 3
+
+
+class ProcedureSearchIndex:
+    def __init__(self, names):
+        """
+        In-memory search index over procedure names, built once when the flow starts.
+
+        - Substring: a trigram inverted index; a query is answered by intersecting
+          the posting sets of its trigrams (smallest first) and verifying the few
+          remaining candidates.
+        - Prefix: a sorted list of lowercase names searched with bisect.
+        - Regex: a compiled pattern over the lowercase names.
+
+        All searches are case-insensitive and return row positions (0-based, in
+        the order of `names`), sorted ascending.
+
+        :param names: Sequence of procedure names.
+        """
+        self.names = [str(n).lower() for n in names]
+        self.postings = {}
+        for pos, name in enumerate(self.names):
+            for gram in {name[i:i + NGRAM] for i in range(len(name) - NGRAM + 1)}:
+                self.postings.setdefault(gram, []).append(pos)
+        self.sorted_names = sorted((name, pos) for pos, name in enumerate(self.names))
+
+    def _substring(self, query):
+        if len(query) < NGRAM:
+            # Too short for the trigram index; a plain scan is still cheap here
+            return [pos for pos, name in enumerate(self.names) if query in name]
+        grams = {query[i:i + NGRAM] for i in range(len(query) - NGRAM + 1)}
+        posting_lists = sorted((self.postings.get(g, []) for g in grams), key=len)
+        candidates = set(posting_lists[0])
+        for plist in posting_lists[1:]:
+            if not candidates:
+                break
+            candidates.intersection_update(plist)
+        return sorted(pos for pos in candidates if query in self.names[pos])
+
+    def _prefix(self, query):
+        matches = []
+        for i in range(bisect_left(self.sorted_names, (query,)), len(self.sorted_names)):
+            name, pos = self.sorted_names[i]
+            if not name.startswith(query):
+                break
+            matches.append(pos)
+        return sorted(matches)
+
+    def _regex(self, query):
+        pattern = re.compile(query, re.IGNORECASE)
+        return [pos for pos, name in enumerate(self.names) if pattern.search(name)]
+
+    def search(self, query, mode=SUBSTRING):
+        """
+        Returns the row positions whose name matches `query`, or None for an
+        empty query (no filtering). Raises re.error for an invalid regex.
+        """
+        if not query:
+            return None
+        if mode == REGEX:
+            return self._regex(query)
+        query = query.lower()
+        if mode == PREFIX:
+            return self._prefix(query)
+        return self._substring(query)
@@ -7,6 +7,7 @@ from pathlib import Path
 from scripts.py_test import run_single_test
 from scripts.py_output import PyOutput 
 from scripts import py_test
+from scripts.manifest import Manifest, PROCESSED, EXTRACTED
 import importlib   
 import unittest
 import io
@@ -140,11 +141,17 @@ class ProcessProcsPage:
             if not converted_files:
                 st.info("No converted SQL files found to compare."); return
 
+            # One manifest read per render; every file below is looked up in memory
+            manifest = Manifest().index(PROCESSED)
             rich_options = []
             for filename in converted_files:
-                # The procedure name is the filename without '.sql'
-                proc_name = filename[:-4]
-                proc_name = re.match(r"^processed_(.*)$", proc_name).group(1) if re.match(r"^processed_(.*)$", proc_name) else None
+                entry = manifest.by_path(self.processed_dir / filename)
+                if entry:
+                    proc_name = entry["PROCEDURE_NAME"]
+                else:
+                    # Not in the manifest: the procedure name is the filename without 'processed_' and '.sql'
+                    proc_name = filename[:-4]
+                    proc_name = re.match(r"^processed_(.*)$", proc_name).group(1) if re.match(r"^processed_(.*)$", proc_name) else None
 
                 status_icon = status_map.get(proc_name, "❔") # Default to '?' if no status found
                 
@@ -166,8 +173,11 @@ class ProcessProcsPage:
             # Display the comparison/editor if a file is selected and loaded
             if st.session_state.editable_file_path:
                 # original_file_path = self.extracted_dir / Path(st.session_state.editable_file_path).name
+                entry = manifest.by_path(st.session_state.editable_file_path)
                 match = re.match(r"^processed_(.*)$", Path(st.session_state.editable_file_path).name)
-                if match:
+                if entry and entry[EXTRACTED]:
+                    original_file_path = Path(entry[EXTRACTED])
+                elif match:
                     original_filename = match.group(1)
                     original_file_path = self.extracted_dir / original_filename
                 else:
@@ -2,6 +2,7 @@ import re
 import os
 from pathlib import Path
 from scripts.log import log_info,log_error
+from scripts.manifest import Manifest, PROCESSED
 
 
 class ScScriptProcessor:
@@ -140,6 +141,7 @@ class ScScriptProcessor:
 
     def process_all_files(self):
         """Processes all SQL files in the input folder and saves the processed versions."""
+        processed = []
         for sql_file in self.input_folder.glob("*.sql"):
             with sql_file.open("r", encoding="utf-8-sig") as file:
                 sql_script = file.read()
@@ -151,8 +153,12 @@ class ScScriptProcessor:
             with output_file_path.open("w", encoding="utf-8") as output_file:
                 output_file.write(processed_sql)
 
+            processed.append((sql_file.stem, output_file_path))
             log_info(f"Processed: {sql_file.name} → {output_file_path.name}")
 
+        # Let the test and publish stages find each processed file's procedure
+        Manifest().set_artifacts(PROCESSED, processed)
+
 
 
 
@@ -1,6 +1,6 @@
 # --- START OF FILE py_output.py ---
 import streamlit as st
-import snowflake.connector
+from scripts.snapshot_cache import cached_read
 import sys
 
 # It's better to import config here rather than assuming it's globally available
@@ -25,9 +25,19 @@ class PyOutput:
         # but hardcoding is fine for this example.
         self.PYUNIT_OUTPUT_TABLE = "TEST_RESULTS_LOG"
 
+    def _query_results(self, cursor):
+        # Execute the query
+        cursor.execute(f"SELECT * FROM {self.PYUNIT_OUTPUT_TABLE} ORDER BY TEST_TIMESTAMP DESC")
+
+        # Fetch all results, with the column headers from the cursor description
+        return tuple(cursor.fetchall()), tuple(desc[0] for desc in cursor.description)
+
     def display_PyOutput(self):
         """
-        Connects to Snowflake and fetches all records from the test log table.
+        Fetches all records from the test log table. This runs on every
+        comparison-viewer rerun, so results come from the snapshot cache until
+        its TTL passes or a test run writes new results; only then is a pooled
+        Snowflake session borrowed.
 
         Returns:
             tuple: A tuple containing:
@@ -35,39 +45,15 @@ class PyOutput:
                    - list: A list of strings representing the column headers.
         """
         try:
-            conn = snowflake.connector.connect(
-                user=self.snowflake_config['user'],
-                password=self.snowflake_config['password'],
-                account=self.snowflake_config['account'],
-                warehouse=self.snowflake_config['warehouse'],
-                database=self.snowflake_config['database'],
-                schema=self.snowflake_config['schema']
+            results, column_names = cached_read(
+                self.snowflake_config, self.PYUNIT_OUTPUT_TABLE, "all_results", self._query_results
             )
-        except Exception as e:
-            print(f"Error connecting to Snowflake: {e}", file=sys.stderr)
-            # Return empty values on connection failure
-            return [], []
-
-        cursor = conn.cursor()
-        try:
-            # Execute the query
-            cursor.execute(f"SELECT * FROM {self.PYUNIT_OUTPUT_TABLE} ORDER BY TEST_TIMESTAMP DESC")
-
-            # Fetch all results
-            results = cursor.fetchall()
-
-            # Get column headers from the cursor description
-            column_names = [desc[0] for desc in cursor.description]
-
         except Exception as e:
             print(f"Error querying table {self.PYUNIT_OUTPUT_TABLE}: {e}", file=sys.stderr)
+            # Return empty values on connection or query failure
             return [], []
-        finally:
-            # Always ensure the connection is closed
-            cursor.close()
-            conn.close()
 
-        return results, column_names
+        return list(results), list(column_names)
 
 if __name__ == "__main__":
     py_output = PyOutput()
@@ -1,12 +1,16 @@
-import snowflake.connector
+from scripts.sf_session import acquire_session, release_session
+from scripts.snapshot_cache import invalidate_snapshots
 import unittest
 import os
 import io
 import sys
 import re
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timezone
 # from config import SNOWFLAKE_CONFIG
 from scripts.log import log_info,log_error
+from scripts.manifest import Manifest, PROCESSED
 import sqlparse
 
 
@@ -24,10 +28,57 @@ import sqlparse
 
 test_case_id_counter = 0
 CONFIG = None
+# ManifestIndex of the processed files, set by the runner for the whole run (read per test if None)
+MANIFEST_INDEX = None
 
 # Global list to store test results
 test_results = []
 
+# Test files of one dependency wave run on several threads (see run_py_tests);
+# these guard the module state they share
+_counter_lock = threading.Lock()
+_report_lock = threading.Lock()
+_capture_lock = threading.Lock()
+_capture_users = 0
+
+
+class _ThreadRoutedStream(io.TextIOBase):
+    """sys.stdout/sys.stderr stand-in that sends each thread's writes to that thread's capture buffer."""
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+        self.local = threading.local()
+
+    def write(self, text):
+        return (getattr(self.local, "buffer", None) or self.fallback).write(text)
+
+    def flush(self):
+        (getattr(self.local, "buffer", None) or self.fallback).flush()
+
+
+_stdout_router = _ThreadRoutedStream(sys.__stdout__)
+_stderr_router = _ThreadRoutedStream(sys.__stderr__)
+
+
+@contextmanager
+def _captured_output():
+    """Captures stdout and stderr of the calling thread only, so concurrent tests do not mix output."""
+    global _capture_users
+    buffer = io.StringIO()
+    with _capture_lock:
+        if _capture_users == 0:
+            sys.stdout, sys.stderr = _stdout_router, _stderr_router
+        _capture_users += 1
+    _stdout_router.local.buffer = _stderr_router.local.buffer = buffer
+    try:
+        yield buffer
+    finally:
+        _stdout_router.local.buffer = _stderr_router.local.buffer = None
+        with _capture_lock:
+            _capture_users -= 1
+            if _capture_users == 0:
+                sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__
+
 # Snowflake DDL target table
 # PYUNIT_OUTPUT_TABLE = "TEST_RESULTS_LOG"
 # METADATA_TABLE = "PROCEDURES_METADATA"
@@ -229,12 +280,12 @@ class TestStoredProcedure(unittest.TestCase):
             # This will cause tests to fail with a clear message if config isn't set
             raise ValueError("Snowflake configuration not provided to the test module.")
         
-        # Establish the connection ONCE and store it on the class
+        # Borrow a pooled session ONCE per suite; consecutive files reuse the same login
         if cls.conn is None or cls.conn.is_closed():
             try:
-                cls.conn = snowflake.connector.connect(**CONFIG["SNOWFLAKE_CONFIG"])
+                cls.conn = acquire_session(CONFIG["SNOWFLAKE_CONFIG"])
                 cls.cursor = cls.conn.cursor()
-                log_info("Snowflake connection established for testing.")
+                log_info("Snowflake session acquired for testing.")
             except Exception as e:
                 # This makes debugging connection errors much easier
                 raise ConnectionError(f"Failed to connect to Snowflake for testing: {e}") from e
@@ -258,20 +309,27 @@ class TestStoredProcedure(unittest.TestCase):
             log_info("Ensured TEST_RESULTS_LOG table exists.")
         except Exception as e:
             log_error(f"Error creating TEST_RESULTS_LOG table: {e}")
+            # tearDownClass does not run after a failed setUpClass; hand the session back here
+            cls.cursor.close()
+            release_session(cls.conn, discard=True)
+            cls.conn, cls.cursor = None, None
             raise
 
     @classmethod
     def tearDownClass(cls):
-        """Close the connection after tests."""
+        """Hand the session back to the pool after tests."""
         if cls.cursor:
             cls.cursor.close()
-        if cls.conn and not cls.conn.is_closed():
-            cls.conn.close()
-            log_info("Snowflake connection closed.")
+        if cls.conn:
+            release_session(cls.conn)
+            log_info("Snowflake session released.")
+        # This run wrote test results and IS_DEPLOYED flags; cached reads of both are stale
+        invalidate_snapshots("TEST_RESULTS_LOG", "PROCEDURES_METADATA")
         # Reset class state for any subsequent runs from the UI
         cls.conn = None # <-- CRITICAL RESET
         cls.cursor = None
-        generate_html_report(results=test_results)
+        with _report_lock:
+            generate_html_report(results=list(test_results))
 
 
     def setUp(self):
@@ -280,8 +338,21 @@ class TestStoredProcedure(unittest.TestCase):
         self.assertIsNotNone(self.sql_file, "sql_file was not set on the test instance.")
         
         filename = os.path.basename(self.sql_file)
-        
-        # --- ROBUST REGEX LOGIC ---
+
+        # --- MANIFEST LOOKUP ---
+        # The pipeline manifest knows exactly which procedure a processed file belongs to
+        manifest = MANIFEST_INDEX if MANIFEST_INDEX is not None else Manifest().index(PROCESSED)
+        entry = manifest.by_path(self.sql_file)
+        self.dbname = entry["DBNAME"] if entry else None
+        self.schema_name = entry["SCHEMA_NAME"] if entry else None
+        self.PYUNIT_OUTPUT_TABLE = "TEST_RESULTS_LOG"
+        self.METADATA_TABLE = "PROCEDURES_METADATA"
+        if entry:
+            self.proc_name = entry["PROCEDURE_NAME"]
+            log_info(f"Setting up test for procedure: '{self.schema_name}.{self.proc_name}' from file: '{filename}'")
+            return
+
+        # --- ROBUST REGEX LOGIC (files not in the manifest) ---
         # Try the pattern with an underscore first
         match = re.match(r'.*_(?P<proc>[^.]+)\.sql$', filename)
         
@@ -302,9 +373,6 @@ class TestStoredProcedure(unittest.TestCase):
         
         # Log this for debugging purposes
         log_info(f"Setting up test for procedure: '{self.proc_name}' from file: '{filename}'")
-        
-        self.PYUNIT_OUTPUT_TABLE = "TEST_RESULTS_LOG"
-        self.METADATA_TABLE = "PROCEDURES_METADATA"
 
 
 
@@ -333,24 +401,20 @@ class TestStoredProcedure(unittest.TestCase):
 
 
         # --- 2) Increment counter and create ID ---
-        test_case_id_counter += 1
-        test_case_id = str(test_case_id_counter)
+        with _counter_lock:
+            test_case_id_counter += 1
+            test_case_id = str(test_case_id_counter)
 
         """Runs a test function and captures its output."""
-        output_capture = io.StringIO()
-        sys.stdout = output_capture
-        sys.stderr = output_capture  # Capture errors as well
-
-        try:
-            test_func()
-            status = "✅ Success"
-            reason = "-"
-        except Exception as e:
-            status = "❌ Failed"
-            reason = str(e)
-
-        sys.stdout = sys.__stdout__  # Restore standard output
-        sys.stderr = sys.__stderr__  # Restore error output
+        # Errors are captured as well; only this thread's output is redirected
+        with _captured_output() as output_capture:
+            try:
+                test_func()
+                status = "✅ Success"
+                reason = "-"
+            except Exception as e:
+                status = "❌ Failed"
+                reason = str(e)
 
         test_results.append((self.proc_name, test_name, status, reason, output_capture.getvalue()))
 
@@ -434,14 +498,22 @@ class TestStoredProcedure(unittest.TestCase):
                 UPDATE {self.METADATA_TABLE}
                    SET IS_DEPLOYED = TRUE
                  WHERE PROCEDURE_NAME = %s
-                """
-                self.cursor.execute(update_sql, (clean_proc_name))
+                """ + self._procedure_scope_sql()
+                self.cursor.execute(update_sql, (clean_proc_name, *self._procedure_scope_params()))
                 self.conn.commit()
                 log_info(f"Marked {self.proc_name} as deployed in {self.METADATA_TABLE}")
             except Exception as upd_e:
                 log_error(f"Failed to update IS_DEPLOYED for {clean_proc_name}: {upd_e}")
 
 
+    def _procedure_scope_sql(self):
+        """Narrows a metadata lookup to the procedure's database and schema when the manifest knows them."""
+        return " AND DBNAME = %s AND SCHEMA_NAME = %s" if self.dbname is not None else ""
+
+    def _procedure_scope_params(self):
+        return (self.dbname, self.schema_name) if self.dbname is not None else ()
+
+
     def test_create_procedure_from_file(self):
         def test_logic():
             with open(self.sql_file, "r") as file:
@@ -458,8 +530,8 @@ class TestStoredProcedure(unittest.TestCase):
 
         # 2) Fetch its PARAMETERS definition from Snowflake metadata:
         self.cursor.execute(
-            "SELECT PARAMETERS FROM PROCEDURES_METADATA WHERE PROCEDURE_NAME = %s",
-            (self.proc_name,)
+            "SELECT PARAMETERS FROM PROCEDURES_METADATA WHERE PROCEDURE_NAME = %s" + self._procedure_scope_sql(),
+            (self.proc_name, *self._procedure_scope_params())
         )
         row = self.cursor.fetchone()
         params_str = row[0] if row and row[0] else ""
@@ -6,7 +6,16 @@ import os
 import unittest
 import importlib
 import io
+import queue
 import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from scripts.sf_session import snowflake_session
+from scripts.dependency_graph import fetch_procedure_waves, wave_by_procedure_name
+from scripts.log import log_error
+from scripts.manifest import Manifest, PROCESSED
+
+# Files of one dependency wave deployed and tested at once (override with config["TEST_MAX_WORKERS"])
+TEST_MAX_WORKERS = 4
 
 class UnitTestPage:
     def __init__(self, config: dict):
@@ -115,21 +124,24 @@ class UnitTestPage:
                 os.makedirs(target_dir)
 
                # 3. Copy the relevant files
-                # This logic assumes the filename in processed_procedures matches the PROCEDURE_NAME from the log.
-                # If not, you may need a more complex mapping based on the regex in py_test.py.
+                # The pipeline manifest maps each procedure to its processed file; procedures
+                # it does not know fall back to the processed_<procedure>.sql naming.
+                manifest = Manifest().index(PROCESSED)
                 copied_files = 0
                 for proc_name in successful_proc_names:
-                    # Construct the expected source filename. Adjust if your naming is different.
-                    source_file = f"processed_{proc_name}.sql"
-                    target_file_name = f"deployed_{proc_name}.sql" 
-                    source_path = os.path.join(source_dir, source_file)
-                    
-                    if os.path.exists(source_path):
-                        target_path = os.path.join(target_dir, target_file_name)
-                        shutil.copy(source_path, target_path)
-                        copied_files += 1
+                    entries = [e for e in manifest.by_procedure_name(proc_name) if e[PROCESSED]]
+                    if entries:
+                        sources = [(e[PROCESSED], f"deployed_{e['FILE_NAME']}.sql") for e in entries]
                     else:
-                        st.warning(f"Could not find source file for procedure '{proc_name}' at '{source_path}'. Skipping.")
+                        sources = [(os.path.join(source_dir, f"processed_{proc_name}.sql"), f"deployed_{proc_name}.sql")]
+
+                    for source_path, target_file_name in sources:
+                        if os.path.exists(source_path):
+                            target_path = os.path.join(target_dir, target_file_name)
+                            shutil.copy(source_path, target_path)
+                            copied_files += 1
+                        else:
+                            st.warning(f"Could not find source file for procedure '{proc_name}' at '{source_path}'. Skipping.")
                 
                 if copied_files == 0:
                     st.error("Found successful procedures in log, but could not find any corresponding files in `processed_procedures`.")
@@ -152,6 +164,44 @@ class UnitTestPage:
 
 
 
+    def _group_files_by_wave(self, sql_files, processed_dir="./processed_procedures", manifest=None):
+        """
+        Groups the processed files into dependency waves (callees before callers),
+        so a procedure is only deployed once everything it calls is deployed.
+        Files whose procedure is not in the dependency graph go into a final group.
+        If the graph cannot be read, all files form a single, name-ordered group.
+        `manifest` is a ManifestIndex of the processed files (loaded if None).
+        """
+        try:
+            with snowflake_session(self.config["SNOWFLAKE_CONFIG"]) as ctx:
+                with ctx.cursor() as cs:
+                    waves, cyclic = fetch_procedure_waves(cs)
+        except Exception as e:
+            log_error(f"Could not load the dependency waves, testing in name order: {e}")
+            st.warning("⚠️ Could not load the procedure dependency graph; procedures will be deployed in name order.")
+            return [sorted(sql_files)]
+
+        if cyclic:
+            st.warning(f"⚠️ {len(cyclic)} procedure(s) are in a dependency cycle and will be deployed last.")
+
+        wave_of_key = {key: i for i, wave in enumerate(waves) for key in wave}
+        wave_of = wave_by_procedure_name(waves)
+        manifest = manifest or Manifest().index(PROCESSED)
+        groups = {}
+        for file_name in sorted(sql_files):
+            entry = manifest.by_path(os.path.join(processed_dir, file_name))
+            if entry:
+                key = tuple(str(entry[c]).upper() for c in ("DBNAME", "SCHEMA_NAME", "PROCEDURE_NAME"))
+                wave = wave_of_key.get(key, len(waves))
+            else:
+                # Not in the manifest: processed files are named processed_<procedure>.sql
+                proc_name = os.path.splitext(file_name)[0]
+                if proc_name.startswith("processed_"):
+                    proc_name = proc_name[len("processed_"):]
+                wave = wave_of.get(proc_name.upper(), len(waves))
+            groups.setdefault(wave, []).append(file_name)
+        return [groups[i] for i in sorted(groups)]
+
     def run_tests(self):
         """
         Handles the logic for executing the unittest suite.
@@ -172,20 +222,44 @@ class UnitTestPage:
                 if not sql_files:
                     st.warning("No processed SQL files found to test."); st.stop()
 
-                st.write(f"Found {len(sql_files)} procedures to test...")
+                # Read the manifest once for the whole run: wave grouping and every test's setUp look files up in it
+                py_test.MANIFEST_INDEX = Manifest().index(PROCESSED)
+                waves = self._group_files_by_wave(sql_files, processed_dir, py_test.MANIFEST_INDEX)
+                max_workers = max(1, self.config.get("TEST_MAX_WORKERS", TEST_MAX_WORKERS))
+                st.write(f"Found {len(sql_files)} procedures to test in {len(waves)} dependency wave(s), "
+                         f"up to {max_workers} at a time...")
                 progress_bar = st.progress(0, text="Initializing tests...")
-                
+
+                # One test class per worker: its setUpClass leases that worker's own pooled
+                # session, so concurrent files never share a connection or cursor
+                worker_classes = queue.Queue()
+                for n in range(max_workers):
+                    worker_classes.put(type(f"TestStoredProcedure_{n + 1}", (py_test.TestStoredProcedure,),
+                                            {"conn": None, "cursor": None}))
                 loader = unittest.TestLoader()
-                # Capture output to prevent cluttering the UI
-                runner = unittest.TextTestRunner(stream=io.StringIO()) 
-
-                for i, file_name in enumerate(sql_files):
-                    progress_bar.progress((i + 1) / len(sql_files), text=f"Testing: {file_name}")
-                    suite = loader.loadTestsFromTestCase(py_test.TestStoredProcedure)
-                    # Dynamically assign the sql_file to each test instance
-                    for test in suite:
-                        test.sql_file = os.path.join(processed_dir, file_name)
-                    runner.run(suite)
+
+                def run_file(file_name):
+                    test_class = worker_classes.get()
+                    try:
+                        suite = loader.loadTestsFromTestCase(test_class)
+                        # Dynamically assign the sql_file to each test instance
+                        for test in suite:
+                            test.sql_file = os.path.join(processed_dir, file_name)
+                        # Capture output to prevent cluttering the UI
+                        unittest.TextTestRunner(stream=io.StringIO()).run(suite)
+                    finally:
+                        worker_classes.put(test_class)
+
+                done = 0
+                for wave_no, wave_files in enumerate(waves, start=1):
+                    # Files within a wave do not call each other; the next wave starts only once this one is deployed
+                    with ThreadPoolExecutor(max_workers=min(max_workers, len(wave_files))) as executor:
+                        futures = {executor.submit(run_file, f): f for f in wave_files}
+                        for future in as_completed(futures):
+                            future.result()
+                            done += 1
+                            progress_bar.progress(done / len(sql_files),
+                                                  text=f"Wave {wave_no}/{len(waves)} · Tested: {futures[future]}")
                 
                 st.success("✅ All test execution cycles complete. **Click 'View/Refresh Test Results'** to see the outcome.")
                 
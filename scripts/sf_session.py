@@ -0,0 +1,260 @@
+import json
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+import streamlit as st
+import snowflake.connector
+from scripts.log import log_info, log_error
+
+# Most Snowflake sessions the app keeps open at once (idle + in use, all users)
+MAX_SESSIONS = 8
+# Idle sessions older than this are closed
+IDLE_TIMEOUT_SECONDS = 600
+# Idle sessions older than this are probed with SELECT 1 before being handed out
+HEALTH_CHECK_AFTER_SECONDS = 60
+# How long acquire() waits for a free slot when the pool is full
+ACQUIRE_TIMEOUT_SECONDS = 60
+# Leases held longer than this are logged as possibly leaked and stop counting toward MAX_SESSIONS
+# (the connection is left alone: its borrower may still be running a long query)
+LEASE_TIMEOUT_SECONDS = 3600
+
+
+def config_key(config, user_id=None):
+    """Pool key: a hash of the connection config plus the app user, so sessions are never shared across either."""
+    digest = hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    return f"{user_id or ''}:{digest}"
+
+
+class SnowflakeSessionPool:
+    def __init__(self, max_sessions=MAX_SESSIONS, idle_timeout=IDLE_TIMEOUT_SECONDS,
+                 health_check_after=HEALTH_CHECK_AFTER_SECONDS, lease_timeout=LEASE_TIMEOUT_SECONDS):
+        """
+        Process-wide pool of Snowflake connections shared by every page, so the
+        multi-second login handshake is paid once per config and user instead of
+        on every component, rerun and test file.
+
+        - Sessions are keyed by config hash and user (see config_key).
+        - Idle sessions are health-checked before reuse and closed after
+          `idle_timeout` seconds.
+        - At most `max_sessions` are open at once; when the pool is full an idle
+          session of another key is closed to make room, otherwise acquire() waits.
+        - Connections are closed and probed outside the pool lock, so a slow
+          network call never blocks other threads' acquire()/release().
+        """
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self.lease_timeout = lease_timeout
+        self._idle = {}    # key -> [(conn, returned_at)], most recently returned last
+        self._leased = {}  # id(conn) -> (key, conn, leased_at)
+        self._stale = {}   # leases past `lease_timeout`: id(conn) -> (key, conn, leased_at), not counted
+        self._cond = threading.Condition()
+
+    def _open_count(self):
+        return sum(len(conns) for conns in self._idle.values()) + len(self._leased)
+
+    def _evict_idle(self, now):
+        """
+        Drops idle sessions older than `idle_timeout` and stops counting leases
+        older than `lease_timeout`. Called with the lock held; returns the
+        connections the caller must close once it has released the lock.
+        """
+        expired = []
+        for key in list(self._idle):
+            keep = []
+            for conn, returned_at in self._idle[key]:
+                if now - returned_at > self.idle_timeout:
+                    expired.append(conn)
+                else:
+                    keep.append((conn, returned_at))
+            if keep:
+                self._idle[key] = keep
+            else:
+                del self._idle[key]
+        for conn_id, lease in list(self._leased.items()):
+            if now - lease[2] > self.lease_timeout:
+                log_error(f"A Snowflake session has been leased for over {self.lease_timeout}s; "
+                          f"no longer counting it toward the pool limit.")
+                self._stale[conn_id] = self._leased.pop(conn_id)
+        return expired
+
+    def _pop_oldest_idle(self):
+        """Removes the least recently used idle session of any key; returns it (to be closed), or None if there is none."""
+        oldest = None
+        for key, conns in self._idle.items():
+            if conns and (oldest is None or conns[0][1] < oldest[1]):
+                oldest = (key, conns[0][1])
+        if oldest is None:
+            return None
+        conn, _ = self._idle[oldest[0]].pop(0)
+        if not self._idle[oldest[0]]:
+            del self._idle[oldest[0]]
+        return conn
+
+    def _end_lease(self, conn_id):
+        """Forgets a lease (counted or stale); returns it, or None if the pool does not know it."""
+        return self._leased.pop(conn_id, None) or self._stale.pop(conn_id, None)
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _healthy(self, conn, idle_for):
+        if conn.is_closed():
+            return False
+        if idle_for < self.health_check_after:
+            return True
+        try:
+            with conn.cursor() as cs:
+                cs.execute("SELECT 1")
+            return True
+        except Exception:
+            return False
+
+    def acquire(self, config, user_id=None, timeout=ACQUIRE_TIMEOUT_SECONDS):
+        """
+        Leases a connection for `config` and `user_id`: a healthy idle one if
+        there is one, otherwise a new one. Must be handed back with release().
+
+        Raises:
+            TimeoutError: if the pool stays full for `timeout` seconds.
+        """
+        key = config_key(config, user_id)
+        deadline = time.monotonic() + timeout
+        while True:
+            conn, slot, to_close = None, None, []
+            try:
+                with self._cond:
+                    while True:
+                        now = time.monotonic()
+                        to_close.extend(self._evict_idle(now))
+                        if self._idle.get(key):
+                            conn, returned_at = self._idle[key].pop()
+                            if not self._idle[key]:
+                                del self._idle[key]
+                            self._leased[id(conn)] = (key, conn, now)
+                            break
+                        if self._open_count() < self.max_sessions:
+                            break
+                        evicted = self._pop_oldest_idle()
+                        if evicted is not None:
+                            to_close.append(evicted)
+                            break
+                        if now >= deadline:
+                            raise TimeoutError(f"No Snowflake session available after {timeout}s ({self.max_sessions} in use).")
+                        self._cond.wait(timeout=deadline - now)
+                    if conn is None:
+                        # Reserve the slot before the (slow) login so other threads see it
+                        slot = object()
+                        self._leased[id(slot)] = (key, None, now)
+            finally:
+                for expired in to_close:
+                    self._close(expired)
+
+            if slot is not None:
+                break
+            if self._healthy(conn, now - returned_at):
+                return conn
+            with self._cond:
+                self._end_lease(id(conn))
+                self._cond.notify()
+            self._close(conn)
+
+        try:
+            conn = snowflake.connector.connect(**config)
+        except Exception:
+            with self._cond:
+                self._end_lease(id(slot))
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._end_lease(id(slot))
+            self._leased[id(conn)] = (key, conn, time.monotonic())
+        log_info(f"Opened a new Snowflake session ({self.stats()['open']}/{self.max_sessions} open).")
+        return conn
+
+    def release(self, conn, discard=False):
+        """
+        Hands a leased connection back. Any open transaction is rolled back;
+        with `discard=True` (or if the rollback fails) the session is closed
+        instead of being kept for reuse.
+        """
+        with self._cond:
+            lease = self._end_lease(id(conn))
+        if not discard and not conn.is_closed():
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+        keep = lease is not None and not discard and not conn.is_closed()
+        with self._cond:
+            if keep:
+                self._idle.setdefault(lease[0], []).append((conn, time.monotonic()))
+            self._cond.notify()
+        if not keep:
+            self._close(conn)
+
+    @contextmanager
+    def session(self, config, user_id=None):
+        """
+        Context manager around acquire()/release(). The session is always handed
+        back, also on BaseExceptions such as Streamlit's st.stop()/st.rerun();
+        one whose block raised an Exception is discarded.
+        """
+        conn = self.acquire(config, user_id)
+        discard = False
+        try:
+            yield conn
+        except Exception:
+            discard = True
+            raise
+        finally:
+            self.release(conn, discard=discard)
+
+    def close_all(self):
+        """Closes every idle session (leased ones are closed when released)."""
+        with self._cond:
+            conns = [conn for idle in self._idle.values() for conn, _ in idle]
+            self._idle.clear()
+        for conn in conns:
+            self._close(conn)
+
+    def stats(self):
+        """Returns counts of "idle", "leased" and "open" sessions, plus "stale" leases (not counted as open)."""
+        with self._cond:
+            idle = sum(len(conns) for conns in self._idle.values())
+            return {"idle": idle, "leased": len(self._leased), "open": idle + len(self._leased),
+                    "stale": len(self._stale)}
+
+
+@st.cache_resource
+def get_session_pool():
+    """The one SnowflakeSessionPool of this Streamlit server process."""
+    return SnowflakeSessionPool()
+
+
+def current_user_id():
+    try:
+        return st.session_state.get("user_id")
+    except Exception:
+        # Outside a Streamlit session (headless runs)
+        return None
+
+
+def acquire_session(config, user_id=None):
+    """Leases a pooled connection for `config` (and the logged-in user); hand it back with release_session()."""
+    return get_session_pool().acquire(config, user_id if user_id is not None else current_user_id())
+
+
+def release_session(conn, discard=False):
+    """Returns a connection obtained from acquire_session() to the pool."""
+    get_session_pool().release(conn, discard=discard)
+
+
+def snowflake_session(config, user_id=None):
+    """`with snowflake_session(cfg) as conn:` – a pooled connection for the duration of the block."""
+    return get_session_pool().session(config, user_id if user_id is not None else current_user_id())
@@ -0,0 +1,107 @@
+import time
+import threading
+import streamlit as st
+from scripts.log import log_info, log_error
+from scripts.sf_session import config_key, current_user_id, snowflake_session
+
+# Cached reads are served without touching Snowflake for this long
+SNAPSHOT_TTL_SECONDS = 120
+# Entries kept per cache before the least recently fetched are dropped
+MAX_SNAPSHOTS = 256
+
+
+class SnapshotCache:
+    def __init__(self, ttl=SNAPSHOT_TTL_SECONDS, max_entries=MAX_SNAPSHOTS):
+        """
+        Process-wide cache of read-only Snowflake query results (procedure list,
+        metadata pages, test results), keyed by config + user, table and query.
+
+        An entry is served as-is while it is younger than `ttl` and its table has
+        not been invalidated by a write from this app (see invalidate). Once the
+        TTL has passed, the table's LAST_ALTERED is probed first: if it has not
+        moved, the entry is kept for another TTL without re-running the query.
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}   # (scope, table, query_key) -> (value, fetched_at, version, last_altered)
+        self._versions = {}  # TABLE -> invalidation counter
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _last_altered(cs, table):
+        """Cheap staleness probe: the table's LAST_ALTERED (changes on DML and DDL), or None."""
+        cs.execute(
+            "SELECT LAST_ALTERED FROM INFORMATION_SCHEMA.TABLES "
+            "WHERE TABLE_SCHEMA = CURRENT_SCHEMA() AND TABLE_NAME = %s",
+            (table.upper(),)
+        )
+        row = cs.fetchone()
+        return row[0] if row else None
+
+    def invalidate(self, *tables):
+        """Marks every cached read of these tables as stale (call after this app writes to them)."""
+        with self._lock:
+            for table in tables:
+                self._versions[table.upper()] = self._versions.get(table.upper(), 0) + 1
+
+    def fetch(self, config, table, query_key, loader, conn=None, probe=True):
+        """
+        Returns loader(cursor) for this config/user, table and query, from the
+        cache when it is still valid.
+
+        :param config: SNOWFLAKE_CONFIG the result belongs to (part of the cache key).
+        :param table: Table the query reads; its invalidations and LAST_ALTERED apply.
+        :param query_key: Hashable key of the query and its parameters.
+        :param loader: Function taking a cursor and returning the (immutable) result.
+        :param conn: Open connection to use; a pooled session is borrowed if None.
+        :param probe: Whether to check LAST_ALTERED before re-running an expired query.
+        """
+        table = table.upper()
+        key = (config_key(config, current_user_id()), table, query_key)
+        now = time.monotonic()
+        with self._lock:
+            version = self._versions.get(table, 0)
+            entry = self._entries.get(key)
+        if entry and entry[2] == version and now - entry[1] < self.ttl:
+            return entry[0]
+
+        def refresh(cs):
+            last_altered = self._last_altered(cs, table) if probe else None
+            if entry and entry[2] == version and last_altered is not None and last_altered == entry[3]:
+                return entry[0], last_altered
+            return loader(cs), last_altered
+
+        if conn is not None:
+            with conn.cursor() as cs:
+                value, last_altered = refresh(cs)
+        else:
+            with snowflake_session(config) as pooled:
+                with pooled.cursor() as cs:
+                    value, last_altered = refresh(cs)
+
+        with self._lock:
+            self._entries[key] = (value, time.monotonic(), version, last_altered)
+            if len(self._entries) > self.max_entries:
+                oldest = min(self._entries, key=lambda k: self._entries[k][1])
+                del self._entries[oldest]
+        return value
+
+
+@st.cache_resource
+def get_snapshot_cache():
+    """The one SnapshotCache of this Streamlit server process."""
+    return SnapshotCache()
+
+
+def cached_read(config, table, query_key, loader, conn=None, probe=True):
+    """Shortcut for get_snapshot_cache().fetch(...)."""
+    return get_snapshot_cache().fetch(config, table, query_key, loader, conn=conn, probe=probe)
+
+
+def invalidate_snapshots(*tables):
+    """Drops cached reads of `tables` after a write; never lets a cache problem fail the write path."""
+    try:
+        get_snapshot_cache().invalidate(*tables)
+        log_info(f"Snapshot cache invalidated for {', '.join(tables)}.")
+    except Exception as e:
+        log_error(f"Could not invalidate the snapshot cache for {', '.join(tables)}: {e}")
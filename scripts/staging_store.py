@@ -0,0 +1,149 @@
+import os
+import time
+import sqlite3
+import uuid
+import pandas as pd
+
+# Per-session staging databases live here (one SQLite file per Streamlit session)
+STAGING_DIR = "./staging_area"
+STAGED_COLUMNS = ["SOURCE", "DBNAME", "SCHEMA_NAME", "PROCEDURE_NAME", "PROCEDURE_DEFINITION", "PARAMETERS"]
+# Columns shown in the "View Staged Procedures" preview (no definitions)
+PREVIEW_COLUMNS = ["SOURCE", "DBNAME", "SCHEMA_NAME", "PROCEDURE_NAME", "PARAMETERS"]
+# Default number of rows read back per batch when streaming the stage
+READ_BATCH_SIZE = 2000
+# Stage files untouched for this long (abandoned sessions) are deleted when a new session starts
+STAGE_MAX_AGE_HOURS = 24
+
+
+class StagingStore:
+    def __init__(self, path):
+        """
+        Disk-backed staging area for procedures waiting to be loaded into Snowflake.
+
+        Rows are deduplicated on (SOURCE, DBNAME, SCHEMA_NAME, PROCEDURE_NAME), the
+        same key the in-memory stage used, and read back in insertion order. Only
+        the file path needs to be kept in session state.
+
+        :param path: Path of the SQLite file backing this stage.
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._create()
+
+    def _create(self):
+        conn = sqlite3.connect(self.path, timeout=60)
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS staged_procedures (
+                    SEQ                   INTEGER PRIMARY KEY AUTOINCREMENT,
+                    SOURCE                TEXT,
+                    DBNAME                TEXT,
+                    SCHEMA_NAME           TEXT,
+                    PROCEDURE_NAME        TEXT,
+                    PROCEDURE_DEFINITION  TEXT,
+                    PARAMETERS            TEXT,
+                    UNIQUE (SOURCE, DBNAME, SCHEMA_NAME, PROCEDURE_NAME)
+                )
+            """)
+        finally:
+            conn.close()
+
+    @classmethod
+    def for_session(cls, user_id=None):
+        """Creates a fresh stage file for one Streamlit session under STAGING_DIR (purging abandoned ones first)."""
+        cls.purge_stale()
+        prefix = f"{user_id}_" if user_id else ""
+        return cls(os.path.join(STAGING_DIR, f"{prefix}{uuid.uuid4().hex}.sqlite"))
+
+    @staticmethod
+    def purge_stale(max_age_hours=STAGE_MAX_AGE_HOURS, directory=STAGING_DIR):
+        """Deletes stage files not modified for `max_age_hours`; returns how many were deleted."""
+        if not os.path.isdir(directory):
+            return 0
+        cutoff = time.time() - max_age_hours * 3600
+        removed = 0
+        for entry in os.scandir(directory):
+            try:
+                if entry.is_file() and entry.name.endswith(".sqlite") and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def _connect(self):
+        # A new connection per call: Streamlit reruns and harvest workers may land on
+        # different threads; concurrent writers wait for the lock instead of failing
+        if not os.path.exists(self.path):
+            # Cleared (file deleted) earlier; start an empty stage again
+            self._create()
+        return sqlite3.connect(self.path, timeout=60)
+
+    def add(self, procs):
+        """
+        Adds procedures from any iterable of dicts, skipping keys that are already staged.
+
+        Returns:
+            int: the number of newly staged procedures.
+        """
+        conn = self._connect()
+        try:
+            before = conn.total_changes
+            with conn:
+                conn.executemany(
+                    f"INSERT OR IGNORE INTO staged_procedures ({', '.join(STAGED_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?)",
+                    (tuple(p.get(col) for col in STAGED_COLUMNS) for p in procs)
+                )
+            return conn.total_changes - before
+        finally:
+            conn.close()
+
+    def count(self):
+        """Returns the number of staged procedures."""
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM staged_procedures").fetchone()[0]
+        finally:
+            conn.close()
+
+    def count_targets(self):
+        """Returns how many distinct metadata rows (DBNAME, SCHEMA_NAME, PROCEDURE_NAME) the stage maps to."""
+        conn = self._connect()
+        try:
+            return conn.execute(
+                "SELECT COUNT(*) FROM (SELECT DISTINCT DBNAME, SCHEMA_NAME, PROCEDURE_NAME FROM staged_procedures)"
+            ).fetchone()[0]
+        finally:
+            conn.close()
+
+    def iter_batches(self, batch_size=READ_BATCH_SIZE):
+        """Streams the staged procedures back as lists of dicts, in the order they were staged."""
+        conn = self._connect()
+        try:
+            cursor = conn.execute(f"SELECT {', '.join(STAGED_COLUMNS)} FROM staged_procedures ORDER BY SEQ")
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield [dict(zip(STAGED_COLUMNS, row)) for row in rows]
+        finally:
+            conn.close()
+
+    def preview(self, limit, offset=0):
+        """Returns one page of staged rows (without definitions) as a DataFrame."""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f"SELECT {', '.join(PREVIEW_COLUMNS)} FROM staged_procedures ORDER BY SEQ LIMIT ? OFFSET ?",
+                (limit, offset)
+            ).fetchall()
+        finally:
+            conn.close()
+        return pd.DataFrame(rows, columns=PREVIEW_COLUMNS)
+
+    def clear(self):
+        """Empties the stage by deleting its file; an empty one is created again on next use."""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
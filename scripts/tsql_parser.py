@@ -0,0 +1,346 @@
+import io
+import os
+import re
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# --- Linear-time T-SQL scanning helpers ---
+# Everything here is pure Python (no Streamlit), so it can run inside a process pool.
+# The tokenizer walks the script exactly once: comments, string literals and
+# [bracketed]/"quoted" identifiers are skipped with str.find / anchored regex
+# matches, so there is no backtracking no matter how large or odd the input is.
+
+WORD, IDENT, STRING, PUNCT = "word", "ident", "string", "punct"
+
+_SPACE = re.compile(r"\s+")
+_WORD = re.compile(r"[\w@#$]+")
+_BLOCK_COMMENT_EDGE = re.compile(r"/\*|\*/")
+
+# Uploads at least this large (in total) are parsed in a process pool
+PARALLEL_PARSE_THRESHOLD_BYTES = 4 * 1024 * 1024
+
+
+def _skip_quoted(sql, i, close):
+    """Returns the index just past a quoted run starting at sql[i]; doubled closers are escapes."""
+    n = len(sql)
+    j = i + 1
+    while True:
+        j = sql.find(close, j)
+        if j == -1:
+            return n
+        if j + 1 < n and sql[j + 1] == close:
+            j += 2
+            continue
+        return j + 1
+
+
+def _skip_block_comment(sql, i):
+    """Returns the index just past a (possibly nested) /* ... */ comment starting at sql[i]."""
+    depth = 0
+    for m in _BLOCK_COMMENT_EDGE.finditer(sql, i):
+        depth += 1 if m.group() == "/*" else -1
+        if depth == 0:
+            return m.end()
+    return len(sql)
+
+
+def tokenize(sql, pos=0):
+    """
+    Yields (kind, text, start, end) tuples for a T-SQL script, skipping
+    whitespace and comments. `kind` is one of WORD, IDENT, STRING or PUNCT.
+    """
+    n = len(sql)
+    i = pos
+    while i < n:
+        c = sql[i]
+        if c.isspace():
+            i = _SPACE.match(sql, i).end()
+            continue
+        if c == "-" and sql.startswith("--", i):
+            j = sql.find("\n", i)
+            i = n if j == -1 else j + 1
+            continue
+        if c == "/" and sql.startswith("/*", i):
+            i = _skip_block_comment(sql, i)
+            continue
+        if c == "'" or (c in "Nn" and sql.startswith("'", i + 1)):
+            start = i
+            i = _skip_quoted(sql, sql.index("'", i), "'")
+            yield STRING, sql[start:i], start, i
+            continue
+        if c == "[" or c == '"':
+            start = i
+            i = _skip_quoted(sql, i, "]" if c == "[" else '"')
+            yield IDENT, sql[start:i], start, i
+            continue
+        m = _WORD.match(sql, i)
+        if m:
+            yield WORD, m.group(), i, m.end()
+            i = m.end()
+            continue
+        yield PUNCT, c, i, i + 1
+        i += 1
+
+
+def _unquote(text):
+    """Strips [brackets] or "quotes" from an identifier."""
+    if text[:1] == "[" and text[-1:] == "]":
+        return text[1:-1].replace("]]", "]")
+    if text[:1] == '"' and text[-1:] == '"':
+        return text[1:-1].replace('""', '"')
+    return text
+
+
+def _join_tokens(parts):
+    """Re-joins parameter tokens into a single normalized line."""
+    text = " ".join(parts)
+    text = re.sub(r"\s+([,)])", r"\1", text)
+    text = re.sub(r"\(\s+", "(", text)
+    text = re.sub(r"(\w)\s+\(", r"\1(", text)
+    return text.strip()
+
+
+def _parse_header(tokens, start):
+    """
+    Parses the rest of a header after CREATE/ALTER PROC: the (multi-part) name and
+    the parameter list, with or without surrounding parentheses.
+    """
+    name_parts = []
+    tok = next(tokens, None)
+    while tok and tok[0] in (WORD, IDENT):
+        name_parts.append(_unquote(tok[1]))
+        tok = next(tokens, None)
+        if tok and tok[1] == ".":
+            tok = next(tokens, None)
+            continue
+        break
+    if not name_parts:
+        return None, tok
+
+    # Numbered procedures: CREATE PROC dbo.p;2
+    if tok and tok[1] == ";":
+        next(tokens, None)
+        tok = next(tokens, None)
+
+    params = []
+    if tok and tok[1] == "(":
+        depth = 1
+        for tok in tokens:
+            if tok[1] == "(":
+                depth += 1
+            elif tok[1] == ")":
+                depth -= 1
+                if depth == 0:
+                    break
+            params.append(tok[1])
+        tok = next(tokens, None)
+    elif tok and tok[0] == WORD and tok[1].startswith("@"):
+        depth = 0
+        prev = None
+        while tok:
+            upper = tok[1].upper()
+            # "AS" straight after a parameter name is the optional "@p AS int" form
+            if depth == 0 and tok[0] == WORD and upper in ("AS", "WITH", "FOR") \
+                    and not (upper == "AS" and prev and prev.startswith("@")):
+                break
+            if tok[1] == "(":
+                depth += 1
+            elif tok[1] == ")":
+                depth -= 1
+            params.append(tok[1])
+            prev = tok[1]
+            tok = next(tokens, None)
+
+    header = {
+        "schema": name_parts[-2] if len(name_parts) >= 2 else None,
+        "name": name_parts[-1],
+        "parameters": _join_tokens(params),
+        "start": start,
+    }
+    return header, tok
+
+
+def find_procedure_headers(sql):
+    """
+    Yields one dict per CREATE/ALTER/CREATE OR ALTER PROC[EDURE] header in `sql`:
+    {"schema", "name", "parameters", "start"}, where `start` is the offset of the
+    CREATE/ALTER keyword. Headers inside comments or string literals are ignored.
+    """
+    tokens = tokenize(sql)
+    # (UPPER text, start) of the last three tokens
+    recent = []
+    for kind, text, start, _ in tokens:
+        upper = text.upper() if kind == WORD else None
+        if upper in ("PROC", "PROCEDURE") and recent:
+            header_start = None
+            if recent[-1][0] in ("CREATE", "ALTER"):
+                header_start = recent[-1][1]
+                if recent[-1][0] == "ALTER" and len(recent) >= 3 \
+                        and recent[-2][0] == "OR" and recent[-3][0] == "CREATE":
+                    header_start = recent[-3][1]
+            if header_start is not None:
+                header, _ = _parse_header(tokens, header_start)
+                recent = []
+                if header:
+                    yield header
+                continue
+        recent = (recent + [(upper, start)])[-3:]
+
+
+def scan_procedure_header(sql):
+    """Returns the first procedure header in `sql` (see find_procedure_headers), or None."""
+    return next(find_procedure_headers(sql), None)
+
+
+def decode_script(data):
+    """Decodes an uploaded script, honouring the UTF-16 BOMs that SSMS exports use."""
+    if data[:2] in (b"\xff\xfe", b"\xfe\xff"):
+        return data.decode("utf-16")
+    return data.decode("utf-8-sig")
+
+
+def iter_script_lines(data):
+    """Decodes an uploaded script lazily, one line at a time (see decode_script for the encodings)."""
+    encoding = "utf-16" if data[:2] in (b"\xff\xfe", b"\xfe\xff") else "utf-8-sig"
+    with io.TextIOWrapper(io.BytesIO(data), encoding=encoding, newline="") as reader:
+        yield from reader
+
+
+# --- Batch splitting (sqlcmd / SSMS "GO" separators) ---
+_GO_LINE = re.compile(r"^\s*GO(?:\s+\d+)?\s*(?:--.*)?$", re.IGNORECASE)
+_OPENERS = re.compile(r"--|/\*|'|\[|\"")
+_CLOSERS = {"'": "'", "[": "]", '"': '"'}
+
+
+def _carry_state(line, state, depth):
+    """
+    Returns the (state, depth) left open at the end of `line`: None, "/*" for a
+    block comment `depth` levels deep, or the closing character of an unterminated
+    string literal / quoted identifier. Used so a GO inside those never splits.
+    """
+    i = 0
+    n = len(line)
+    while i < n:
+        if state is None:
+            m = _OPENERS.search(line, i)
+            if not m or m.group() == "--":
+                break
+            i = m.end()
+            if m.group() == "/*":
+                state, depth = "/*", 1
+            else:
+                state = _CLOSERS[m.group()]
+        elif state == "/*":
+            m = _BLOCK_COMMENT_EDGE.search(line, i)
+            if not m:
+                break
+            i = m.end()
+            depth += 1 if m.group() == "/*" else -1
+            if depth == 0:
+                state = None
+        else:
+            j = line.find(state, i)
+            if j == -1:
+                break
+            if line.startswith(state * 2, j):
+                i = j + 2
+                continue
+            i = j + 1
+            state = None
+    return state, depth
+
+
+def iter_batches(lines):
+    """
+    Groups an iterable of script lines into batches separated by GO lines,
+    yielding each batch as soon as its separator is seen. Only one batch is
+    held in memory at a time.
+    """
+    buf = []
+    state, depth = None, 0
+    for line in lines:
+        if state is None and _GO_LINE.match(line):
+            if buf:
+                yield "".join(buf)
+                buf = []
+            continue
+        buf.append(line)
+        state, depth = _carry_state(line, state, depth)
+    if buf:
+        yield "".join(buf)
+
+
+def split_procedures(lines, dbname, schema_name):
+    """
+    Streams staging records out of a (possibly huge) multi-procedure script:
+    the script is cut on GO separators and on procedure headers, and every
+    procedure keeps its real schema and name. `schema_name` is only used for
+    headers that do not name a schema.
+    """
+    for batch in iter_batches(lines):
+        headers = list(find_procedure_headers(batch))
+        for k, header in enumerate(headers):
+            end = headers[k + 1]["start"] if k + 1 < len(headers) else len(batch)
+            yield {
+                "SOURCE": "File Upload",
+                "DBNAME": dbname,
+                "SCHEMA_NAME": header["schema"] or schema_name,
+                "PROCEDURE_NAME": header["name"],
+                "PROCEDURE_DEFINITION": batch[header["start"]:end].strip(),
+                "PARAMETERS": header["parameters"],
+            }
+
+
+def parse_script(name, data, dbname, schema_name):
+    """
+    Builds the staging records for one uploaded script: one record per procedure
+    it defines. A script without any CREATE/ALTER PROC header is staged whole,
+    named after the file (without extension).
+    """
+    records = list(split_procedures(iter_script_lines(data), dbname, schema_name))
+    if records:
+        return records
+
+    procedure_definition = decode_script(data)
+    return [{
+        "SOURCE": "File Upload",
+        "DBNAME": dbname,
+        "SCHEMA_NAME": schema_name,
+        "PROCEDURE_NAME": os.path.splitext(os.path.basename(name))[0],
+        "PROCEDURE_DEFINITION": procedure_definition,
+        "PARAMETERS": "",
+    }]
+
+
+def _parse_script_safely(args):
+    """Process-pool worker: returns (records, None) or ([], error message)."""
+    name, data, dbname, schema_name = args
+    try:
+        return parse_script(name, data, dbname, schema_name), None
+    except Exception as e:
+        return [], f"Could not process file {name}: {e}"
+
+
+def parse_scripts(scripts, dbname, schema_name, max_workers=None):
+    """
+    Parses a list of (name, bytes) scripts into staging records.
+
+    Small uploads are parsed inline; once the total size reaches
+    PARALLEL_PARSE_THRESHOLD_BYTES they are spread over a process pool.
+
+    Returns:
+        tuple: (records, errors) where errors is a list of messages.
+    """
+    jobs = [(name, data, dbname, schema_name) for name, data in scripts]
+    total_bytes = sum(len(data) for _, data in scripts)
+
+    if len(jobs) > 1 and total_bytes >= PARALLEL_PARSE_THRESHOLD_BYTES:
+        # Spawned, not forked: the caller is a threaded Streamlit server, and forking it can copy held locks
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            results = list(executor.map(_parse_script_safely, jobs, chunksize=16))
+    else:
+        results = [_parse_script_safely(job) for job in jobs]
+
+    records = [record for file_records, _ in results for record in file_records]
+    errors = [error for _, error in results if error]
+    return records, errors
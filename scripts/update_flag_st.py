@@ -1,18 +1,27 @@
 # --- START OF FILE update_flag_st.py ---
 
 import streamlit as st
-import snowflake.connector
+from scripts.sf_session import snowflake_session
+from scripts.snapshot_cache import cached_read, invalidate_snapshots
+from snowflake.connector.pandas_tools import write_pandas
 import pandas as pd
 import os
+import re
 import sys
 import importlib
 from scripts.log import log_error, log_info
+from scripts.metadata_viewer import MetadataViewer
+from scripts.metadata_schema import ensure_metadata_tables
+from scripts.proc_search import ProcedureSearchIndex, SEARCH_MODES, SUBSTRING
+from scripts.extract_procedures import ExtractProcedures
 
 # Simple fallback for logging
 # def log_error(msg): print(f"ERROR: {msg}")
 # def log_info(msg): print(f"INFO: {msg}")
 
 METADATA_TABLE = "procedures_metadata"
+# Session-scoped temp table holding the keys of a bulk flag change
+FLAG_CHANGES_TABLE = "CONVERSION_FLAG_CHANGES"
 
 class SelectProcedures:
     def __init__(self, config: dict):
@@ -35,39 +44,331 @@ class SelectProcedures:
         Fetches procedures with CONVERSION_FLAG=TRUE from Snowflake
         and writes them to .sql files.
         """
-        if "sf_conn" not in st.session_state or st.session_state.sf_conn.is_closed():
-            st.error("❌ Snowflake connection is not active. Please 'Start Flow' first.")
+        try:
+            # Same streaming, skip-unchanged engine as headless runs; it borrows a pooled session for the run
+            counts = ExtractProcedures(
+                {"SNOWFLAKE_CONFIG": self.snowflake_config},
+                output_dir=self.output_dir
+            ).extract_procedures()
+        except Exception as e:
+            st.error(f"❌ An error occurred during extraction: {e}")
             return
 
-        ctx = st.session_state.sf_conn
-        # Use a new cursor for this self-contained operation
-        with ctx.cursor() as cs:
-            try:
-                os.makedirs(self.output_dir, exist_ok=True)
-                log_info(f"Ensured output directory exists: {self.output_dir}")
+        if not counts["total"]:
+            st.warning("⚠️ No procedures are currently flagged for conversion. Nothing to extract.")
+            return
 
-                query = f"SELECT PROCEDURE_NAME, PROCEDURE_DEFINITION FROM {METADATA_TABLE} WHERE CONVERSION_FLAG = TRUE"
-                rows = cs.execute(query).fetchall()
+        st.success(
+            f"✅ **Extraction Complete!** {counts['total']} procedure(s) in `{self.output_dir}`: "
+            f"{counts['written']} written, {counts['unchanged']} unchanged, {counts['removed']} stale file(s) removed. "
+            f"You are now ready for the **'4. Convert Procedures'** step."
+        )
+
+    # --- Bulk flag API: every call is one set-based statement in Snowflake ---
+
+    @staticmethod
+    def _like_to_regex(pattern):
+        """Translates a SQL LIKE pattern (% and _ wildcards) into an equivalent regex."""
+        parts = []
+        for ch in pattern:
+            parts.append(".*" if ch == "%" else "." if ch == "_" else re.escape(ch))
+        return "".join(parts)
+
+    def _mirror_flags(self, index, flag):
+        """Applies a committed flag change to the local procedure frame in one vectorized step."""
+        df = st.session_state.proc_df
+        df.loc[index, "CONVERSION_FLAG"] = flag
+        df.loc[index, "SELECTED"] = flag
+        st.session_state.proc_editor_version += 1
+
+    def flag_by_filter(self, flag, dbname=None, schema_name=None, name_pattern=None):
+        """
+        Flags (or unflags) every procedure in a database/schema and/or whose name
+        matches a case-insensitive SQL LIKE pattern, with ONE UPDATE statement.
 
-                if not rows:
-                    st.warning("⚠️ No procedures are currently flagged for conversion. Nothing to extract.")
-                    return
+        Returns:
+            int: the number of rows Snowflake updated.
+        """
+        clauses, params = ["COALESCE(CONVERSION_FLAG, FALSE) <> %s"], [flag]
+        df = st.session_state.proc_df
+        mask = df["CONVERSION_FLAG"] != flag
+        if dbname:
+            clauses.append("DBNAME = %s"); params.append(dbname)
+            mask &= df["DBNAME"] == dbname
+        if schema_name:
+            clauses.append("SCHEMA_NAME = %s"); params.append(schema_name)
+            mask &= df["SCHEMA_NAME"] == schema_name
+        if name_pattern:
+            clauses.append("PROCEDURE_NAME ILIKE %s"); params.append(name_pattern)
+            mask &= df["PROCEDURE_NAME"].str.fullmatch(self._like_to_regex(name_pattern), case=False)
+
+        # A session is leased for this statement only; if it fails the session is discarded uncommitted
+        with snowflake_session(self.snowflake_config) as ctx, ctx.cursor() as cs:
+            cs.execute(f"UPDATE {METADATA_TABLE} SET CONVERSION_FLAG = %s WHERE {' AND '.join(clauses)}", [flag] + params)
+            updated = cs.fetchone()[0]
+            ctx.commit()
+        invalidate_snapshots(METADATA_TABLE)
+        self._mirror_flags(df.index[mask], flag)
+        log_info(f"Bulk {'flagged' if flag else 'unflagged'} {updated} procedure(s) "
+                 f"(db={dbname or '*'}, schema={schema_name or '*'}, name LIKE {name_pattern or '*'}).")
+        return updated
+
+    def flag_keys(self, index, flags):
+        """
+        Sets CONVERSION_FLAG for the given proc_df rows with one write_pandas upload
+        of the changed keys into a temp table and ONE joined UPDATE.
 
-                extracted_count = 0
-                for proc_name, definition in rows:
-                    safe_name = "".join(c if c.isalnum() or c in ("_", "-") else "_" for c in proc_name)
-                    file_path = os.path.join(self.output_dir, f"{safe_name}.sql")
-            
-                    with open(file_path, "w", encoding="utf-8") as f:
-                        f.write(definition.strip() + "\n")
-                    
-                    log_info(f"Wrote {proc_name} → {file_path}")
-                    extracted_count += 1
-                
-                st.success(f"✅ **Extraction Complete!** {extracted_count} procedure(s) saved to `{self.output_dir}`. You are now ready for the **'4. Convert Procedures'** step.")
+        Args:
+            index: proc_df index labels of the rows to change.
+            flags: A bool, or a sequence of bools aligned with `index`.
 
-            except Exception as e:
-                st.error(f"❌ An error occurred during extraction: {e}")
+        Returns:
+            int: the number of rows Snowflake updated.
+        """
+        df = st.session_state.proc_df
+        changes = df.loc[index, ["DBNAME", "SCHEMA_NAME", "PROCEDURE_NAME"]].copy()
+        if changes.empty:
+            return 0
+        changes["NEW_FLAG"] = flags
+
+        # The temp table, upload and UPDATE share one session leased for this change only
+        with snowflake_session(self.snowflake_config) as ctx, ctx.cursor() as cs:
+            cs.execute(f"""
+                CREATE OR REPLACE TEMPORARY TABLE {FLAG_CHANGES_TABLE} (
+                  DBNAME          STRING,
+                  SCHEMA_NAME     STRING,
+                  PROCEDURE_NAME  STRING,
+                  NEW_FLAG        BOOLEAN
+                )
+            """)
+            success, _, nrows, _ = write_pandas(ctx, changes, FLAG_CHANGES_TABLE, quote_identifiers=False)
+            if not success or nrows != len(changes):
+                raise RuntimeError(f"Flag change upload incomplete: {nrows} of {len(changes)} rows written.")
+            cs.execute(f"""
+                UPDATE {METADATA_TABLE} T
+                   SET CONVERSION_FLAG = S.NEW_FLAG
+                  FROM {FLAG_CHANGES_TABLE} S
+                 WHERE T.DBNAME = S.DBNAME AND T.SCHEMA_NAME = S.SCHEMA_NAME AND T.PROCEDURE_NAME = S.PROCEDURE_NAME
+            """)
+            updated = cs.fetchone()[0]
+            ctx.commit()
+        invalidate_snapshots(METADATA_TABLE)
+        df.loc[changes.index, "CONVERSION_FLAG"] = changes["NEW_FLAG"].to_numpy()
+        df.loc[changes.index, "SELECTED"] = changes["NEW_FLAG"].to_numpy()
+        st.session_state.proc_editor_version += 1
+        return updated
+
+    def resolve_procedure_list(self, lines):
+        """
+        Maps an uploaded list of names to proc_df rows. Each line may be
+        `proc`, `schema.proc` or `db.schema.proc` (case-insensitive; brackets
+        and quotes are ignored). Returns (index, unmatched_lines).
+        """
+        df = st.session_state.proc_df
+        keys = {
+            3: df["DBNAME"].str.lower() + "." + df["SCHEMA_NAME"].str.lower() + "." + df["PROCEDURE_NAME"].str.lower(),
+            2: df["SCHEMA_NAME"].str.lower() + "." + df["PROCEDURE_NAME"].str.lower(),
+            1: df["PROCEDURE_NAME"].str.lower(),
+        }
+        wanted = {1: set(), 2: set(), 3: set()}
+        originals = {}
+        for line in lines:
+            name = re.sub(r'[\[\]"]', "", line.split(",")[0]).strip().lower()
+            if not name:
+                continue
+            parts = min(name.count(".") + 1, 3)
+            wanted[parts].add(name)
+            originals[name] = line.strip()
+
+        mask = pd.Series(False, index=df.index)
+        matched = set()
+        for parts, names in wanted.items():
+            if names:
+                hit = keys[parts].isin(names)
+                mask |= hit
+                matched.update(keys[parts][hit])
+        unmatched = [originals[n] for n in originals if n not in matched]
+        return df.index[mask], unmatched
+
+    def _render_bulk_flagging(self):
+        """UI for the bulk flag API: by database/schema/name pattern, or from an uploaded list."""
+        df = st.session_state.proc_df
+        with st.expander("⚡ Bulk flag (applied directly in Snowflake)"):
+            by_filter, by_list = st.tabs(["By schema / name pattern", "From uploaded list"])
+            with by_filter:
+                c1, c2, c3 = st.columns(3)
+                db = c1.selectbox("Database", ["Any"] + sorted(df["DBNAME"].unique()), key="sel_bulk_db")
+                schema_options = df["SCHEMA_NAME"] if db == "Any" else df.loc[df["DBNAME"] == db, "SCHEMA_NAME"]
+                schema = c2.selectbox("Schema", ["Any"] + sorted(schema_options.unique()), key="sel_bulk_schema")
+                pattern = c3.text_input("Name pattern (SQL LIKE)", key="sel_bulk_pattern", placeholder="e.g., usp_report_%").strip()
+                filters = {
+                    "dbname": None if db == "Any" else db,
+                    "schema_name": None if schema == "Any" else schema,
+                    "name_pattern": pattern or None,
+                }
+                if not any(filters.values()):
+                    st.caption("Pick a database, a schema or a name pattern to flag a whole group at once.")
+                f1, f2 = st.columns(2)
+                for col, flag, label in ((f1, True, "☑️ Flag matching"), (f2, False, "⬜ Unflag matching")):
+                    if col.button(label, use_container_width=True, disabled=not any(filters.values()), key=f"sel_bulk_filter_{flag}"):
+                        try:
+                            updated = self.flag_by_filter(flag, **filters)
+                            st.toast(f"{updated} procedure(s) {'flagged' if flag else 'unflagged'}.", icon="✅")
+                            st.rerun()
+                        except Exception as e:
+                            st.error(f"❌ Bulk update failed: {e}")
+
+            with by_list:
+                # Names the last successful update could not match (kept across its rerun)
+                unmatched = st.session_state.pop("sel_bulk_unmatched", None)
+                if unmatched:
+                    st.warning(f"⚠️ {len(unmatched)} listed name(s) did not match any procedure: {', '.join(unmatched[:20])}")
+                uploaded = st.file_uploader(
+                    "One procedure per line: `proc`, `schema.proc` or `db.schema.proc`",
+                    type=["txt", "csv"], key="sel_bulk_list"
+                )
+                f1, f2 = st.columns(2)
+                for col, flag, label in ((f1, True, "☑️ Flag listed"), (f2, False, "⬜ Unflag listed")):
+                    if col.button(label, use_container_width=True, disabled=uploaded is None, key=f"sel_bulk_list_{flag}"):
+                        index, unmatched = self.resolve_procedure_list(uploaded.getvalue().decode("utf-8-sig").splitlines())
+                        if unmatched:
+                            st.warning(f"⚠️ {len(unmatched)} listed name(s) did not match any procedure: {', '.join(unmatched[:20])}")
+                        if len(index):
+                            try:
+                                updated = self.flag_keys(index, flag)
+                                st.session_state.sel_bulk_unmatched = unmatched
+                                st.toast(f"{updated} procedure(s) {'flagged' if flag else 'unflagged'}.", icon="✅")
+                                st.rerun()
+                            except Exception as e:
+                                st.error(f"❌ Bulk update failed: {e}")
+
+    def _pending_changes(self):
+        """Returns only the rows whose pending selection differs from the stored CONVERSION_FLAG."""
+        df = st.session_state.proc_df
+        return df[df["SELECTED"] != df["CONVERSION_FLAG"]]
+
+    def _filtered_view(self, db, schema, matches, show):
+        """
+        Applies the selector filters to the procedure frame with vectorized pandas
+        masks. `matches` holds the row positions returned by the search index, or
+        None when no search is active.
+        """
+        df = st.session_state.proc_df
+        mask = pd.Series(True, index=df.index)
+        if matches is not None:
+            mask &= df.index.isin(matches)
+        if db != "All":
+            mask &= df["DBNAME"] == db
+        if schema != "All":
+            mask &= df["SCHEMA_NAME"] == schema
+        if show == "Selected":
+            mask &= df["SELECTED"]
+        elif show == "Not selected":
+            mask &= ~df["SELECTED"]
+        elif show == "Changed":
+            mask &= df["SELECTED"] != df["CONVERSION_FLAG"]
+        return df[mask]
+
+    def _set_selected(self, index, value):
+        """Sets the pending selection of the given rows and resets the grid's own edit state."""
+        st.session_state.proc_df.loc[index, "SELECTED"] = value
+        st.session_state.proc_editor_version += 1
+
+    def _apply_grid_edits(self, editor_key, view_index):
+        """
+        on_change callback of the selector grid: copies the ticked/unticked rows
+        (positions within the filtered view) back into the procedure frame.
+        """
+        edited_rows = st.session_state[editor_key]["edited_rows"]
+        df = st.session_state.proc_df
+        for position, edit in edited_rows.items():
+            if "Convert" in edit:
+                df.at[view_index[int(position)], "SELECTED"] = bool(edit["Convert"])
+        # A fresh grid key means stale positional edits are never re-applied to a different view
+        st.session_state.proc_editor_version += 1
+
+    def _render_selector(self):
+        """
+        Renders one virtualized grid over the procedure frame instead of a checkbox
+        widget per procedure, plus filter and bulk-selection controls.
+        """
+        df = st.session_state.proc_df
+
+        # --- One global search box, answered from the prebuilt index ---
+        s1, s2 = st.columns([4, 1])
+        search = s1.text_input("🔎 Search all procedures", key="sel_search", placeholder="e.g., GET_CUSTOMER_DETAILS").strip()
+        mode = s2.selectbox("Match", SEARCH_MODES, index=SEARCH_MODES.index(SUBSTRING), key="sel_search_mode")
+        try:
+            matches = st.session_state.proc_search_index.search(search, mode)
+        except re.error as e:
+            st.warning(f"⚠️ Invalid regular expression: {e}")
+            matches = []
+
+        if matches is not None:
+            per_schema = (
+                df.iloc[matches].groupby(["DBNAME", "SCHEMA_NAME"]).size()
+                .reset_index(name="MATCHES").sort_values("MATCHES", ascending=False)
+            )
+            with st.expander(f"**{len(matches)}** match(es) in **{len(per_schema)}** schema(s)"):
+                st.dataframe(per_schema, use_container_width=True, hide_index=True)
+
+        f1, f2, f3 = st.columns([1, 1, 1])
+        db = f1.selectbox("Database", ["All"] + sorted(df["DBNAME"].unique()), key="sel_db")
+        schema_options = df["SCHEMA_NAME"] if db == "All" else df.loc[df["DBNAME"] == db, "SCHEMA_NAME"]
+        schema = f2.selectbox("Schema", ["All"] + sorted(schema_options.unique()), key="sel_schema")
+        show = f3.selectbox("Show", ["All", "Selected", "Not selected", "Changed"], key="sel_show")
+
+        view = self._filtered_view(db, schema, matches, show)
+        view_index = view.index.tolist()
+
+        # --- Bulk selection over the filtered rows ---
+        b1, b2, r1, r2, b3, b4 = st.columns([1, 1, 1, 1, 1, 1], vertical_alignment="bottom")
+        if b1.button("☑️ Select all filtered", use_container_width=True, disabled=view.empty):
+            self._set_selected(view_index, True); st.rerun()
+        if b2.button("⬜ Clear all filtered", use_container_width=True, disabled=view.empty):
+            self._set_selected(view_index, False); st.rerun()
+        max_row = max(len(view), 1)
+        # Stable keys keep the range across filter changes; stored values are clamped to the current view first
+        for key, default in (("sel_range_from", 1), ("sel_range_to", max_row)):
+            st.session_state[key] = min(max(st.session_state.get(key, default), 1), max_row)
+        range_from = r1.number_input("From row", min_value=1, max_value=max_row, key="sel_range_from")
+        range_to = r2.number_input("To row", min_value=1, max_value=max_row, key="sel_range_to")
+        range_index = view_index[min(range_from, range_to) - 1:max(range_from, range_to)]
+        if b3.button("☑️ Select range", use_container_width=True, disabled=not range_index):
+            self._set_selected(range_index, True); st.rerun()
+        if b4.button("⬜ Clear range", use_container_width=True, disabled=not range_index):
+            self._set_selected(range_index, False); st.rerun()
+
+        # --- The grid itself: only the visible rows are rendered by the browser ---
+        editor_key = f"proc_editor_{st.session_state.proc_editor_version}"
+        grid = pd.DataFrame({
+            "Convert": view["SELECTED"].to_numpy(),
+            "Database": view["DBNAME"].to_numpy(),
+            "Schema": view["SCHEMA_NAME"].to_numpy(),
+            "Procedure": view["PROCEDURE_NAME"].to_numpy(),
+            "Saved Flag": view["CONVERSION_FLAG"].to_numpy(),
+        })
+        grid.index = range(1, len(grid) + 1)
+        st.data_editor(
+            grid,
+            key=editor_key,
+            height=400,
+            use_container_width=True,
+            disabled=["Database", "Schema", "Procedure", "Saved Flag"],
+            column_config={
+                "Convert": st.column_config.CheckboxColumn("Convert", help="Pending selection; saved with 'Update Conversion Flags'."),
+                "Saved Flag": st.column_config.CheckboxColumn("Saved Flag", help="CONVERSION_FLAG currently stored in Snowflake."),
+            },
+            on_change=self._apply_grid_edits,
+            args=(editor_key, view_index),
+        )
+
+        changes = self._pending_changes()
+        to_flag = int(changes["SELECTED"].sum())
+        st.caption(
+            f"Showing {len(view)} of {len(df)} procedures · {int(df['SELECTED'].sum())} selected · "
+            f"**{len(changes)} unsaved change(s)** ({to_flag} to flag, {len(changes) - to_flag} to unflag)"
+        )
 
     def run_update_flag(self):
         """
@@ -76,7 +377,6 @@ class SelectProcedures:
         # Initialize all necessary session state variables
         if "flow_started" not in st.session_state: st.session_state.flow_started = False
         if "show_metadata_table" not in st.session_state: st.session_state.show_metadata_table = False
-        if "search_terms" not in st.session_state: st.session_state.search_terms = {}
 
         # --- 1. INITIAL STATE: Display a welcome and start button ---
         if not st.session_state.flow_started:
@@ -92,90 +392,44 @@ class SelectProcedures:
                 if st.button("▶️ **Start Flow**", help="Connect to Snowflake and load the procedure list"):
                     with st.spinner("Connecting to Snowflake and fetching procedures..."):
                         try:
-                            ctx = snowflake.connector.connect(**self.snowflake_config)
-                            st.session_state.sf_conn = ctx
-                            st.session_state.sf_cursor = ctx.cursor()
+                            # Leased for this load only; every later action leases its own session
+                            with snowflake_session(self.snowflake_config) as ctx:
+                                with ctx.cursor() as cs:
+                                    # Older deployments keep definitions in the catalog; split them out first
+                                    ensure_metadata_tables(cs, self.snowflake_config)
+                                fetch_sql = f"SELECT DBNAME, SCHEMA_NAME, PROCEDURE_NAME, CONVERSION_FLAG FROM {METADATA_TABLE} ORDER BY 1, 2, 3"
+                                rows = cached_read(
+                                    self.snowflake_config, METADATA_TABLE, "procedure_list",
+                                    lambda cs: tuple(cs.execute(fetch_sql).fetchall()), conn=ctx
+                                )
                         except Exception as e:
-                            st.error(f"❌ Snowflake connection failed: {e}"); st.stop()
-                        
-                        try:
-                            fetch_sql = f"SELECT DBNAME, SCHEMA_NAME, PROCEDURE_NAME, CONVERSION_FLAG FROM {METADATA_TABLE} ORDER BY 1, 2, 3"
-                            rows = st.session_state.sf_cursor.execute(fetch_sql).fetchall()
-                            if not rows:
-                                st.warning(f"⚠️ `{METADATA_TABLE}` is empty. Please run '1. Create Metadata Table' first."); st.stop()
-                            
-                            st.session_state.proc_map = {f"{db}.{sch}.{proc}": bool(flag) for db, sch, proc, flag in rows}
-
-
-                                                        # --- OPTIMIZATION: DO HEAVY WORK ONCE AND CACHE IT ---
-                            grouped = {}
-                            for full_name, _ in st.session_state.proc_map.items():
-                                db, schema, proc = full_name.split(".", 2)
-                                # Pre-process the data for faster searching later
-                                proc_data = {
-                                    'proc_name': proc,
-                                    'proc_lower': proc.lower(), # Pre-calculate lowercase
-                                    'full_name': full_name
-                                }
-                                grouped.setdefault((db, schema), []).append(proc_data)
-                            # Store the efficiently structured data in session state
-                            st.session_state.grouped_procs = grouped
+                            st.error(f"❌ Failed to fetch procedures: {e}"); st.stop()
+                        if not rows:
+                            st.warning(f"⚠️ `{METADATA_TABLE}` is empty. Please run '1. Create Metadata Table' first."); st.stop()
 
+                        try:
+                            # One compact frame drives the selector grid; SELECTED holds the
+                            # user's pending choice and CONVERSION_FLAG what Snowflake has
+                            df = pd.DataFrame(rows, columns=["DBNAME", "SCHEMA_NAME", "PROCEDURE_NAME", "CONVERSION_FLAG"])
+                            df["CONVERSION_FLAG"] = df["CONVERSION_FLAG"].fillna(False).astype(bool)
+                            df["SELECTED"] = df["CONVERSION_FLAG"]
+                            st.session_state.proc_df = df
+                            # Built once; every search afterwards is an index lookup
+                            st.session_state.proc_search_index = ProcedureSearchIndex(df["PROCEDURE_NAME"])
+                            st.session_state.proc_editor_version = 0
 
                             st.session_state.flow_started = True
                             st.rerun()
                         except Exception as e:
-                            st.error(f"❌ Failed to fetch procedures: {e}")
-                            st.session_state.sf_cursor.close(); st.session_state.sf_conn.close(); st.stop()
+                            st.error(f"❌ Failed to load procedures: {e}"); st.stop()
             st.stop()
 
         # --- 2. ACTIVE STATE: Display selectors and action buttons ---
-        proc_map = st.session_state.proc_map
-        
         with st.container(border=True):
             st.subheader("🎯 Select Procedures for Conversion")
-            st.caption("Check the box next to each procedure you want to convert. This sets its `CONVERSION_FLAG` to `TRUE` in the metadata table.")
-
-            
-            # grouped = {}
-            # for full_name, _ in proc_map.items():
-            #     db, schema, proc = full_name.split(".", 2)
-            #     grouped.setdefault((db, schema), []).append((proc, full_name))
-            
-            
-            # for (db, schema), items in sorted(grouped.items()):
-            for (db, schema), items in sorted(st.session_state.grouped_procs.items()):
-                expander_key = f"{db}.{schema}"
-                with st.expander(f"**Database:** `{db}` → **Schema:** `{schema}` ({len(items)} procedures)"):
-                                       # --- NEW: In-expander search bar ---
-
-                    search_term = st.text_input(
-                        "🔎 Filter procedures in this schema",
-                        key=f"search_{expander_key}",
-                        placeholder="e.g., GET_CUSTOMER_DETAILS",
-                        on_change=lambda: None # This empty callback triggers a rerun on every keystroke
-                    ).lower()
-                    
-                                        # Perform a very fast search on the pre-calculated lowercase names
-                    filtered_items = [
-                        item for item in items 
-                        if search_term in item['proc_lower']
-                    ]
-
-                    # filtered_items = [(p, fn) for p, fn in items if search_term in p.lower()]
-                    if not filtered_items: st.info("No procedures match your filter.")
-                    else:
-                        # Create a scrollable container for the list of checkboxes
-                        with st.container(height=300):
-                            for item in sorted(filtered_items, key=lambda x: x['proc_name']):
-                                st.checkbox(
-                                    label=item['proc_name'], 
-                                    key=f"chk_{item['full_name']}", 
-                                    value=proc_map[item['full_name']]
-                                )
-
-                    
-                    
+            st.caption("Tick the **Convert** box of each procedure you want to convert. Saving sets its `CONVERSION_FLAG` to `TRUE` in the metadata table.")
+            self._render_selector()
+            self._render_bulk_flagging()
 
         # --- MODIFIED: A guided, step-by-step action container ---
         with st.container(border=True):
@@ -191,25 +445,18 @@ class SelectProcedures:
             # st.caption("First, save any checkbox changes you made above. This action updates the `CONVERSION_FLAG` in the Snowflake database.")
             
             if st.button("📝 **Update Conversion Flags**", use_container_width=True, help="Saves your checkbox selections to the database."):
-                to_update = []
-                for full_name, orig_flag in proc_map.items():
-                    new_flag = st.session_state[f"chk_{full_name}"]
-                    if new_flag != orig_flag:
-                        db, schema, proc = full_name.split(".", 2); to_update.append((new_flag, db, schema, proc))
+                changes = self._pending_changes()
                 
-                if not to_update:
+                if changes.empty:
                     st.info("🔎 No changes detected. Nothing to update.")
                 else:
                     with st.spinner("⏳ Saving changes to Snowflake..."):
                         try:
-                            update_sql = f"UPDATE {METADATA_TABLE} SET CONVERSION_FLAG = %s WHERE DBNAME = %s AND SCHEMA_NAME = %s AND PROCEDURE_NAME = %s"
-                            st.session_state.sf_cursor.executemany(update_sql, to_update)
-                            st.session_state.sf_conn.commit()
-                            for new_flag, db, schema, proc in to_update:
-                                st.session_state.proc_map[f"{db}.{schema}.{proc}"] = new_flag
-                            st.success(f"✅ **Flags Updated!** {len(to_update)} procedure(s) were changed. You can now proceed to Step 2.")
+                            # Only the diff is sent, as one temp-table upload and one joined UPDATE
+                            self.flag_keys(changes.index, changes["SELECTED"].to_numpy())
+                            st.success(f"✅ **Flags Updated!** {len(changes)} procedure(s) were changed. You can now proceed to Step 2.")
                         except Exception as e:
-                            st.error(f"❌ Error during update: {e}"); st.session_state.sf_conn.rollback()
+                            st.error(f"❌ Error during update: {e}")
 
             st.markdown("---") # Visual separator between steps
 
@@ -234,38 +481,11 @@ class SelectProcedures:
                     st.session_state.show_metadata_table = not st.session_state.get("show_metadata_table", False) 
 
             with col4:
-                if st.button("🔒 **Close Connection & Restart**", use_container_width=True, help="Disconnect from Snowflake and reset this component."):
-                    try:
-                        st.session_state.sf_cursor.close(); st.session_state.sf_conn.close()
-                    except Exception: pass
-                    keys_to_delete = [k for k in st.session_state.keys() if k.startswith(("chk_", "flow_", "proc_", "sf_", "show_"))]
+                if st.button("🔒 **Close Connection & Restart**", use_container_width=True, help="Reset this component and reload the procedure list."):
+                    keys_to_delete = [k for k in st.session_state.keys() if k.startswith(("sel_", "flow_", "proc_", "sf_", "show_"))]
                     for key in keys_to_delete: del st.session_state[key]
                     st.rerun()
 
             if st.session_state.get("show_metadata_table", False):
                 with st.spinner("Fetching latest metadata from Snowflake..."):
-                    try:
-                        df = pd.read_sql(f"SELECT * FROM {METADATA_TABLE} ORDER BY DBNAME, SCHEMA_NAME, PROCEDURE_NAME", st.session_state.sf_conn)
-                        st.dataframe(
-                            df,
-                            use_container_width=True,
-                            column_config={
-                                "CONVERSION_FLAG": st.column_config.TextColumn(
-                                    "Conversion Flag",
-                                    help="Set to `True` to mark this procedure for migration."
-                                ),
-                                "IS_DEPLOYED": st.column_config.TextColumn(
-                                    "Is Deployed?",
-                                    help="Indicates if the converted procedure has been deployed in Snowflake."
-                                )
-                                # Add any other boolean columns here if needed
-                            },
-                            hide_index=True # Hides the pandas index for a cleaner look
-                        )
-
-                        # st.dataframe(df, use_container_width=True)
-                    except Exception as e:
-                        st.error(f"❌ Failed to fetch data: {e}")
-
-
-
+                    MetadataViewer(None, key_prefix="update_flag", config=self.snowflake_config).render()